@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+bench_split.py
+Per-row ffmpeg cuts (N source re-opens) vs the single-pass ffmpeg-segment engine
+on a synthetic long video.
+
+  python benchmarks/bench_split.py --seconds 1800 --scene-len 4 --jobs 1
+"""
+import argparse, shutil, time
+from pathlib import Path
+
+from dataprep.core import split_with_ffmpeg, split_with_ffmpeg_segment
+from synth import make_video, make_scene_csv
+
+p = argparse.ArgumentParser(description="Benchmark ffmpeg split engines.")
+p.add_argument("--workdir", default="data/bench")
+p.add_argument("--seconds", type=float, default=600)
+p.add_argument("--scene-len", type=float, default=4)
+p.add_argument("--size", default="640x360")
+p.add_argument("--jobs", type=int, default=1, help="per-row engine workers")
+p.add_argument("--reencode", action="store_true")
+a = p.parse_args()
+
+work = Path(a.workdir)
+src = work / f"synth-{int(a.seconds)}s-{a.size}.mkv"
+cuts = make_video(src, a.seconds, a.scene_len, a.size)
+csv_path = make_scene_csv(work / f"{src.stem}-Scenes.csv", cuts, a.seconds)
+copy = not a.reencode
+
+engines = {
+    "ffmpeg": lambda out: split_with_ffmpeg(src, csv_path, out, copy=copy, jobs=a.jobs),
+    "ffmpeg-segment": lambda out: split_with_ffmpeg_segment(src, csv_path, out, copy=copy),
+}
+for name, run in engines.items():
+    out = work / f"clips-{name}"
+    shutil.rmtree(out, ignore_errors=True)
+    t = time.perf_counter()
+    results = run(out)
+    dt = time.perf_counter() - t
+    ok = sum(r.ok for r in results)
+    print(f"{name:15s} {dt:8.2f}s  {ok}/{len(results)} clips  {ok / dt:8.1f} clips/s")
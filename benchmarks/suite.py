@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+suite.py
+End-to-end benchmark of the hot paths on deterministic synthetic fixtures
+(see synth.py): scene detection backends, mkvmerge / ffmpeg copy / ffmpeg
+re-encode / smart cut / segment splitting, stage_review, metadata building and
+batched probing (container headers vs one ffprobe per file).
+
+For every fixture × case it records wall time, clips/s, MB/s (source bytes
+for detect/split, clip bytes for review/metadata), CPU of the external tools
+and accuracy against the ground truth (cut precision/recall for detectors,
+clip count and duration error for splitters), and writes everything to one
+JSON file. `--compare` prints the speedup against an earlier result file.
+
+  PYTHONPATH=src:benchmarks python benchmarks/suite.py --seconds 60 300 --sizes 640x360 1280x720
+  PYTHONPATH=src:benchmarks python benchmarks/suite.py --cases split-ffmpeg-copy split-ffmpeg-segment \\
+      --compare data/bench/results/bench-20250101-120000.json
+
+Cases whose tool is missing (e.g. mkvmerge, scenedetect) are reported as skipped.
+"""
+from __future__ import annotations
+import argparse, json, os, platform, shutil, subprocess, sys, time
+from pathlib import Path
+from typing import Callable
+
+from dataprep import instrument
+from dataprep.config import load_scenedetect_config
+from dataprep.core import (
+    detect_scenes,
+    split_with_ffmpeg, split_with_ffmpeg_segment, split_with_mkvmerge, stage_review,
+)
+from dataprep.metadata import build_metadata
+from dataprep.probe import ProbeCache, ProbeTable, probe_files, probe_many
+from dataprep.procs import tool_version
+from dataprep.scenes import load_scene_table
+from synth import make_video, make_scene_csv, bench_config, cuts_from_csv, cut_agreement
+
+FPS = 25
+
+# ------------------------------------------------------------
+# Accuracy
+# ------------------------------------------------------------
+
+def split_accuracy(clips: list[Path], csv_path: Path, cache: ProbeCache) -> dict:
+    """Clip count and |duration - scene length| against the ground-truth CSV."""
+    want = load_scene_table(csv_path).length.tolist()
+    got = [d if d == d else 0.0 for d in cache.probe_many(clips).duration.tolist()]
+    errs = [abs(g - w) for g, w in zip(got, want)]
+    return {
+        "clips": len(got),
+        "expected": len(want),
+        "mean_abs_err_s": round(sum(errs) / len(errs), 4) if errs else None,
+        "max_abs_err_s": round(max(errs), 4) if errs else None,
+    }
+
+def _clips(outdir: Path) -> list[Path]:
+    return sorted([*outdir.glob("*.mkv"), *outdir.glob("*.mp4")])
+
+def _mb(paths: list[Path]) -> float:
+    return sum(p.stat().st_size for p in paths) / 2**20
+
+# ------------------------------------------------------------
+# Cases
+# ------------------------------------------------------------
+
+class Fixture:
+    """One synthetic source plus its ground truth; split outputs are kept for review/metadata."""
+
+    def __init__(self, work: Path, seconds: float, size: str, scene_len: float, gop: int | None):
+        self.name = f"{int(seconds)}s-{size}-scene{scene_len:g}-gop{gop or 2 * FPS}"
+        self.work = work / self.name
+        self.src = self.work / "src.mkv"
+        self.truth = make_video(self.src, seconds, scene_len, size, FPS, gop)
+        self.csv = make_scene_csv(self.work / "truth-Scenes.csv", self.truth, seconds, FPS)
+        self.cfg = bench_config(load_scenedetect_config(), scene_len, FPS)
+        self.frames = int(round(seconds * FPS))
+
+    def out(self, case: str) -> Path:
+        path = self.work / case
+        shutil.rmtree(path, ignore_errors=True)
+        return path
+
+def _detect(fx: Fixture, case: str, run: Callable[[Path], Path]) -> dict:
+    t = time.perf_counter()
+    csv_path = run(fx.out(case))
+    dt = time.perf_counter() - t
+    found = cuts_from_csv(csv_path)
+    return {"wall_s": dt, "items": len(found) + 1, "mb": _mb([fx.src]),
+            "frames_per_s": fx.frames / dt, "accuracy": cut_agreement(found, fx.truth)}
+
+def _split(fx: Fixture, case: str, run: Callable[[Path], object]) -> dict:
+    out = fx.out(case)
+    t = time.perf_counter()
+    res = run(out)
+    dt = time.perf_counter() - t
+    failed = [r for r in res or [] if not r.ok]
+    clips = _clips(out)
+    with ProbeCache(fx.work / "accuracy-probe.sqlite") as cache:
+        acc = split_accuracy(clips, fx.csv, cache)
+    acc["failed"] = len(failed)
+    return {"wall_s": dt, "items": len(clips), "mb": _mb([fx.src]), "accuracy": acc}
+
+def _clips_for(fx: Fixture) -> Path:
+    """Clips to review/probe: the copy split if it ran, else cut them now."""
+    clips = fx.work / "split-ffmpeg-copy"
+    if not _clips(clips):
+        split_with_ffmpeg(fx.src, fx.csv, fx.out("split-ffmpeg-copy"), copy=True)
+    return clips
+
+def _review(fx: Fixture, case: str, jobs: int | None) -> dict:
+    clips_dir = _clips_for(fx)
+    db = fx.work / f"{case}.sqlite"
+    db.unlink(missing_ok=True)  # cold cache: every clip is probed
+    clips = _clips(clips_dir)
+    t = time.perf_counter()
+    with ProbeCache(db) as cache:
+        stage_review(clips_dir, fx.out(case), cache)
+    dt = time.perf_counter() - t
+    return {"wall_s": dt, "items": len(clips), "mb": _mb(clips)}
+
+def _metadata(fx: Fixture, case: str, jobs: int | None) -> dict:
+    clips_dir = _clips_for(fx)
+    db = fx.work / f"{case}.sqlite"
+    db.unlink(missing_ok=True)
+    clips = _clips(clips_dir)
+    out = fx.out(case)
+    t = time.perf_counter()
+    with ProbeCache(db) as cache:
+        rep = build_metadata(clips_dir, out / "clips.csv", jobs=jobs, cache=cache, resume=False)
+    dt = time.perf_counter() - t
+    return {"wall_s": dt, "items": rep.written, "mb": _mb(clips),
+            "accuracy": {"rows": rep.written, "failed": len(rep.failed)}}
+
+PROBE_REPEAT = 20  # the split clips are probed this many times over, for a corpus worth timing
+
+def _probe(fx: Fixture, case: str, jobs: int | None) -> dict:
+    """Cold probe_many() (container headers) against one ffprobe per file, on the same list."""
+    clips = _clips(_clips_for(fx)) * PROBE_REPEAT
+    t = time.perf_counter()
+    ref = probe_files(clips, headers=False)
+    per_file = time.perf_counter() - t
+    t = time.perf_counter()
+    table = probe_many(clips, jobs=jobs)
+    dt = time.perf_counter() - t
+    base = ProbeTable.from_infos(clips, *zip(*ref))
+    off = ((abs(table.duration - base.duration) > 0.05) | (table.width != base.width)
+           | (table.height != base.height) | (abs(table.fps - base.fps) > 0.01))
+    return {"wall_s": dt, "items": len(clips), "mb": _mb(clips),
+            "accuracy": {"ffprobe_per_file_s": round(per_file, 3), "speedup": round(per_file / dt, 1),
+                         "from_headers": table.source.count("header"), "mismatches": int(off.sum())}}
+
+def cases(jobs: int | None) -> dict[str, Callable[[Fixture, str], dict]]:
+    from dataprep.detect import detect_scenes_inprocess
+    from dataprep.framediff import detect_scenes_numpy
+    from dataprep.keyframes import split_with_ffmpeg_smart
+    return {
+        "detect-cli": lambda fx, c: _detect(fx, c, lambda o: detect_scenes(fx.src, o, "content")),
+        "detect-inprocess": lambda fx, c: _detect(
+            fx, c, lambda o: detect_scenes_inprocess(fx.src, o, "content", cfg=fx.cfg, jobs=jobs)),
+        "detect-numpy": lambda fx, c: _detect(
+            fx, c, lambda o: detect_scenes_numpy(fx.src, o, "content", cfg=fx.cfg)),
+        "split-mkvmerge": lambda fx, c: _split(fx, c, lambda o: split_with_mkvmerge(fx.src, fx.csv, o)),
+        "split-ffmpeg-copy": lambda fx, c: _split(
+            fx, c, lambda o: split_with_ffmpeg(fx.src, fx.csv, o, copy=True, jobs=jobs)),
+        "split-ffmpeg-reencode": lambda fx, c: _split(
+            fx, c, lambda o: split_with_ffmpeg(fx.src, fx.csv, o, copy=False, jobs=jobs)),
+        "split-ffmpeg-smart": lambda fx, c: _split(
+            fx, c, lambda o: split_with_ffmpeg_smart(fx.src, fx.csv, o, jobs=jobs)),
+        "split-ffmpeg-segment": lambda fx, c: _split(
+            fx, c, lambda o: split_with_ffmpeg_segment(fx.src, fx.csv, o, copy=True)),
+        "review": lambda fx, c: _review(fx, c, jobs),
+        "metadata": lambda fx, c: _metadata(fx, c, jobs),
+        "probe": lambda fx, c: _probe(fx, c, jobs),
+    }
+
+# ------------------------------------------------------------
+# Runner
+# ------------------------------------------------------------
+
+def environment() -> dict:
+    env = {"python": sys.version.split()[0], "platform": platform.platform(),
+           "cpus": os.cpu_count()}
+    try:
+        env["ffmpeg"] = tool_version("ffmpeg")
+        env["git"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                    text=True).stdout.strip() or None
+    except (OSError, RuntimeError, IndexError):
+        pass
+    return env
+
+def run_case(fn: Callable[[Fixture, str], dict], fx: Fixture, case: str) -> dict:
+    instrument.recorder.clear()
+    try:
+        r = fn(fx, case)
+    except RuntimeError as e:
+        if "not found in PATH" in str(e):
+            return {"skipped": str(e)}
+        return {"error": str(e)}
+    tools = [g for g in instrument.recorder.summary() if g["kind"] == "tool"]
+    r["clips_per_s"] = r["items"] / r["wall_s"] if r["wall_s"] else None
+    r["mb_per_s"] = r["mb"] / r["wall_s"] if r["wall_s"] else None
+    r["tool_calls"] = sum(g["calls"] for g in tools)
+    r["tool_cpu_s"] = sum(g["cpu_s"] for g in tools)
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in r.items()}
+
+def compare(results: list[dict], prev_path: Path) -> None:
+    with prev_path.open(encoding="utf-8") as f:
+        prev = {(r["fixture"], r["case"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {prev_path}:")
+    for r in results:
+        old = prev.get((r["fixture"], r["case"]))
+        if old and old.get("wall_s") and r.get("wall_s"):
+            print(f"  {r['fixture']:28s} {r['case']:22s} {old['wall_s']:8.2f}s → {r['wall_s']:8.2f}s"
+                  f"  ×{old['wall_s'] / r['wall_s']:.2f}")
+
+def main():
+    all_cases = list(cases(None))
+    p = argparse.ArgumentParser(description="Benchmark detect/split/review/metadata on synthetic video.")
+    p.add_argument("--workdir", default="data/bench/suite")
+    p.add_argument("--seconds", type=float, nargs="+", default=[60])
+    p.add_argument("--sizes", nargs="+", default=["640x360"])
+    p.add_argument("--scene-len", type=float, default=4)
+    p.add_argument("--gop", type=int, help="keyframe interval in frames (default 2 s)")
+    p.add_argument("--jobs", type=int, help="workers for split/detect/metadata (default: per engine)")
+    p.add_argument("--cases", nargs="+", choices=all_cases, default=all_cases)
+    p.add_argument("--out", help="results JSON (default: data/bench/results/bench-<time>.json)")
+    p.add_argument("--compare", help="earlier results JSON to compare wall times against")
+    a = p.parse_args()
+
+    work = Path(a.workdir)
+    table = cases(a.jobs)
+    results = []
+    for seconds in a.seconds:
+        for size in a.sizes:
+            fx = Fixture(work, seconds, size, a.scene_len, a.gop)
+            for case in a.cases:
+                r = {"fixture": fx.name, "case": case, **run_case(table[case], fx, case)}
+                results.append(r)
+                if "wall_s" in r:
+                    acc = r.get("accuracy", "")
+                    print(f"{fx.name:28s} {case:22s} {r['wall_s']:8.2f}s {r['clips_per_s']:8.1f} clips/s "
+                          f"{r['mb_per_s']:8.1f} MB/s  {acc}")
+                else:
+                    print(f"{fx.name:28s} {case:22s} {r.get('skipped') or 'ERROR: ' + r['error']}")
+
+    out = Path(a.out) if a.out else Path("data/bench/results") / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(),
+                   "args": vars(a), "results": results}, f, indent=1)
+    print(f"Results: {out}")
+    if a.compare:
+        compare(results, Path(a.compare))
+
+if __name__ == "__main__":  # ProcessPoolExecutor workers re-import this module
+    main()
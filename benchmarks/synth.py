@@ -0,0 +1,79 @@
+"""
+synth.py
+Deterministic synthetic test videos with known scene boundaries.
+
+Each scene is `testsrc2` with its hue rotated by a fixed step, so every
+boundary is a hard content cut at a known frame. Needs ffmpeg on PATH.
+"""
+from __future__ import annotations
+import subprocess
+from pathlib import Path
+
+from dataprep.core import _which, write_scene_csv
+
+def make_video(
+    path: Path,
+    seconds: float,
+    scene_len: float,
+    size: str = "640x360",
+    fps: int = 25,
+    gop: int | None = None,
+    audio: bool = True,
+) -> list[int]:
+    """
+    Render `path` (reused if it already exists) and return the ground-truth
+    cut frames: the first frame of every scene after the first one.
+    """
+    frames_per_scene = int(round(scene_len * fps))
+    total = int(round(seconds * fps))
+    cuts = list(range(frames_per_scene, total, frames_per_scene))
+    if path.exists():
+        return cuts
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    vf = (f"testsrc2=size={size}:rate={fps},"
+          f"hue=h=mod(floor(n/{frames_per_scene})*137\\,360)")
+    cmd = [_which("ffmpeg"), "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "lavfi", "-i", vf]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"]
+    cmd += ["-t", f"{seconds}", "-c:v", "libx264", "-preset", "ultrafast",
+            "-pix_fmt", "yuv420p", "-g", str(gop or 2 * fps)]
+    if audio:
+        cmd += ["-c:a", "aac", "-b:a", "96k"]
+    tmp = path.with_name(f"{path.stem}.part{path.suffix}")
+    subprocess.run([*cmd, str(tmp)], check=True)
+    tmp.replace(path)
+    return cuts
+
+def make_scene_csv(path: Path, cuts: list[int], seconds: float, fps: int = 25) -> Path:
+    """Ground-truth scene CSV for a video made by make_video()."""
+    return write_scene_csv(path, cuts, int(round(seconds * fps)), fps)
+
+def bench_config(cfg: dict, scene_len: float, fps: int = 25) -> dict:
+    """Detector config with min_scene_len lowered below the synthetic scene length."""
+    min_len = int(scene_len * fps * 0.5)
+    for sec in ("detect_content", "detect_adaptive"):
+        if sec in cfg:
+            cfg[sec]["min_scene_len"] = min(cfg[sec].get("min_scene_len", 15), min_len)
+    return cfg
+
+def cuts_from_csv(csv_path: Path) -> list[int]:
+    """Cut frames (0-based first frame of scenes 2..n) from a PySceneDetect CSV."""
+    from dataprep.scenes import load_scene_table
+    return load_scene_table(csv_path).start_frame[1:].tolist()
+
+def cut_agreement(found: list[int], truth: list[int], tol: int = 2) -> dict:
+    """Greedy one-to-one match within ±tol frames → precision / recall / f1."""
+    unmatched = sorted(truth)
+    hits = 0
+    for c in sorted(found):
+        for j, t in enumerate(unmatched):
+            if abs(c - t) <= tol:
+                hits += 1
+                del unmatched[j]
+                break
+    precision = hits / len(found) if found else 1.0
+    recall = hits / len(truth) if truth else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
@@ -2,11 +2,26 @@
 import argparse
 from pathlib import Path
 from dataprep.core import detect_scenes
-p = argparse.ArgumentParser(description="Run PySceneDetect and save CSV.")
-p.add_argument("--input", required=True)
-p.add_argument("--outdir")
-p.add_argument("--mode", choices=["adaptive","content"], default="adaptive")
-p.add_argument("--threshold", type=int)
-a = p.parse_args()
-out = detect_scenes(Path(a.input), Path(a.outdir) if a.outdir else None, a.mode, a.threshold)
-print(f"CSV in: {out}")
+from dataprep.config import load_scenedetect_config
+from dataprep.detect import detect_scenes_inprocess
+from dataprep.framediff import detect_scenes_numpy
+if __name__ == "__main__":  # guard: the inprocess backend spawns worker processes
+    p = argparse.ArgumentParser(description="Run PySceneDetect and save CSV.")
+    p.add_argument("--input", required=True)
+    p.add_argument("--outdir")
+    p.add_argument("--mode", choices=["adaptive","content"], default="adaptive")
+    p.add_argument("--threshold", type=int)
+    p.add_argument("--backend", choices=["cli","inprocess","numpy"], default="cli")
+    p.add_argument("--config", default="configs/scenedetect.yaml")
+    p.add_argument("--jobs", type=int)
+    p.add_argument("--metric", choices=["hsv","luma","hist"])
+    a = p.parse_args()
+    if a.backend == "inprocess":
+        out = detect_scenes_inprocess(Path(a.input), Path(a.outdir) if a.outdir else None, a.mode,
+                                      a.threshold, load_scenedetect_config(Path(a.config)), a.jobs)
+    elif a.backend == "numpy":
+        out = detect_scenes_numpy(Path(a.input), Path(a.outdir) if a.outdir else None, a.mode,
+                                  a.threshold, load_scenedetect_config(Path(a.config)), a.metric)
+    else:
+        out = detect_scenes(Path(a.input), Path(a.outdir) if a.outdir else None, a.mode, a.threshold)
+    print(f"CSV in: {out}")
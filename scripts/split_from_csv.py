@@ -1,15 +1,27 @@
 #!/usr/bin/env python3
 import argparse
 from pathlib import Path
-from dataprep.core import split_with_mkvmerge, split_with_ffmpeg
+from dataprep.core import split_with_mkvmerge, split_with_ffmpeg, split_with_ffmpeg_segment
+from dataprep.keyframes import DEFAULT_SNAP, split_with_ffmpeg_smart
 p = argparse.ArgumentParser(description="Split by PySceneDetect CSV.")
 p.add_argument("--input", required=True)
 p.add_argument("--csv", required=True)
 p.add_argument("--outdir", required=True)
-p.add_argument("--engine", choices=["mkvmerge","ffmpeg"], default="mkvmerge")
+p.add_argument("--engine", choices=["mkvmerge","ffmpeg","ffmpeg-smart","ffmpeg-segment"], default="mkvmerge")
 p.add_argument("--copy", action="store_true")
+p.add_argument("--jobs", type=int, help="ffmpeg: clips cut in parallel")
+p.add_argument("--snap", type=float, default=DEFAULT_SNAP, help="ffmpeg-smart: keyframe snap tolerance (s)")
 a = p.parse_args()
 if a.engine == "mkvmerge":
     split_with_mkvmerge(Path(a.input), Path(a.csv), Path(a.outdir))
 else:
-    split_with_ffmpeg(Path(a.input), Path(a.csv), Path(a.outdir), copy=a.copy)
+    if a.engine == "ffmpeg-segment":
+        results = split_with_ffmpeg_segment(Path(a.input), Path(a.csv), Path(a.outdir), copy=a.copy)
+    elif a.engine == "ffmpeg-smart":
+        results = split_with_ffmpeg_smart(Path(a.input), Path(a.csv), Path(a.outdir), a.snap, a.jobs)
+    else:
+        results = split_with_ffmpeg(Path(a.input), Path(a.csv), Path(a.outdir), copy=a.copy, jobs=a.jobs)
+    failed = [r for r in results if not r.ok]
+    for r in failed:
+        print(f"[FAIL] {r.out.name} ({r.start}-{r.end}): {r.error}")
+    raise SystemExit(1 if failed else 0)
@@ -1,38 +1,130 @@
+from dataclasses import replace
 from pathlib import Path
 import typer
 from typing import Optional
+from tqdm import tqdm
 from dataprep.core import (
     find_latest_mkv, detect_scenes,
-    split_with_mkvmerge, split_with_ffmpeg,
+    default_jobs, split_with_mkvmerge, split_with_ffmpeg, split_with_ffmpeg_segment,
     stage_review
 )
+from dataprep.probe import ProbeCache, DEFAULT_CACHE
+from dataprep.metadata import build_metadata, require_parquet
+from dataprep.config import DEFAULT_SCENEDETECT_CFG, load_scenedetect_config
+from dataprep.detect import detect_scenes_inprocess
+from dataprep.framediff import detect_scenes_numpy
+from dataprep.keyframes import DEFAULT_SNAP, split_with_ffmpeg_smart
+from dataprep.fingerprint import DEFAULT_INDEX, DEFAULT_MAX_DIST, fingerprint_clips
+from dataprep.normalize import NormalizeSettings, plan_clips
+from dataprep.profiles import EncodeProfile, EncodeSettings, detect_bars, encode_plan, wants_bars
+from dataprep.quality import QualityThresholds
+from dataprep.preview import DEFAULT_PREVIEW_JOBS, build_previews, write_review_index
+from dataprep.decisions import apply_decisions, load_decisions, stage_sample
+from dataprep.pack import DEFAULT_PACK_JOBS, DEFAULT_SHARD_MB, DEFAULT_SHARDS, pack_kept
+from dataprep.tensors import DEFAULT_FPS, DEFAULT_FRAMES, DEFAULT_SIZE, DEFAULT_TENSORS, TensorSpec, export_tensors
+from dataprep.pipeline import RunSettings, run_pipeline, DEFAULT_STATE
+from dataprep.batch import run_batch
+from dataprep.ingest import DEFAULT_POLL, DEFAULT_SETTLE, SOURCE_JOB, IngestDaemon
+from dataprep.jobqueue import DEFAULT_QUEUE, JobQueue
+from dataprep import farm as farm_mod
+from dataprep.instrument import recorder
+from dataprep import framecache, procs
 
 app = typer.Typer(help="WAN 2.1 LoRA data-prep (Scenes → Split → Review)")
 
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(False, help="Print a per-tool / per-stage resource summary when done"),
+    report: Optional[str] = typer.Option(None, help="Write the run report (every tool call and stage) to .json or .csv"),
+    max_procs: Optional[str] = typer.Option(None, help="Processes at once per tool across all stages, e.g. ffmpeg=4,ffprobe=16 (also WAN21_DP_PROCS)"),
+    tool_timeout: Optional[str] = typer.Option(None, help="Seconds before a tool call is killed, e.g. ffmpeg=3600 (also WAN21_DP_TIMEOUTS)"),
+    frame_cache_mb: Optional[float] = typer.Option(None, help=f"Disk budget of the decoded-frame cache, 0 = off (default {framecache.DEFAULT_BUDGET_MB}; also WAN21_DP_FRAME_CACHE_MB)"),
+):
+    """Options shared by every command."""
+    try:
+        procs.configure(procs.parse_spec(max_procs, "--max-procs"), procs.parse_spec(tool_timeout, "--tool-timeout"))
+        if frame_cache_mb is not None:
+            framecache.configure(frame_cache_mb)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    procs.install_signal_handler()
+    def _finish():
+        if report:
+            typer.echo(f"Run report: {recorder.write_report(Path(report))}", err=True)
+        if profile:
+            recorder.print_summary()
+    ctx.call_on_close(_finish)
+
 @app.command()
 def scenes(
     inp: Optional[str] = typer.Option(None, help="Input MKV path"),
     outdir: Optional[str] = typer.Option(None, help="Output dir for scene CSV"),
     mode: str = typer.Option("adaptive", help="adaptive|content"),
     threshold: Optional[int] = typer.Option(None, help="content threshold"),
-    auto_latest: bool = typer.Option(False, help="Use newest MKV under data/sources/")
+    auto_latest: bool = typer.Option(False, help="Use newest MKV under data/sources/"),
+    backend: str = typer.Option("cli", help="cli (scenedetect CLI) | inprocess (downscaled, chunked, parallel) | numpy (ffmpeg pipe + vectorized detector)"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="inprocess/numpy: detector config"),
+    jobs: Optional[int] = typer.Option(None, help="inprocess: parallel chunk workers (default: CPUs)"),
+    metric: Optional[str] = typer.Option(None, help="numpy: hsv|luma|hist (default: hsv, luma if luma_only)"),
+    probe_cache: str = typer.Option(str(DEFAULT_CACHE), help="numpy: ffprobe cache (SQLite)"),
 ):
     """Generate scene CSV using PySceneDetect."""
     mkv = Path(inp) if inp else (find_latest_mkv() if auto_latest else None)
     if mkv is None:
         raise typer.Exit("Provide --inp or use --auto-latest.")
-    detect_scenes(mkv, Path(outdir) if outdir else None, mode, threshold)
+    if backend == "inprocess":
+        cfg = load_scenedetect_config(Path(config))
+        out = detect_scenes_inprocess(mkv, Path(outdir) if outdir else None, mode, threshold, cfg, jobs)
+    elif backend == "numpy":
+        cfg = load_scenedetect_config(Path(config))
+        with ProbeCache(Path(probe_cache)) as cache:
+            out = detect_scenes_numpy(mkv, Path(outdir) if outdir else None, mode, threshold, cfg, metric, cache=cache)
+    else:
+        out = detect_scenes(mkv, Path(outdir) if outdir else None, mode, threshold)
+    typer.echo(f"CSV in: {out}")
+
+@app.command()
+def plan(
+    csv_path: str = typer.Option(..., help="PySceneDetect CSV path"),
+    out: Optional[str] = typer.Option(None, help="Clip CSV (default: <movie>-Clips.csv next to the scene CSV)"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Config holding the `normalize:` section (and trim_seconds / min_scene_len / max_scene_seconds)"),
+    min_seconds: Optional[float] = typer.Option(None, help="Drop scenes shorter than this"),
+    window_seconds: Optional[float] = typer.Option(None, help="Tile longer scenes into windows this long"),
+    window_frames: Optional[int] = typer.Option(None, help="Window length in frames (overrides --window-seconds)"),
+    stride_seconds: Optional[float] = typer.Option(None, help="Window start spacing (< window = overlap)"),
+):
+    """Plan training-length clips from a scene CSV; pass the result to `split --csv-path`."""
+    cfg = load_scenedetect_config(Path(config))
+    ns = NormalizeSettings.from_config(cfg, min_seconds=min_seconds, window_seconds=window_seconds,
+                                       window_frames=window_frames, stride_seconds=stride_seconds)
+    rep = plan_clips(Path(csv_path), ns, Path(out) if out else None, cfg)
+    typer.echo(f"{rep.scenes} scenes → {rep.clips} clips ({rep.dropped} too short, "
+               f"{rep.clip_seconds:.0f}s of {rep.scene_seconds:.0f}s kept)")
+    typer.echo(f"Wrote: {rep.csv}")
+    resample = ns.encode_args()
+    if resample:
+        typer.echo(f"Resampling is set: split with --engine ffmpeg --fps/--size ({' '.join(resample)})")
 
 @app.command()
 def split(
     inp: Optional[str] = typer.Option(None, help="Input MKV path"),
     csv_path: Optional[str] = typer.Option(None, help="PySceneDetect CSV path"),
     outdir: str = typer.Option(..., help="Output directory for clips"),
-    engine: str = typer.Option("mkvmerge", help="mkvmerge|ffmpeg"),
+    engine: str = typer.Option("mkvmerge", help="mkvmerge|ffmpeg|ffmpeg-smart|ffmpeg-segment"),
     copy: bool = typer.Option(True, help="ffmpeg: try -c copy"),
+    jobs: Optional[int] = typer.Option(None, help="ffmpeg: clips cut in parallel (default: CPUs for copy, CPUs/4 for re-encode)"),
+    snap: float = typer.Option(DEFAULT_SNAP, help="ffmpeg-smart: seconds a boundary may move to land on a keyframe"),
+    fps: Optional[float] = typer.Option(None, help="ffmpeg: resample to this frame rate (re-encodes)"),
+    size: Optional[str] = typer.Option(None, help="ffmpeg: scale to cover WxH and center-crop (re-encodes)"),
+    encode: Optional[str] = typer.Option(None, help="ffmpeg: re-encode with this profile (config `encode: profiles:`)"),
+    archive: Optional[str] = typer.Option(None, help="ffmpeg: also write every clip with this profile into --archive-dir, from the same decode"),
+    archive_dir: Optional[str] = typer.Option(None, help="--archive: output folder (default data/archive/<outdir name>)"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Config holding the `encode:` profiles"),
+    probe_cache: str = typer.Option(str(DEFAULT_CACHE), help="ffmpeg-smart: ffprobe cache (SQLite)"),
     auto_latest: bool = typer.Option(False, help="Use newest MKV under data/sources/")
 ):
-    """Split video into scene clips using mkvmerge or ffmpeg."""
+    """Split video into scene clips using mkvmerge, ffmpeg (per clip), ffmpeg-smart (copy + re-encoded GOP heads) or ffmpeg-segment (one pass)."""
     mkv = Path(inp) if inp else (find_latest_mkv() if auto_latest else None)
     if mkv is None:
         raise typer.Exit("Provide --inp or use --auto-latest.")
@@ -40,15 +132,480 @@ def split(
         # default CSV based on mkv stem or parent folder name
         movie_name = mkv.parent.name if mkv.parent.name != "sources" else mkv.stem
         csv_path = f"data/scenedetect/{movie_name}/{movie_name}-Scenes.csv"
+    enc = None
+    if encode or archive or fps or size:
+        if engine != "ffmpeg":
+            raise typer.BadParameter("--fps/--size/--encode/--archive need --engine ffmpeg")
+        try:
+            es = EncodeSettings.from_config(load_scenedetect_config(Path(config)), profile=encode, archive=archive)
+            clip = replace(es.clip_profile() or EncodeProfile(), **{k: v for k, v in (("fps", fps), ("size", size)) if v})
+            arch = es.archive_profile()
+            enc = encode_plan(clip, arch, detect_bars(mkv) if wants_bars(clip, arch) else None)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
     if engine == "mkvmerge":
         split_with_mkvmerge(mkv, Path(csv_path), Path(outdir))
+        return
+    if engine == "ffmpeg-segment":
+        with tqdm(unit="s", desc="split") as bar:
+            def _progress(done, total):
+                bar.total = round(total, 1)
+                bar.n = round(done, 1)
+                bar.refresh()
+            results = split_with_ffmpeg_segment(mkv, Path(csv_path), Path(outdir), copy, _progress)
     else:
-        split_with_ffmpeg(mkv, Path(csv_path), Path(outdir), copy)
+        with tqdm(unit="clip", desc="split") as bar:
+            def _tick(res, done, total):
+                bar.total = total
+                bar.update(1)
+                if not res.ok:
+                    bar.write(f"[FAIL] {res.out.name} ({res.start}-{res.end}): {res.error}")
+            if engine == "ffmpeg-smart":
+                with ProbeCache(Path(probe_cache)) as cache:
+                    results = split_with_ffmpeg_smart(mkv, Path(csv_path), Path(outdir), snap, jobs, _tick, cache=cache)
+            else:
+                archive_to = (Path(archive_dir) if archive_dir else Path("data/archive") / Path(outdir).name,
+                              enc.archive) if enc and enc.archive else None
+                results = split_with_ffmpeg(mkv, Path(csv_path), Path(outdir), copy,
+                                            jobs or (default_jobs(False, enc.threads) if enc else None), _tick,
+                                            encode=enc.args if enc else None, archive=archive_to)
+    failed = [r for r in results if not r.ok]
+    if failed:
+        typer.echo(f"{len(failed)}/{len(results)} clips failed: " + ", ".join(r.out.name for r in failed))
+        raise typer.Exit(1)
 
 @app.command()
-def review(clips_dir: str, review_root: str = "data/review"):
+def review(
+    clips_dir: str,
+    review_root: str = "data/review",
+    probe_cache: str = typer.Option(str(DEFAULT_CACHE), help="ffprobe cache (SQLite)"),
+    quality: bool = typer.Option(False, help="Score clips and link failures straight into reject/"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Config holding the `quality:` thresholds"),
+    jobs: Optional[int] = typer.Option(None, help="quality: clips scored in parallel (default: CPUs)"),
+    previews: bool = typer.Option(False, help="Contact sheet + low-bitrate proxy per clip, and index.html"),
+    preview_jobs: int = typer.Option(DEFAULT_PREVIEW_JOBS, help="previews: clips encoded at once (keep low on network shares)"),
+    link: str = typer.Option("auto", help="How keep/ and reject/ refer to clips: auto|hardlink|symlink|reflink|copy"),
+):
     """Create keep/reject folders + manifest.csv for human triage."""
-    stage_review(Path(clips_dir), Path(review_root))
+    thresholds = QualityThresholds.from_config(load_scenedetect_config(Path(config))) if quality else None
+    with ProbeCache(Path(probe_cache)) as cache:
+        base = stage_review(Path(clips_dir), Path(review_root), cache, quality=thresholds, jobs=jobs,
+                            link_mode=link)
+        if thresholds:
+            typer.echo(f"{sum(1 for _ in (base / 'reject').iterdir())} clips in {base / 'reject'}")
+        if previews:
+            clips = sorted([*Path(clips_dir).glob("*.mkv"), *Path(clips_dir).glob("*.mp4")])
+            with tqdm(unit="clip", desc="previews") as bar:
+                def _tick(clip, err):
+                    bar.update(1)
+                    if err:
+                        bar.write(f"[WARN] {clip.name}: {err}")
+                build_previews(base, clips, preview_jobs, cache, _tick)
+            typer.echo(f"Wrote: {write_review_index(base)}")
+        typer.echo(cache.stats())
+
+@app.command()
+def decide(
+    clips_dir: str,
+    review_root: str = "data/review",
+    file: Optional[str] = typer.Option(None, help="Decisions CSV (file,decision) or JSON ({file: decision})"),
+    keep: list[str] = typer.Option([], help="Clip name to keep (repeatable)"),
+    reject: list[str] = typer.Option([], help="Clip name to reject (repeatable)"),
+    clear: list[str] = typer.Option([], help="Clip name to make undecided again (repeatable)"),
+    from_folders: bool = typer.Option(True, help="Also record clips moved into keep/ or reject/ by hand"),
+    link: str = typer.Option("auto", help="auto|hardlink|symlink|reflink|copy"),
+):
+    """Record keep/reject decisions in manifest.csv and mirror them into keep/ and reject/ as links."""
+    decisions = load_decisions(Path(file)) if file else {}
+    decisions.update({n: "keep" for n in keep})
+    decisions.update({n: "reject" for n in reject})
+    decisions.update({n: "" for n in clear})
+    rep = apply_decisions(Path(clips_dir), Path(review_root), decisions, from_folders, link)
+    placed = ", ".join(f"{n} {how}" for how, n in sorted(rep.placed.items())) or "nothing placed"
+    typer.echo(f"keep {rep.keep}, reject {rep.reject}, undecided {rep.undecided} ({placed}, {rep.removed} removed)")
+    for name in rep.unknown:
+        typer.echo(f"[WARN] not in manifest: {name}")
+    for name in rep.conflicts:
+        typer.echo(f"[WARN] in both keep/ and reject/, left as is: {name}")
+
+@app.command()
+def sample(
+    count: int = typer.Option(12, help="Clips to stage"),
+    clips_root: str = typer.Option("data/clips", help="Clips tree to sample from (recursively)"),
+    review_root: str = "data/review",
+    stratify: str = typer.Option("set", help="set (per source folder) | duration (quartiles) | none"),
+    seed: Optional[int] = typer.Option(None, help="Random seed (default: random, kept in the folder name)"),
+    name: Optional[str] = typer.Option(None, help="Workspace name (default: sample-<count>-<stratify>-<seed>)"),
+    link: str = typer.Option("auto", help="auto|hardlink|symlink|reflink|copy"),
+):
+    """Stage a random/stratified sample of the corpus as a review workspace, without copying clips (replaces 03_stage_review.ps1)."""
+    base = stage_sample(Path(clips_root), count, Path(review_root), stratify, seed, link, name)
+    typer.echo(f"Review ready: {base}")
+
+@app.command()
+def pack(
+    review_root: str = typer.Option("data/review", help="Review folders whose kept clips are packed"),
+    out: str = typer.Option(str(DEFAULT_SHARDS), help="Shard folder (shard-NNNNNN.tar + index.npz)"),
+    shard_mb: float = typer.Option(DEFAULT_SHARD_MB, help="Target shard size (MB)"),
+    jobs: int = typer.Option(DEFAULT_PACK_JOBS, help="Shards written at once"),
+    clips_root: str = typer.Option("data/clips", help="Clips tree; <set>/<clip stem>.txt next to a clip is its caption"),
+    metadata: str = typer.Option("data/clips_metadata.csv", help="clips_metadata.csv merged into each sample's JSON (if present)"),
+    rebuild: bool = typer.Option(False, help="Delete the shards and pack every kept clip again (drops retired samples)"),
+):
+    """Pack kept clips (+ metadata JSON, + caption) into WebDataset tar shards with an offset index; only new or changed clips are written, into new shards."""
+    with tqdm(unit="shard", desc="pack") as bar:
+        def _tick(name, err):
+            bar.update(1)
+            if err:
+                bar.write(f"[FAIL] {name}: {err}")
+        rep = pack_kept(Path(review_root), Path(out), shard_mb, jobs, Path(clips_root), Path(metadata), rebuild, _tick)
+    typer.echo(f"{rep.kept} kept clips: {rep.packed} packed into {len(rep.shards)} new shard(s) "
+               f"({rep.bytes / 2**20:.0f} MB), {rep.current} already packed, {rep.retired} retired")
+    if rep.failed:
+        raise typer.Exit(1)
+
+@app.command("export")
+def export_cmd(
+    review_root: str = typer.Option("data/review", help="Review folders whose kept clips are exported"),
+    out: str = typer.Option(str(DEFAULT_TENSORS), help="Export root; arrays go to <out>/<size>-<frames>f-<fps>fps/"),
+    size: str = typer.Option(DEFAULT_SIZE, help="WxH: scaled to cover, then center-cropped"),
+    frames: int = typer.Option(DEFAULT_FRAMES, help="Frames per clip (the first N at --fps)"),
+    fps: float = typer.Option(DEFAULT_FPS, help="Frame rate frames are sampled at"),
+    gray: bool = typer.Option(False, help="One luma channel instead of RGB"),
+    pad: bool = typer.Option(False, help="Repeat the last frame of shorter clips instead of skipping them"),
+    jobs: Optional[int] = typer.Option(None, help="Clips decoded at once (default: CPUs)"),
+):
+    """Decode kept clips once into fixed-shape uint8 .npy arrays (np.load(mmap_mode="r")) with a manifest; resumable."""
+    spec = TensorSpec(size, frames, fps, gray, pad)
+    try:
+        spec.dims()
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    with tqdm(unit="clip", desc="export") as bar:
+        def _tick(key, err):
+            bar.update(1)
+            if err:
+                bar.write(f"[SKIP] {key}: {err}")
+        rep = export_tensors(Path(review_root), Path(out), spec, jobs, _tick)
+    typer.echo(f"{rep.kept} kept clips → {rep.folder}: {rep.exported} exported, {rep.current} up to date, "
+               f"{len(rep.short)} too short, {rep.removed} removed, {len(rep.failed)} failed")
+    if rep.failed:
+        raise typer.Exit(1)
+
+@app.command()
+def run(
+    sources: str = typer.Option("data/sources", help="Folder scanned (recursively) for .mkv/.mp4 sources"),
+    backend: str = typer.Option("cli", help="Scene detection: cli|inprocess|numpy"),
+    mode: str = typer.Option("adaptive", help="adaptive|content"),
+    threshold: Optional[float] = typer.Option(None, help="Detector threshold override"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Scene detection config"),
+    engine: str = typer.Option("ffmpeg", help="Split engine: mkvmerge|ffmpeg|ffmpeg-smart|ffmpeg-segment"),
+    copy: bool = typer.Option(True, help="ffmpeg: try -c copy"),
+    snap: float = typer.Option(DEFAULT_SNAP, help="ffmpeg-smart: keyframe snap tolerance (seconds)"),
+    encode: Optional[str] = typer.Option(None, help="ffmpeg: re-encode clips with this profile (config `encode: profiles:`)"),
+    archive: Optional[str] = typer.Option(None, help="ffmpeg: also write every clip with this profile into data/archive, from the same decode"),
+    jobs: Optional[int] = typer.Option(None, help="Parallel workers for detection chunks / clip cuts"),
+    normalize: bool = typer.Option(False, help="Cut training windows planned from the config's `normalize:` section"),
+    dedupe: bool = typer.Option(False, help="Flag clips that repeat earlier footage (dup_of in the review manifest)"),
+    quality: bool = typer.Option(False, help="Score clips and auto-reject by the config's `quality:` thresholds"),
+    previews: bool = typer.Option(False, help="Contact sheets, proxies and index.html in each review folder"),
+    state: str = typer.Option(str(DEFAULT_STATE), help="Pipeline manifest (JSON)"),
+    force: bool = typer.Option(False, help="Redo every stage, ignoring the manifest"),
+):
+    """Incremental scenes → (plan) → split → review for every source; unchanged work is skipped."""
+    settings = RunSettings(sources_dir=Path(sources), backend=backend, mode=mode, threshold=threshold,
+                           config=Path(config), engine=engine, copy=copy, snap=snap, profile=encode, archive=archive, jobs=jobs,
+                           normalize=normalize, dedupe=dedupe,
+                           quality=quality, previews=previews)
+    outcomes = run_pipeline(settings, Path(state), force, log=typer.echo)
+    failed = [o for o in outcomes if not o.ok]
+    typer.echo(f"{len(outcomes) - len(failed)}/{len(outcomes)} sources complete")
+    if failed:
+        raise typer.Exit(1)
+
+@app.command()
+def batch(
+    sources: str = typer.Option("data/sources", help="Folder scanned (recursively) for .mkv/.mp4 sources"),
+    backend: str = typer.Option("cli", help="Scene detection: cli|inprocess|numpy"),
+    mode: str = typer.Option("adaptive", help="adaptive|content"),
+    threshold: Optional[float] = typer.Option(None, help="Detector threshold override"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Scene detection config"),
+    engine: str = typer.Option("ffmpeg", help="Split engine: mkvmerge|ffmpeg|ffmpeg-smart|ffmpeg-segment"),
+    copy: bool = typer.Option(True, help="ffmpeg: try -c copy"),
+    snap: float = typer.Option(DEFAULT_SNAP, help="ffmpeg-smart: keyframe snap tolerance (seconds)"),
+    encode: Optional[str] = typer.Option(None, help="ffmpeg: re-encode clips with this profile (config `encode: profiles:`)"),
+    archive: Optional[str] = typer.Option(None, help="ffmpeg: also write every clip with this profile into data/archive, from the same decode"),
+    jobs: Optional[int] = typer.Option(None, help="Per-stage workers (detection chunks / clip cuts)"),
+    normalize: bool = typer.Option(False, help="Cut training windows planned from the config's `normalize:` section"),
+    dedupe: bool = typer.Option(False, help="Flag clips that repeat earlier footage (dup_of in the review manifest)"),
+    quality: bool = typer.Option(False, help="Score clips and auto-reject by the config's `quality:` thresholds"),
+    previews: bool = typer.Option(False, help="Contact sheets, proxies and index.html in each review folder"),
+    detect_workers: int = typer.Option(1, help="Sources detected at once (decode-heavy)"),
+    io_workers: int = typer.Option(2, help="Sources split/probed at once (I/O-heavy)"),
+    state: str = typer.Option(str(DEFAULT_STATE), help="Pipeline manifest (JSON)"),
+    force: bool = typer.Option(False, help="Redo every stage, ignoring the manifest"),
+):
+    """Like `run`, but overlaps detection of one source with splitting/probing of others."""
+    settings = RunSettings(sources_dir=Path(sources), backend=backend, mode=mode, threshold=threshold,
+                           config=Path(config), engine=engine, copy=copy, snap=snap, profile=encode, archive=archive, jobs=jobs,
+                           normalize=normalize, dedupe=dedupe,
+                           quality=quality, previews=previews)
+    outcomes = run_batch(settings, detect_workers, io_workers, Path(state), force, log=typer.echo)
+    failed = [o for o in outcomes if not o.ok]
+    typer.echo(f"{len(outcomes) - len(failed)}/{len(outcomes)} sources complete")
+    if failed:
+        raise typer.Exit(1)
+
+@app.command()
+def watch(
+    sources: str = typer.Option("data/sources", help="Folder watched (recursively) for new .mkv/.mp4 rips"),
+    backend: str = typer.Option("cli", help="Scene detection: cli|inprocess|numpy"),
+    mode: str = typer.Option("adaptive", help="adaptive|content"),
+    threshold: Optional[float] = typer.Option(None, help="Detector threshold override"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Scene detection config"),
+    engine: str = typer.Option("ffmpeg", help="Split engine: mkvmerge|ffmpeg|ffmpeg-smart|ffmpeg-segment"),
+    copy: bool = typer.Option(True, help="ffmpeg: try -c copy"),
+    snap: float = typer.Option(DEFAULT_SNAP, help="ffmpeg-smart: keyframe snap tolerance (seconds)"),
+    encode: Optional[str] = typer.Option(None, help="ffmpeg: re-encode clips with this profile (config `encode: profiles:`)"),
+    archive: Optional[str] = typer.Option(None, help="ffmpeg: also write every clip with this profile into data/archive, from the same decode"),
+    jobs: Optional[int] = typer.Option(None, help="Per-stage workers (detection chunks / clip cuts)"),
+    normalize: bool = typer.Option(False, help="Cut training windows planned from the config's `normalize:` section"),
+    dedupe: bool = typer.Option(False, help="Flag clips that repeat earlier footage (dup_of in the review manifest)"),
+    quality: bool = typer.Option(False, help="Score clips and auto-reject by the config's `quality:` thresholds"),
+    previews: bool = typer.Option(False, help="Contact sheets, proxies and index.html in each review folder"),
+    workers: int = typer.Option(1, help="Sources processed at once"),
+    settle: float = typer.Option(DEFAULT_SETTLE, help="Seconds a rip must stay unchanged before it is queued"),
+    poll: float = typer.Option(DEFAULT_POLL, help="Polling interval (seconds) when inotify is off or unavailable"),
+    inotify: bool = typer.Option(True, help="Use inotify on Linux (off: poll, e.g. for a share written by another host)"),
+    once: bool = typer.Option(False, help="Process what is there (after it settles), then exit"),
+    queue: str = typer.Option(str(DEFAULT_QUEUE), help="Job queue (SQLite)"),
+    state: str = typer.Option(str(DEFAULT_STATE), help="Pipeline manifest (JSON)"),
+):
+    """Ingest daemon: every finished rip under --sources is queued and run through scenes → split → review."""
+    settings = RunSettings(sources_dir=Path(sources), backend=backend, mode=mode, threshold=threshold,
+                           config=Path(config), engine=engine, copy=copy, snap=snap, profile=encode, archive=archive, jobs=jobs,
+                           normalize=normalize, dedupe=dedupe,
+                           quality=quality, previews=previews)
+    daemon = IngestDaemon(settings, load_scenedetect_config(Path(config)), workers, settle, poll, inotify,
+                          Path(state), Path(queue), log=typer.echo)
+    typer.echo(f"Watching {sources} ({workers} worker{'s' if workers != 1 else ''}); Ctrl-C to stop", err=True)
+    try:
+        daemon.run(once=once)
+    except KeyboardInterrupt:
+        typer.echo("Stopped; unfinished sources stay queued", err=True)
+    finally:
+        daemon.close()
+    counts = JobQueue(Path(queue)).counts(SOURCE_JOB)
+    typer.echo(" · ".join(f"{n} {s}" for s, n in counts.items()))
+    if once and counts["failed"]:
+        raise typer.Exit(1)
+
+@app.command("queue")
+def queue_cmd(
+    db: str = typer.Option(str(DEFAULT_QUEUE), help="Job queue (SQLite)"),
+    show: Optional[str] = typer.Option(None, help="List jobs in this state: queued|running|done|failed"),
+    retry_failed: bool = typer.Option(False, help="Queue failed jobs again with fresh attempts"),
+    purge_done: bool = typer.Option(False, help="Drop finished jobs"),
+):
+    """Show or manage the persistent job queue used by `watch`."""
+    with JobQueue(Path(db)) as q:
+        if retry_failed:
+            typer.echo(f"re-queued {q.retry_failed()} failed jobs")
+        if purge_done:
+            typer.echo(f"purged {q.purge()} finished jobs")
+        if show:
+            for j in q.jobs(show):
+                typer.echo(f"{j.id}\t{j.kind}\t{j.key}\tattempt {j.attempts}/{j.max_attempts}"
+                           + (f"\t{j.worker}" if show == "running" else "")
+                           + (f"\t{j.error}" if j.error else ""))
+        typer.echo(" · ".join(f"{n} {s}" for s, n in q.counts().items()) + f" in {q.db_path}")
+
+farm = typer.Typer(help="Cut clips on several nodes: a coordinator queues clip ranges, workers anywhere cut them")
+app.add_typer(farm, name="farm")
+
+@farm.command("submit")
+def farm_submit(
+    sources: str = typer.Option("data/sources", help="Folder scanned (recursively) for .mkv/.mp4 sources"),
+    inp: Optional[str] = typer.Option(None, help="Queue one source with --csv instead of scanning --sources"),
+    csv_path: Optional[str] = typer.Option(None, "--csv", help="Scene/clip CSV for --inp"),
+    outdir: Optional[str] = typer.Option(None, help="--inp: clip folder (default data/clips/<movie>)"),
+    backend: str = typer.Option("cli", help="Scene detection (run here): cli|inprocess|numpy"),
+    mode: str = typer.Option("adaptive", help="adaptive|content"),
+    threshold: Optional[float] = typer.Option(None, help="Detector threshold override"),
+    config: str = typer.Option(str(DEFAULT_SCENEDETECT_CFG), help="Scene detection config"),
+    engine: str = typer.Option("ffmpeg", help="Split engine: ffmpeg|ffmpeg-smart|mkvmerge"),
+    copy: bool = typer.Option(True, help="ffmpeg: try -c copy"),
+    snap: float = typer.Option(DEFAULT_SNAP, help="ffmpeg-smart: keyframe snap tolerance (seconds)"),
+    encode: Optional[str] = typer.Option(None, help="ffmpeg: re-encode clips with this profile (config `encode: profiles:`)"),
+    archive: Optional[str] = typer.Option(None, help="ffmpeg: also write every clip with this profile into data/archive, from the same decode"),
+    normalize: bool = typer.Option(False, help="Cut training windows planned from the config's `normalize:` section"),
+    queue: str = typer.Option(str(farm_mod.DEFAULT_FARM_QUEUE), help="Farm queue (SQLite; serve it, or put it on the shared FS)"),
+    shared: bool = typer.Option(False, help="The queue file is on NFS/SMB (no WAL)"),
+    wait: bool = typer.Option(True, help="Wait for the workers, then record finished clips in the manifest"),
+    state: str = typer.Option(str(DEFAULT_STATE), help="Pipeline manifest (JSON)"),
+    force: bool = typer.Option(False, help="Redo scene detection, ignoring the manifest"),
+):
+    """Coordinator: turn sources (or one scene CSV) into clip-range jobs for `farm work`."""
+    from dataprep.pipeline import Manifest, set_name, source_encode
+    settings = RunSettings(sources_dir=Path(sources), backend=backend, mode=mode, threshold=threshold,
+                           config=Path(config), engine=engine, copy=copy, snap=snap, profile=encode, archive=archive,
+                           normalize=normalize)
+    cfg = load_scenedetect_config(Path(config))
+    m = Manifest(Path(state))
+    with JobQueue(Path(queue), shared=shared) as q:
+        try:
+            if inp:
+                if not csv_path:
+                    raise typer.BadParameter("--inp needs --csv")
+                src = Path(inp)
+                out = Path(outdir) if outdir else settings.clips_root / set_name(src)
+                submitted = {src: (Path(csv_path), farm_mod.submit_csv(q, src, Path(csv_path), out, settings,
+                                                                       source_encode(src, settings, m, cfg)))}
+            else:
+                submitted = farm_mod.submit_sources(q, settings, m, cfg, force, log=typer.echo)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+        keys = [k for _, ks in submitted.values() for k in ks]
+        typer.echo(f"{len(keys)} clip jobs in {q.db_path}")
+        if not wait:
+            return
+        jobs = farm_mod.wait(q, keys, log=typer.echo)
+        for src, (csv_file, ks) in submitted.items():
+            if not inp:
+                farm_mod.record_split(m, src, csv_file, settings, source_encode(src, settings, m, cfg),
+                                      {k: jobs[k] for k in ks})
+        failed = [j for j in jobs.values() if j.state == "failed"]
+        for j in failed:
+            typer.echo(f"FAILED {j.key}: {(j.error or '').strip().splitlines()[-1] if j.error else ''}")
+        if failed:
+            raise typer.Exit(1)
+
+@farm.command("work")
+def farm_work(
+    queue: str = typer.Option(str(farm_mod.DEFAULT_FARM_QUEUE), help="Farm queue: SQLite path on the shared FS, or http://host:port"),
+    shared: bool = typer.Option(False, help="The queue file is on NFS/SMB (no WAL)"),
+    jobs: int = typer.Option(1, help="Clips cut at once on this node"),
+    exit_when_idle: bool = typer.Option(False, help="Exit once nothing is queued or running"),
+    lease: float = typer.Option(farm_mod.LEASE_SECONDS, help="Seconds without a heartbeat before another worker may take a job"),
+):
+    """Worker: lease clip jobs, cut them with ffmpeg/mkvmerge, heartbeat, report."""
+    q = farm_mod.open_queue(queue, shared, lease)
+    try:
+        tally = farm_mod.work(q, jobs, exit_when_idle, lease=lease, log=typer.echo)
+    except KeyboardInterrupt:
+        raise typer.Exit(130)
+    finally:
+        q.close()
+    typer.echo(f"{tally['done']} clips cut, {tally['failed']} failed")
+
+@farm.command("serve")
+def farm_serve(
+    queue: str = typer.Option(str(farm_mod.DEFAULT_FARM_QUEUE), help="Farm queue (SQLite, local to this node)"),
+    host: str = typer.Option("0.0.0.0", help="Address to listen on"),
+    port: int = typer.Option(farm_mod.DEFAULT_PORT, help="Port to listen on"),
+):
+    """HTTP coordinator: serve the queue to workers started with --queue http://<this host>:<port>."""
+    with JobQueue(Path(queue)) as q:
+        server = farm_mod.serve(q, host, port)
+        typer.echo(f"Serving {q.db_path} on http://{host}:{port}; Ctrl-C to stop", err=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+@app.command()
+def metadata(
+    root: str = typer.Option(".", help="Project root holding data/"),
+    clips_dir: Optional[str] = typer.Option(None, help="Clips tree (default: <root>/data/clips)"),
+    out: Optional[str] = typer.Option(None, help="CSV output (default: <root>/data/clips_metadata.csv)"),
+    parquet: Optional[str] = typer.Option(None, help="Also write the table as Parquet (needs the [parquet] extra: pyarrow)"),
+    jobs: Optional[int] = typer.Option(None, help="Parallel container-header readers (ffprobe fallbacks follow --max-procs)"),
+    resume: bool = typer.Option(True, help="Append to an existing CSV, skipping clips already in it"),
+    probe_cache: Optional[str] = typer.Option(None, help="ffprobe cache (default: <root>/data/.cache/probe.sqlite)"),
+):
+    """Probe every clip in batches and stream clips_metadata.csv (replaces 02_build_metadata.py)."""
+    base = Path(root)
+    clips = Path(clips_dir) if clips_dir else base / "data" / "clips"
+    out_csv = Path(out) if out else base / "data" / "clips_metadata.csv"
+    if parquet:
+        try:
+            require_parquet()
+        except RuntimeError as e:
+            raise typer.BadParameter(str(e))
+    with ProbeCache(Path(probe_cache) if probe_cache else base / DEFAULT_CACHE) as cache, \
+         tqdm(unit="clip", desc="metadata") as bar:
+        def _tick(clip, err):
+            bar.update(1)
+            if err:
+                bar.write(f"[WARN] {clip}: {err}")
+        rep = build_metadata(clips, out_csv, jobs, cache, Path(parquet) if parquet else None, resume, _tick)
+        bar.close()
+        typer.echo(f"Wrote: {out_csv} (+{rep.written} rows, {rep.skipped} already present, "
+                   f"{len(rep.failed)} failed)")
+        if rep.parquet:
+            typer.echo(f"Wrote: {rep.parquet}")
+        typer.echo(cache.stats())
+
+@app.command()
+def dedupe(
+    clips_dir: str = typer.Option("data/clips", help="Clips tree to fingerprint (recursively)"),
+    index: str = typer.Option(str(DEFAULT_INDEX), help="Fingerprint index (.npz) shared by all runs"),
+    max_dist: int = typer.Option(DEFAULT_MAX_DIST, help="Differing hash bits still counted as duplicates (< 40)"),
+    out: Optional[str] = typer.Option(None, help="Write clip,dup_of pairs to this CSV"),
+    jobs: Optional[int] = typer.Option(None, help="Clips decoded in parallel (default: CPUs)"),
+    probe_cache: str = typer.Option(str(DEFAULT_CACHE), help="ffprobe cache (SQLite)"),
+):
+    """Fingerprint new/changed clips and list near-duplicates across the whole index."""
+    from dataprep.metadata import find_clips
+    clips = find_clips(Path(clips_dir))
+    with ProbeCache(Path(probe_cache)) as cache, tqdm(unit="clip", desc="fingerprint") as bar:
+        def _tick(clip, err):
+            bar.update(1)
+            if err:
+                bar.write(f"[WARN] {clip}: {err}")
+        idx = fingerprint_clips(clips, Path(index), jobs, cache, _tick)
+    dupes = idx.duplicates(max_dist)
+    groups = len(set(dupes.values()))
+    typer.echo(f"{len(idx)} clips indexed, {len(dupes)} duplicates of {groups} originals")
+    if out:
+        import csv
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["clip", "dup_of"])
+            w.writerows(sorted(dupes.items()))
+        typer.echo(f"Wrote: {out}")
+
+@app.command("probe-cache")
+def probe_cache_cmd(
+    db: str = typer.Option(str(DEFAULT_CACHE), help="ffprobe cache (SQLite)"),
+    prune: bool = typer.Option(False, help="Drop entries for missing/changed files"),
+    clear: bool = typer.Option(False, help="Drop every entry"),
+):
+    """Show, prune or clear the shared ffprobe cache."""
+    with ProbeCache(Path(db)) as cache:
+        if clear:
+            typer.echo(f"cleared {cache.invalidate()} entries")
+        elif prune:
+            typer.echo(f"pruned {cache.prune()} stale entries")
+        typer.echo(f"{len(cache)} entries in {cache.db_path}")
+
+@app.command("frame-cache")
+def frame_cache_cmd(
+    root: str = typer.Option(str(framecache.DEFAULT_ROOT), help="Frame cache directory"),
+    evict: bool = typer.Option(False, help="Delete least recently used entries down to the budget (--frame-cache-mb)"),
+    clear: bool = typer.Option(False, help="Delete every entry"),
+):
+    """Show, trim or clear the decoded-frame cache used by the numpy analyses."""
+    shared = framecache.frame_cache()
+    cache = framecache.FrameCache(Path(root), shared.budget / 2**20 if shared else 0)
+    if clear:
+        typer.echo(f"cleared {cache.clear()} entries")
+    elif evict:
+        typer.echo(f"evicted {cache.evict()} entries")
+    n, size = cache.usage()
+    typer.echo(f"{n} entries, {size / 2**20:.1f} MB of {cache.budget / 2**20:.0f} MB in {cache.root}")
 
 if __name__ == "__main__":
     app()
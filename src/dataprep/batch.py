@@ -0,0 +1,63 @@
+# src/dataprep/batch.py
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Optional
+
+from .pipeline import (
+    DEFAULT_STATE, Log, RunSettings, SourceOutcome,
+    prepare_run, quality_thresholds, source_encode, stage_plan, stage_review_inc, stage_scenes, stage_split,
+)
+
+def run_batch(
+    s: RunSettings,
+    detect_workers: int = 1,
+    io_workers: int = 2,
+    state: Path = DEFAULT_STATE,
+    force: bool = False,
+    log: Optional[Log] = None,
+) -> list[SourceOutcome]:
+    """
+    Pipelined multi-source run: detection (decode-heavy) runs on a pool of
+    `detect_workers`, and as soon as a source's scene CSV exists its split +
+    review/probe (I/O-heavy) is queued on a separate pool of `io_workers`,
+    so movie B is being detected while movie A is cut. Each source is decoded
+    for detection once; split reads the CSV instead of re-running scenedetect.
+
+    Stage skipping and resume come from the same manifest as `wan21-dp run`.
+    `s.jobs` is the per-stage inner parallelism (detection chunks / clip cuts),
+    so the total load is roughly workers × jobs per pool.
+    """
+    sources, cfg, m = prepare_run(s, state)
+    quality = quality_thresholds(s, cfg)
+    outcomes = {src: SourceOutcome(src) for src in sources}
+    logs = {src: outcomes[src].logger(log) for src in sources}
+
+    def _detect(src: Path) -> Path:
+        return stage_scenes(src, s, m, cfg, force, logs[src])
+
+    def _finish(src: Path, csv_path: Path) -> None:
+        csv_path = stage_plan(src, csv_path, s, m, cfg, force, logs[src])
+        clips_dir = stage_split(src, csv_path, s, m, force, logs[src], source_encode(src, s, m, cfg))
+        stage_review_inc(src, clips_dir, s, m, force, logs[src], quality)
+
+    decode = ThreadPoolExecutor(max_workers=max(1, detect_workers), thread_name_prefix="detect")
+    io = ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="io")
+    try:
+        pending: dict[Future, tuple[str, Path]] = {
+            decode.submit(_detect, src): ("detect", src) for src in sources
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, src = pending.pop(fut)
+                err = fut.exception()
+                if err is not None:
+                    outcomes[src].fail(err, logs[src])
+                elif kind == "detect":
+                    pending[io.submit(_finish, src, fut.result())] = ("finish", src)
+    finally:
+        # Ctrl-C: drop queued sources; running stages save their manifest progress.
+        decode.shutdown(wait=True, cancel_futures=True)
+        io.shutdown(wait=True, cancel_futures=True)
+    return [outcomes[src] for src in sources]
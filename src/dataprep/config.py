@@ -0,0 +1,17 @@
+# src/dataprep/config.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+DEFAULT_SCENEDETECT_CFG = Path("configs/scenedetect.yaml")
+
+def load_yaml(path: Path) -> dict[str, Any]:
+    """Read a YAML config (utf-8-sig: several configs were saved with a BOM on Windows)."""
+    with path.open(encoding="utf-8-sig") as f:
+        return yaml.safe_load(f) or {}
+
+def load_scenedetect_config(path: Path = DEFAULT_SCENEDETECT_CFG) -> dict[str, Any]:
+    """configs/scenedetect.yaml, or {} when the file is absent (callers fall back to defaults)."""
+    return load_yaml(path) if path.exists() else {}
@@ -1,8 +1,17 @@
 # src/dataprep/core.py
 from __future__ import annotations
-import csv, json, shutil, subprocess, re
+import csv, os, shutil, re, socket, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, List
+from typing import TYPE_CHECKING, Callable, Optional, List
+
+from . import instrument, procs
+
+if TYPE_CHECKING:
+    from .probe import ProbeCache
+    from .quality import QualityThresholds
+    from .scenes import SceneTable
 
 # ------------------------------------------------------------
 # Utilities
@@ -10,13 +19,10 @@ from typing import Optional, List
 
 def _which(name: str) -> str:
     """
-    Find an executable on PATH (Windows-friendly).
+    Find an executable on PATH (Windows-friendly), resolved once per process.
     Raises a helpful error if missing.
     """
-    p = shutil.which(name) or shutil.which(f"{name}.exe")
-    if not p:
-        raise RuntimeError(f"{name} not found in PATH.")
-    return p
+    return procs.which(name)
 
 def _ensure_dir(p: Path) -> Path:
     p.mkdir(parents=True, exist_ok=True)
@@ -50,23 +56,45 @@ def _norm_tc(tc: str) -> str:
     ms = m.group("ms")
     return f"{h:02d}:{mi:02d}:{s:02d}" if ms is None else f"{h:02d}:{mi:02d}:{s:02d}.{int(ms):03d}"
 
+def _tc_seconds(tc: str) -> float:
+    """Timecode (HH:MM:SS(.mmm)) or plain seconds → float seconds."""
+    h, _, rest = tc.strip().rpartition(":")
+    h, _, m = h.rpartition(":")
+    return int(h or 0) * 3600 + int(m or 0) * 60 + float(rest)
+
 # ------------------------------------------------------------
 # Public API (matches your cli.main imports)
 # ------------------------------------------------------------
 
 def find_latest_mkv(sources_dir: Path = Path("data/sources")) -> Path:
     """
-    Return the newest .mkv under data/sources (recursively).
+    Return the newest .mkv under data/sources (recursively), from the source
+    index (dataprep.ingest): only folders changed since the last call are listed.
     """
-    files = sorted(
-        (p for p in sources_dir.rglob("*.mkv") if p.is_file()),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True,
-    )
-    if not files:
+    from .ingest import SourceIndex
+
+    with SourceIndex() as idx:
+        idx.rescan(sources_dir)
+        latest = idx.latest(sources_dir, (".mkv",))
+    if latest is None:
         raise FileNotFoundError(f"No .mkv files found under {sources_dir}")
-    return files[0]
+    return latest
+
+def movie_name(inp: Path) -> str:
+    """<movie> for a source: its parent folder name, or the file stem directly under sources/."""
+    return inp.parent.name if inp.parent.name != "sources" else inp.stem
 
+def scene_csv_path(inp: Path, outdir: Optional[Path] = None) -> Path:
+    """
+    The one scene CSV per source that downstream steps look for:
+      data/scenedetect/<movie>/<movie>-Scenes.csv
+    """
+    movie = movie_name(inp)
+    out_root = (outdir or Path("data/scenedetect") / movie)
+    out_root.mkdir(parents=True, exist_ok=True)
+    return out_root / f"{movie}-Scenes.csv"
+
+@instrument.stage
 def detect_scenes(
     inp: Path,
     outdir: Optional[Path] = None,
@@ -75,21 +103,13 @@ def detect_scenes(
 ) -> Path:
     """
     Run PySceneDetect and write one CSV.
-    NOTE: PySceneDetect 0.6.7.1 uses: `list-scenes -o <file.csv>`
-          (no `--csv` flag, no `--format` flag).
+    NOTE: PySceneDetect 0.6.7.1 uses: `list-scenes -o <dir> -f <file.csv>`
+          (no `--csv` flag, no `--format` flag; -o is a directory).
     """
     sd = _which("scenedetect")
+    csv_out = scene_csv_path(inp, outdir)
 
-    # Derive movie name & output locations
-    stem = inp.stem
-    movie_name = inp.parent.name if inp.parent.name != "sources" else stem
-    out_root = (outdir or Path("data/scenedetect") / movie_name)
-    out_root.mkdir(parents=True, exist_ok=True)
-
-    # We choose one explicit CSV file to be stable for downstream steps
-    csv_out = out_root / f"{movie_name}-Scenes.csv"
-
-    # Build the CLI: scenedetect -i <mkv> detect-<mode> list-scenes -o <csv_out>
+    # Build the CLI: scenedetect -i <mkv> detect-<mode> list-scenes -o <dir> -f <csv name>
     cmd = [sd, "-i", str(inp)]
     if mode == "content":
         cmd += ["detect-content"]
@@ -98,10 +118,10 @@ def detect_scenes(
     else:
         cmd += ["detect-adaptive"]
 
-    cmd += ["list-scenes", "-o", str(csv_out)]
+    cmd += ["list-scenes", "-o", str(csv_out.parent), "-f", csv_out.name]
 
     # Run and return the CSV path
-    subprocess.run(cmd, check=True)
+    instrument.run(cmd, check=True)
     return csv_out
 
 # --- robust CSV open with retries (Windows-friendly) -------------------------
@@ -128,8 +148,61 @@ def _open_csv_read(path: Path, retries: int = 10, delay: float = 0.5):
 
 def _rows_from_csv(csv_path: Path) -> list[dict]:
     with _open_csv_read(csv_path) as f:
+        # `list-scenes` prepends a "Timecode List:" row unless run with --skip-cuts.
+        if not f.readline().startswith("Timecode List"):
+            f.seek(0)
         return list(csv.DictReader(f))
 
+def _scene_ranges(rows: list[dict]) -> list[tuple[str, str]]:
+    """(start, end) timecodes per scene row, normalized for ffmpeg/mkvmerge."""
+    keys = list(rows[0].keys())
+    sk, ek = _pick_col(keys, START_KEYS), _pick_col(keys, END_KEYS)
+    return [(_norm_tc(r[sk]), _norm_tc(r[ek])) for r in rows]
+
+def _scene_table(csv_path: Path) -> "SceneTable":
+    """Parsed (and .npz-cached) scene table of a CSV; ValueError when it lists no scenes."""
+    from .scenes import load_scene_table
+    table = load_scene_table(csv_path)
+    if not len(table):
+        raise ValueError(f"No scenes found in {csv_path}")
+    return table
+
+def _single_pass_table(csv_path: Path, engine: str) -> "SceneTable":
+    """_scene_table for an engine that cuts the source once, which can put each moment in one clip only."""
+    table = _scene_table(csv_path)
+    if table.overlaps():
+        raise ValueError(f"{csv_path} has overlapping ranges (normalize stride < window); {engine} cannot cut "
+                         f"them, use the ffmpeg or ffmpeg-smart engine")
+    return table
+
+def _fmt_tc(seconds: float) -> str:
+    """float seconds → HH:MM:SS.mmm (the PySceneDetect timecode format)."""
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3_600_000); m, ms = divmod(ms, 60_000); s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+SCENE_CSV_HEADER = [
+    "Scene Number", "Start Frame", "Start Timecode", "Start Time (seconds)",
+    "End Frame", "End Timecode", "End Time (seconds)",
+    "Length (frames)", "Length (timecode)", "Length (seconds)",
+]
+
+def write_scene_csv(csv_path: Path, cuts: list[int], total_frames: int, fps: float) -> Path:
+    """
+    Write a PySceneDetect-compatible scene list from cut frame numbers
+    (0-based first frame of each new scene), so split/review accept it as-is.
+    """
+    _ensure_dir(csv_path.parent)
+    edges = [0, *sorted(c for c in set(cuts) if 0 < c < total_frames), total_frames]
+    with csv_path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(SCENE_CSV_HEADER)
+        for n, (a, b) in enumerate(zip(edges, edges[1:]), start=1):
+            ta, tb = a / fps, b / fps
+            w.writerow([n, a + 1, _fmt_tc(ta), f"{ta:.3f}", b, _fmt_tc(tb), f"{tb:.3f}",
+                        b - a, _fmt_tc(tb - ta), f"{tb - ta:.3f}"])
+    return csv_path
+
 def _timestamps_from_csv(csv_path: Path, out_ts: Path) -> None:
     with _open_csv_read(csv_path) as f, out_ts.open("w", encoding="utf-8") as g:
         r = csv.DictReader(f)
@@ -137,90 +210,328 @@ def _timestamps_from_csv(csv_path: Path, out_ts: Path) -> None:
             g.write(f"{row['Start Time']} - {row['End Time']}\n")
 
 
-def _mk_mkvmerge_parts_spec(rows: list[dict]) -> str:
+def _mk_mkvmerge_parts_spec(ranges: list[tuple[str, str]]) -> str:
     """
     Build mkvmerge `--split parts:` spec:
       "HH:MM:SS.mmm-HH:MM:SS.mmm,HH:MM:SS-HH:MM:SS,..."
     """
-    return ",".join(f"{r['start']}-{r['end']}" for r in rows)
+    return ",".join(f"{start}-{end}" for start, end in ranges)
 
-def split_with_mkvmerge(inp: Path, csv_path: Path, outdir: Path) -> None:
+@instrument.stage
+def split_with_mkvmerge(inp: Path, csv_path: Path, outdir: Path) -> list[Path]:
     """
     Split using MKVToolNix. This uses `--split parts:` (scene ranges), and
-    writes files as scene-0001.mkv, scene-0002.mkv, ...
+    writes files as scene-0001.mkv, scene-0002.mkv, ... (returned in order).
     """
+    ranges = _single_pass_table(csv_path, "mkvmerge").ranges()
     _ensure_dir(outdir)
-    rows = _rows_from_csv(csv_path)
-    if not rows:
-        raise ValueError(f"No scenes found in {csv_path}")
 
     mkvmerge = _which("mkvmerge")
-    # mkvmerge will name parts like output-001.mkv; we point to a base then rename.
-    base = outdir / "segments.mkv"
-    parts = _mk_mkvmerge_parts_spec(rows)
+    # mkvmerge will name parts like segments-001.mkv; we point to a base in a
+    # private work dir, then move them over the scene-0001.mkv names, so a
+    # failed run never touches existing clips and only its own parts get renamed.
+    work = outdir / ".mkvmerge-parts"
+    shutil.rmtree(work, ignore_errors=True)
+    _ensure_dir(work)
+    base = work / "segments.mkv"
+    parts = _mk_mkvmerge_parts_spec(ranges)
     cmd = [
         mkvmerge, "-o", str(base),
         "--split", f"parts:{parts}",
         str(inp),
     ]
-    subprocess.run(cmd, check=True)
+    try:
+        instrument.run(cmd, check=True)
+
+        # Rename produced files to scene-0001.mkv pattern
+        produced = sorted(work.glob("segments-*.mkv")) or sorted(work.glob("*.mkv"))
+        outs = [outdir / f"scene-{i:04d}.mkv" for i in range(1, len(produced) + 1)]
+        for p, out in zip(produced, outs):
+            os.replace(p, out)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return outs
+
+@dataclass
+class ClipResult:
+    """Outcome of cutting one scene range; `error` is None on success."""
+    index: int
+    out: Path
+    start: str
+    end: str
+    error: Optional[str] = None
 
-    # Rename produced files to scene-0001.mkv pattern
-    produced = sorted(outdir.glob("segments-*.mkv")) or sorted(outdir.glob("*.mkv"))
-    for i, p in enumerate(produced, start=1):
-        target = outdir / f"scene-{i:04d}.mkv"
-        if target.exists():
-            target.unlink()
-        p.rename(target)
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
-def split_with_ffmpeg(inp: Path, csv_path: Path, outdir: Path, copy: bool = True) -> None:
+# Re-encode settings shared by the ffmpeg engines (frame-accurate cuts).
+REENCODE_ARGS = ["-c:v","libx264","-preset","veryfast","-crf","18","-c:a","aac","-b:a","192k"]
+
+def default_jobs(copy: bool = True, threads: Optional[int] = None) -> int:
+    """
+    Worker count for split_with_ffmpeg:
+      • copy      → one per CPU (stream copy is I/O-bound, one thread each)
+      • threads   → CPU/threads (encoders pinned to that many threads each)
+      • re-encode → CPU/4 (libx264 already spreads over several threads)
     """
-    Split using FFmpeg per row (range start→end):
+    cpus = os.cpu_count() or 1
+    if copy:
+        return cpus
+    return max(1, cpus // (threads or 4))
+
+def _part_tag() -> str:
+    """host.pid.thread for temp names: two workers cutting the same clip (a lease taken over) never share one."""
+    return f"{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}"
+
+def _ffmpeg_cut(ff: str, inp: Path, start: str, end: str, out: Path, copy: bool,
+                encode: Optional[list[str]] = None,
+                archive: Optional[tuple[Path, list[str]]] = None) -> Optional[str]:
+    """
+    Cut one range into `out`; returns ffmpeg's error text instead of raising.
+    `encode` is the full output args of a re-encode (an EncodePlan, see
+    dataprep.profiles) in place of REENCODE_ARGS; `archive` = (path, args)
+    is a second output written from the same decode.
+    """
+    # Write to a temp name so a killed/failed cut never leaves a plausible-looking clip.
+    tag = _part_tag()
+    tmp = out.with_name(f"{out.stem}.{tag}.part{out.suffix}")
+    cmd = [ff, "-hide_banner", "-loglevel", "error", "-y",
+           "-ss", start, "-to", end, "-i", str(inp)]
+    cmd += (["-c", "copy"] if copy and not encode else encode or REENCODE_ARGS)
+    cmd.append(str(tmp))
+    atmp = None
+    if archive:
+        _ensure_dir(archive[0].parent)
+        atmp = archive[0].with_name(f"{archive[0].stem}.{tag}.part{archive[0].suffix}")
+        cmd += [*archive[1], str(atmp)]
+    try:
+        res = instrument.run(cmd, capture_output=True, text=True, errors="replace")
+        if res.returncode != 0:
+            return res.stderr.strip() or f"ffmpeg exited with {res.returncode}"
+        if atmp:
+            os.replace(atmp, archive[0])  # before the clip: a clip on disk means both tiers are
+        os.replace(tmp, out)
+        return None
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return str(e)
+    finally:
+        tmp.unlink(missing_ok=True)
+        if atmp:
+            atmp.unlink(missing_ok=True)
+
+@instrument.stage
+def split_with_ffmpeg(
+    inp: Path,
+    csv_path: Path,
+    outdir: Path,
+    copy: bool = True,
+    jobs: Optional[int] = None,
+    on_clip: Optional[Callable[[ClipResult, int, int], None]] = None,
+    only: Optional[set[int]] = None,
+    encode: Optional[list[str]] = None,
+    archive: Optional[tuple[Path, list[str]]] = None,
+) -> list[ClipResult]:
+    """
+    Split using FFmpeg per row (range start→end), `jobs` clips at a time:
       • copy=True  → -c copy (fast; keyframe-aligned)
       • copy=False → re-encode (frame-accurate; libx264/aac defaults)
-    Names files scene-00001.mkv (5-digit padding to keep sort order stable).
+      • encode     → re-encode with these output args (an encode profile, see
+                     dataprep.profiles), whatever `copy` says
+      • archive    → (folder, args): also write each clip there from the same
+                     decode (the profile's archive tier)
+    Names files 00001.mkv by CSV row (5-digit padding to keep sort order stable),
+    whatever order the workers finish in.
+
+    A failing scene does not abort the run: every row gets a ClipResult (sorted
+    by index) and `on_clip(result, done, total)` is called as each one finishes.
+    `only` restricts the run to those 1-based rows (resume); others are untouched.
     """
     _ensure_dir(outdir)
-    rows = _rows_from_csv(csv_path)
-    if not rows:
-        raise ValueError(f"No scenes found in {csv_path}")
+    ranges = _scene_table(csv_path).ranges()
+
+    ff = _which("ffmpeg")
+    copy = copy and not encode
+
+    def _cut(start: str, end: str, out: Path) -> Optional[str]:
+        return _ffmpeg_cut(ff, inp, start, end, out, copy, encode,
+                           (archive[0] / out.name, archive[1]) if archive else None)
+
+    return _cut_clips(ranges, outdir, jobs or default_jobs(copy), _cut, on_clip, only)
+
+def _cut_clips(
+    ranges: list[tuple[str, str]],
+    outdir: Path,
+    jobs: int,
+    cut: Callable[[str, str, Path], Optional[str]],
+    on_clip: Optional[Callable[[ClipResult, int, int], None]] = None,
+    only: Optional[set[int]] = None,
+) -> list[ClipResult]:
+    """Run `cut(start, end, out)` for each range on `jobs` threads (see split_with_ffmpeg)."""
+    results: list[ClipResult] = []
+    ex = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        futs = {}
+        for i, (start, end) in enumerate(ranges, start=1):
+            if only is not None and i not in only:
+                continue
+            out = outdir / f"{i:05d}.mkv"
+            res = ClipResult(i, out, start, end)
+            futs[instrument.submit(ex, cut, start, end, out)] = res
+        for fut in as_completed(futs):
+            res = futs[fut]
+            res.error = fut.result()
+            results.append(res)
+            if on_clip:
+                on_clip(res, len(results), len(futs))
+    finally:
+        # On Ctrl-C drop queued cuts instead of draining the whole backlog.
+        ex.shutdown(wait=True, cancel_futures=True)
+    return sorted(results, key=lambda r: r.index)
+
+@instrument.stage
+def split_with_ffmpeg_segment(
+    inp: Path,
+    csv_path: Path,
+    outdir: Path,
+    copy: bool = True,
+    on_progress: Optional[Callable[[float, float], None]] = None,
+) -> list[ClipResult]:
+    """
+    Split every CSV range in ONE ffmpeg pass (engine="ffmpeg-segment"):
+    the source is opened and demuxed once and the segment muxer cuts at
+    all scene boundaries (`-segment_times`), instead of N seeks/re-opens.
+      • copy=True  → cuts land on the first keyframe at/after each boundary
+      • copy=False → re-encode with keyframes forced at every boundary
+    Segments are renamed to the same 00001.mkv scheme as split_with_ffmpeg;
+    gaps between non-contiguous scenes are cut too and then discarded.
+    `on_progress(seconds_done, seconds_total)` follows ffmpeg's -progress.
+    """
+    table = _single_pass_table(csv_path, "ffmpeg-segment")
+    _ensure_dir(outdir)
+    ranges = table.ranges()
+    secs = list(zip(table.start.round(3).tolist(), table.end.round(3).tolist()))
+
+    # Boundaries relative to the first scene start (we seek there once).
+    t0 = min(a for a, _ in secs)
+    t1 = max(b for _, b in secs)
+    bounds = sorted({round(t - t0, 3) for ab in secs for t in ab} - {0.0, round(t1 - t0, 3)})
+    seg_of = {0.0: 0, **{t: k for k, t in enumerate(bounds, start=1)}}
+    times = ",".join(f"{t:.3f}" for t in bounds)
 
     ff = _which("ffmpeg")
-    for i, r in enumerate(rows, start=1):
-        start, end = r["start"], r["end"]
+    pattern = outdir / ".segment-%05d.mkv"
+    cmd = [ff, "-hide_banner", "-loglevel", "error", "-y",
+           "-ss", f"{t0:.3f}", "-to", f"{t1:.3f}", "-i", str(inp)]
+    if copy:
+        cmd += ["-c", "copy"]
+    else:
+        cmd += REENCODE_ARGS
+        if times:
+            cmd += ["-force_key_frames", times]
+    cmd += ["-f", "segment", "-segment_format", "matroska", "-reset_timestamps", "1"]
+    if times:
+        cmd += ["-segment_times", times]
+    cmd.append(str(pattern))
+
+    def _progress(p: dict) -> None:
+        done = procs.progress_seconds(p)
+        if done is not None:
+            on_progress(min(done, t1 - t0), t1 - t0)
+
+    try:
+        res = instrument.run(cmd, capture_output=True, text=True, errors="replace",
+                             on_progress=_progress if on_progress else None)
+        error = None if res.returncode == 0 else (res.stderr.strip() or f"ffmpeg exited with {res.returncode}")
+    except subprocess.TimeoutExpired as e:
+        error = str(e)
+
+    results: list[ClipResult] = []
+    for i, ((start, end), (a, _)) in enumerate(zip(ranges, secs), start=1):
         out = outdir / f"{i:05d}.mkv"
-        cmd = [ff, "-hide_banner", "-loglevel", "error", "-y",
-               "-ss", start, "-to", end, "-i", str(inp)]
-        cmd += (["-c", "copy"] if copy else
-                ["-c:v","libx264","-preset","veryfast","-crf","18","-c:a","aac","-b:a","192k"])
-        cmd.append(str(out))
-        subprocess.run(cmd, check=True)
+        k = seg_of[round(a - t0, 3)]
+        seg = outdir / (pattern.name % k)
+        r = ClipResult(i, out, start, end, error)
+        if r.ok:
+            if seg.exists():
+                os.replace(seg, out)
+            else:
+                r.error = f"segment muxer produced no output for {start}-{end}"
+        results.append(r)
+    # Anything left over is a gap between scenes (or debris of a failed run).
+    for seg in outdir.glob(".segment-*.mkv"):
+        seg.unlink()
+    return results
 
-def stage_review(clips_dir: Path, review_root: Path = Path("data/review")) -> Path:
+@instrument.stage
+def stage_review(
+    clips_dir: Path,
+    review_root: Path = Path("data/review"),
+    cache: Optional[ProbeCache] = None,
+    dupes: Optional[dict[str, str]] = None,
+    quality: Optional["QualityThresholds"] = None,
+    jobs: Optional[int] = None,
+    link_mode: str = "auto",
+) -> Path:
     """
     Create a review workspace:
-      data/review/<clips_dir.name>/{keep,reject}/ + manifest.csv (file,duration_s)
-    Includes both .mkv and .mp4 clips.
+      data/review/<clips_dir.name>/{keep,reject}/ + manifest.csv (file,duration_s,decision)
+    Includes both .mkv and .mp4 clips. Durations come from the shared probe
+    cache (data/.cache/probe.sqlite by default), so unchanged clips skip ffprobe.
+    With `dupes` (clip path → older clip with the same footage, see
+    dataprep.fingerprint) the manifest gains a `dup_of` column.
+
+    With `quality`, every clip is scored (dataprep.quality, `jobs` at a time,
+    cached in quality.json), the scores and an `auto_reject` reason become
+    manifest columns, and failing clips go to reject/ right away.
+
+    Decisions recorded earlier (dataprep.decisions), and clips moved into
+    keep/ or reject/ by hand since, survive a rebuild; both folders are then
+    re-materialized from them as links (`link_mode`), so auto-rejects that
+    pass after a threshold change are taken out again.
     """
+    from .decisions import decisions_from_folders, materialize, read_manifest, write_manifest
+    from .probe import ProbeCache
+
     base = review_root / clips_dir.name
     _ensure_dir(base / "keep")
     _ensure_dir(base / "reject")
 
-    manifest = base / "manifest.csv"
-    ffprobe = _which("ffprobe")
     clips = sorted([*clips_dir.glob("*.mkv"), *clips_dir.glob("*.mp4")])
+    header = ["file", "duration_s"] + (["dup_of"] if dupes is not None else [])
+    decided: dict[str, str] = {}
+    if (base / "manifest.csv").exists():
+        # Keep earlier decisions, and what someone dragged into keep/ or reject/ since.
+        prev = read_manifest(base)[1]
+        decided = {r["file"]: r.get("decision") or "" for r in prev}
+        decided.update(decisions_from_folders(base, prev)[0])
 
-    with manifest.open("w", newline='', encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["file", "duration_s"])
-        for clip in clips:
-            out = subprocess.check_output([
-                ffprobe, "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "json",
-                "-i", str(clip)
-            ])
-            dur = float(json.loads(out)["format"]["duration"])
-            w.writerow([clip.name, round(dur, 3)])
+    own_cache = cache is None
+    if own_cache:
+        cache = ProbeCache()
+    try:
+        durs = cache.probe_many(clips).duration.tolist()  # batched; quality scoring then hits the cache
+        scores = {}
+        if quality is not None:
+            from .quality import QUALITY_FIELDS, score_clips
+            scores = score_clips(clips, quality.sample_fps, jobs, cache, base / "quality.json")
+            header += [*QUALITY_FIELDS, "auto_reject"]
+        header.append("decision")
+        rows = []
+        for clip, dur in zip(clips, durs):
+            row = {"file": clip.name, "duration_s": "" if dur != dur else round(dur, 3),
+                   "decision": decided.get(clip.name, "")}
+            if dupes is not None:
+                row["dup_of"] = dupes.get(str(clip), "")
+            if quality is not None:
+                sc = scores.get(str(clip))
+                row.update(sc.row() if sc else {})
+                row["auto_reject"] = (quality.verdict(sc) if sc else "unreadable") or ""
+            rows.append(row)
+    finally:
+        if own_cache:
+            cache.close()
 
+    write_manifest(base, header, rows)
+    materialize(base, clips_dir, rows, link_mode)
     return base
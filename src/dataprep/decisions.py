@@ -0,0 +1,316 @@
+# src/dataprep/decisions.py
+from __future__ import annotations
+import csv, json, os, random, shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .core import _ensure_dir
+
+# ------------------------------------------------------------
+# Placing files without copying bytes
+# ------------------------------------------------------------
+
+LINK_MODES = ("auto", "hardlink", "symlink", "reflink", "copy")
+FICLONE = 0x40049409  # Linux ioctl: share extents (btrfs, XFS, bcachefs, ...)
+
+def _reflink(src: Path, dst: Path) -> None:
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        raise OSError("reflink not supported on this platform") from None
+    with src.open("rb") as s, dst.open("wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            dst.unlink(missing_ok=True)
+            raise
+    shutil.copystat(src, dst)
+
+def _symlink(src: Path, dst: Path) -> None:
+    os.symlink(os.path.relpath(src.resolve(), dst.parent.resolve()), dst)
+
+_CHAIN = {
+    "auto": ("hardlink", "reflink", "copy"),
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "symlink": ("symlink", "hardlink", "reflink", "copy"),  # Windows symlinks need developer mode
+    "reflink": ("reflink", "copy"),
+    "copy": ("copy",),
+}
+_PLACE = {"hardlink": lambda s, d: os.link(s, d), "symlink": _symlink, "reflink": _reflink,
+          "copy": lambda s, d: shutil.copy2(s, d)}
+
+def is_placed(src: Path, dst: Path) -> bool:
+    """`dst` already is `src`: same inode, a symlink to it, or a copy with equal size and mtime."""
+    if not dst.exists() and not dst.is_symlink():
+        return False
+    try:
+        if dst.is_symlink():
+            return dst.resolve() == src.resolve()
+        if os.path.samefile(src, dst):
+            return True
+        a, b = src.stat(), dst.stat()
+        return (a.st_size, a.st_mtime_ns) == (b.st_size, b.st_mtime_ns)
+    except OSError:
+        return False
+
+def place_file(src: Path, dst: Path, mode: str = "auto") -> str:
+    """
+    Make `dst` refer to `src` with the cheapest method `mode` allows:
+    hardlink → reflink → copy (symlink first with mode="symlink"). Linking
+    fails across filesystems and on FAT/exFAT, so the next method is tried.
+    Returns the method used ("present" if `dst` already was `src`).
+    """
+    if mode not in _CHAIN:
+        raise ValueError(f"Unknown link mode {mode!r} (choose from {', '.join(LINK_MODES)})")
+    if is_placed(src, dst):
+        return "present"
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    err: Optional[OSError] = None
+    for method in _CHAIN[mode]:
+        try:
+            _PLACE[method](src, dst)
+            return method
+        except OSError as e:
+            err = e
+    raise err  # copy failed too: disk full, permissions
+
+# ------------------------------------------------------------
+# Decisions: manifest.csv `decision` column ↔ keep/ and reject/
+# ------------------------------------------------------------
+
+DECISIONS = ("keep", "reject")
+_ALIASES = {
+    "keep": "keep", "k": "keep", "yes": "keep", "y": "keep", "true": "keep", "1": "keep", "good": "keep",
+    "reject": "reject", "r": "reject", "no": "reject", "n": "reject", "false": "reject", "0": "reject",
+    "bad": "reject", "drop": "reject",
+    "": "", "undecided": "", "none": "", "clear": "", "-": "",
+}
+
+def normalize_decision(value: object) -> str:
+    v = str(value if value is not None else "").strip().lower()
+    if v not in _ALIASES:
+        raise ValueError(f"Unknown decision {value!r}; use keep, reject or empty")
+    return _ALIASES[v]
+
+def read_manifest(base: Path) -> tuple[list[str], list[dict]]:
+    path = base / "manifest.csv"
+    if not path.exists():
+        raise FileNotFoundError(f"No manifest.csv in {base}; run `wan21-dp review` first")
+    with path.open(newline="", encoding="utf-8") as f:
+        r = csv.DictReader(f)
+        return list(r.fieldnames or []), list(r)
+
+def write_manifest(base: Path, header: list[str], rows: list[dict]) -> Path:
+    path = base / "manifest.csv"
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=header, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+    os.replace(tmp, path)
+    return path
+
+def effective(row: dict) -> str:
+    """A human decision wins; otherwise an auto_reject reason (dataprep.quality) means reject."""
+    return row.get("decision") or ("reject" if row.get("auto_reject") else "")
+
+def kept_rows(review_root: Path) -> list[tuple[Path, dict]]:
+    """
+    (review folder, manifest row) of every clip kept across the folders under
+    `review_root`, in folder/file order; triage samples (.samples/) and clips
+    missing from keep/ are left out. Clips dragged into or out of keep/ since
+    the manifest was written count as decided that way (decisions_from_folders,
+    as a review rebuild would record them).
+    """
+    out = []
+    for base in sorted(p for p in review_root.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        if (base / "manifest.csv").exists():
+            rows = read_manifest(base)[1]
+            moved = decisions_from_folders(base, rows)[0]
+            rows = [{**r, "decision": moved[r["file"]]} if r["file"] in moved else r for r in rows]
+            out += [(base, row) for row in rows
+                    if effective(row) == "keep" and (base / "keep" / row["file"]).exists()]
+    return out
+
+@dataclass
+class DecisionReport:
+    keep: int = 0
+    reject: int = 0
+    undecided: int = 0
+    placed: dict[str, int] = field(default_factory=dict)  # method → files
+    removed: int = 0
+    unknown: list[str] = field(default_factory=list)       # decided names not in the manifest
+    conflicts: list[str] = field(default_factory=list)     # in both keep/ and reject/
+
+def materialize(base: Path, clips_dir: Path, rows: list[dict], mode: str = "auto",
+                rep: Optional[DecisionReport] = None) -> DecisionReport:
+    """
+    Make keep/ and reject/ mirror the rows' effective decisions: the clip is
+    placed (place_file) in the folder it belongs to and taken out of the
+    other. Only entries that refer to the clip itself are removed, so files
+    someone dropped in by hand under another name are left alone.
+    """
+    rep = rep or DecisionReport()
+    folders = {d: _ensure_dir(base / d) for d in DECISIONS}
+    for row in rows:
+        src, want = clips_dir / row["file"], effective(row)
+        setattr(rep, want or "undecided", getattr(rep, want or "undecided") + 1)
+        for d, folder in folders.items():
+            dst = folder / row["file"]
+            if d == want and src.exists():
+                how = place_file(src, dst, mode)
+                rep.placed[how] = rep.placed.get(how, 0) + 1
+            elif d != want and is_placed(src, dst):
+                dst.unlink()
+                rep.removed += 1
+    return rep
+
+def load_decisions(path: Path) -> dict[str, str]:
+    """
+    file name → decision from a CSV (columns file|clip|path|name and
+    decision|label|status) or JSON ({"a.mkv": "keep"} or a list of
+    {"file": ..., "decision": ...}). Paths are reduced to their file name.
+    """
+    if path.suffix.lower() == ".json":
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+        items = data.items() if isinstance(data, dict) else ((d.get("file"), d.get("decision")) for d in data)
+    else:
+        with path.open(newline="", encoding="utf-8-sig") as f:
+            r = csv.DictReader(f)
+            cols = {c.lower(): c for c in r.fieldnames or []}
+            fcol = next((cols[c] for c in ("file", "clip", "path", "name") if c in cols), None)
+            dcol = next((cols[c] for c in ("decision", "label", "status") if c in cols), None)
+            if not fcol or not dcol:
+                raise ValueError(f"{path}: need a file and a decision column, got {r.fieldnames}")
+            items = [(row[fcol], row[dcol]) for row in r]
+    return {Path(str(f)).name: normalize_decision(d) for f, d in items if f}
+
+def decisions_from_folders(base: Path, rows: list[dict]) -> tuple[dict[str, str], list[str]]:
+    """
+    Decisions implied by what is in keep/ and reject/ now (the old
+    drag-and-drop workflow). An auto-rejected clip sitting in reject/ stays
+    undecided; a clip in both folders is a conflict and is left alone.
+    """
+    present = {d: {p.name for p in (base / d).iterdir()} if (base / d).is_dir() else set() for d in DECISIONS}
+    out, conflicts = {}, []
+    for row in rows:
+        name = row["file"]
+        inside = [d for d in DECISIONS if name in present[d]]
+        if len(inside) == 2:
+            conflicts.append(name)
+        elif inside == ["keep"] or (inside == ["reject"] and not (row.get("auto_reject") and not row.get("decision"))):
+            out[name] = inside[0]
+        elif not inside and row.get("decision"):
+            out[name] = ""  # taken out of its folder by hand: undecided again
+    return out, conflicts
+
+def apply_decisions(
+    clips_dir: Path,
+    review_root: Path = Path("data/review"),
+    decisions: Optional[dict[str, str]] = None,
+    from_folders: bool = False,
+    mode: str = "auto",
+) -> DecisionReport:
+    """
+    Record decisions (file name → keep|reject|"" to clear) in the `decision`
+    column of <review_root>/<clips_dir.name>/manifest.csv, optionally picking
+    up keep/ and reject/ edits first, then materialize both folders.
+    """
+    base = review_root / clips_dir.name
+    header, rows = read_manifest(base)
+    if "decision" not in header:
+        header.append("decision")
+    rep = DecisionReport()
+    merged: dict[str, str] = {}
+    if from_folders:
+        merged, rep.conflicts = decisions_from_folders(base, rows)
+    merged.update({k: normalize_decision(v) for k, v in (decisions or {}).items()})
+    names = {r["file"] for r in rows}
+    rep.unknown = sorted(n for n in merged if n not in names)
+    for row in rows:
+        if row["file"] in merged:
+            row["decision"] = merged[row["file"]]
+    write_manifest(base, header, rows)
+    return materialize(base, clips_dir, rows, mode, rep)
+
+# ------------------------------------------------------------
+# Sampling a subset of a large corpus for triage
+# ------------------------------------------------------------
+
+def stratified_indices(groups: list[str], n: int, rng: random.Random) -> list[int]:
+    """
+    `n` indices drawn without replacement, allocated to groups in proportion
+    to their size (largest remainder), every group getting at least one while
+    n allows.
+    """
+    by: dict[str, list[int]] = {}
+    for i, g in enumerate(groups):
+        by.setdefault(g, []).append(i)
+    n = min(n, len(groups))
+    keys = sorted(by)
+    base = {g: 1 for g in keys} if n >= len(keys) else {}
+    left = n - sum(base.values())
+    pool = len(groups) - sum(base.values())
+    exact = {g: (len(by[g]) - base.get(g, 0)) * left / pool if pool else 0.0 for g in keys}
+    quota = {g: base.get(g, 0) + int(exact[g]) for g in keys}
+    for g in sorted(keys, key=lambda g: exact[g] - int(exact[g]), reverse=True)[: n - sum(quota.values())]:
+        quota[g] += 1
+    return sorted(i for g in keys for i in rng.sample(by[g], min(quota[g], len(by[g]))))
+
+def _duration_bins(clips: list[Path], bins: int = 4) -> list[str]:
+    from .probe import ProbeCache
+    with ProbeCache() as cache:
+        durs = [d if d == d else 0.0 for d in cache.probe_many(clips).duration.tolist()]  # NaN → 0
+    edges = sorted(durs)
+    cuts = [edges[len(edges) * k // bins] for k in range(1, bins)] if edges else []
+    return [f"d{sum(d >= c for c in cuts)}" for d in durs]
+
+def stage_sample(
+    clips_root: Path,
+    n: int,
+    review_root: Path = Path("data/review"),
+    stratify: str = "set",
+    seed: Optional[int] = None,
+    mode: str = "auto",
+    name: Optional[str] = None,
+) -> Path:
+    """
+    Pick `n` clips from the whole clips tree — at random (stratify="none"),
+    per source folder ("set") or per duration quartile ("duration") — place
+    them (place_file, no byte copies) as <set>__<clip> in
+    <review_root>/.samples/.clips/<name>/ and build a normal review workspace
+    on them (stage_review) at <review_root>/.samples/<name>/, where pack and
+    export (kept_rows) do not count it as a set of its own. The seed is part
+    of the default name, so a sample can be recreated exactly.
+    """
+    from .core import stage_review
+    from .metadata import find_clips
+
+    clips = find_clips(clips_root)
+    if not clips:
+        raise FileNotFoundError(f"No clips found under {clips_root}")
+    seed = random.SystemRandom().randrange(1 << 31) if seed is None else seed
+    rng = random.Random(seed)
+    if stratify == "set":
+        groups = [c.parent.name for c in clips]
+    elif stratify == "duration":
+        groups = _duration_bins(clips)
+    elif stratify == "none":
+        groups = [""] * len(clips)
+    else:
+        raise ValueError(f"stratify must be set, duration or none, not {stratify!r}")
+    picked = [clips[i] for i in stratified_indices(groups, n, rng)]
+
+    samples = review_root / ".samples"
+    sample_dir = samples / ".clips" / (name or f"sample-{n}-{stratify}-{seed}")
+    if sample_dir.exists():
+        for p in sample_dir.iterdir():  # re-sampling under the same name replaces the set
+            p.unlink()
+    _ensure_dir(sample_dir)
+    for c in picked:
+        place_file(c, sample_dir / f"{c.parent.name}__{c.name}", mode)
+    return stage_review(sample_dir, samples)
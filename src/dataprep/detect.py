@@ -0,0 +1,159 @@
+# src/dataprep/detect.py
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from . import instrument
+from .core import scene_csv_path, write_scene_csv
+from .config import load_scenedetect_config
+
+# ------------------------------------------------------------
+# Detector parameters (configs/scenedetect.yaml)
+# ------------------------------------------------------------
+
+@dataclass
+class DetectParams:
+    """
+    Everything a worker needs to rebuild the detector. Read from the
+    `detect_<mode>` section of configs/scenedetect.yaml (falling back to
+    `detect_content`), so downscale_factor / luma_only / kernel_size apply.
+    """
+    mode: str = "adaptive"
+    threshold: Optional[float] = None      # content: threshold; adaptive: adaptive_threshold
+    min_scene_len: int = 15                # frames
+    luma_only: bool = False
+    kernel_size: Optional[int] = None
+    downscale_factor: int = 1
+    frame_skip: int = 0
+    extra: dict[str, Any] = field(default_factory=dict)   # e.g. min_content_val, window_width
+
+    @classmethod
+    def from_config(cls, cfg: dict, mode: str = "adaptive",
+                    threshold: Optional[float] = None) -> "DetectParams":
+        sec = dict(cfg.get(f"detect_{mode}") or cfg.get("detect_content") or {})
+        known = {"threshold", "adaptive_threshold", "min_scene_len", "luma_only",
+                 "kernel_size", "downscale_factor"}
+        thr = threshold if threshold is not None else sec.get(
+            "adaptive_threshold" if mode == "adaptive" else "threshold")
+        if mode == "adaptive" and "adaptive_threshold" not in sec and threshold is None:
+            thr = None  # a content threshold (e.g. 30) is not an adaptive ratio
+        return cls(
+            mode=mode,
+            threshold=thr,
+            min_scene_len=int(sec.get("min_scene_len", 15)),
+            luma_only=bool(sec.get("luma_only", False)),
+            kernel_size=sec.get("kernel_size"),
+            downscale_factor=max(1, int(sec.get("downscale_factor") or 1)),
+            frame_skip=int((cfg.get("inprocess") or {}).get("frame_skip", 0)),
+            extra={k: v for k, v in sec.items() if k not in known},
+        )
+
+    @property
+    def warmup(self) -> int:
+        """Frames a detector needs before it may report a cut (min length + adaptive window)."""
+        window = int(self.extra.get("window_width", 2)) if self.mode == "adaptive" else 0
+        return (self.min_scene_len + 2 * window + 2) * (self.frame_skip + 1)
+
+    def make_detector(self):
+        from scenedetect import AdaptiveDetector, ContentDetector
+        common = dict(min_scene_len=self.min_scene_len, luma_only=self.luma_only,
+                      kernel_size=self.kernel_size)
+        if self.mode == "content":
+            if self.threshold is not None:
+                common["threshold"] = float(self.threshold)
+            return ContentDetector(**common)
+        if self.threshold is not None:
+            common["adaptive_threshold"] = float(self.threshold)
+        for k in ("window_width", "min_content_val"):
+            if k in self.extra:
+                common[k] = self.extra[k]
+        return AdaptiveDetector(**common)
+
+# ------------------------------------------------------------
+# Chunked detection
+# ------------------------------------------------------------
+
+def _detect_chunk(path: str, params: DetectParams, backend: str,
+                  start: int, stop: int, own_start: int, own_stop: int) -> list[int]:
+    """
+    Worker: decode frames [start, stop) and return the cuts this chunk owns,
+    i.e. those in [own_start, own_stop). The extra frames on both sides only
+    warm the detector up so it sees the same history as a serial run.
+    """
+    from scenedetect import SceneManager, open_video
+    video = open_video(path, backend=backend)
+    sm = SceneManager()
+    sm.auto_downscale = False
+    sm.downscale = params.downscale_factor
+    sm.add_detector(params.make_detector())
+    if start:
+        video.seek(start)
+    sm.detect_scenes(video=video, end_time=stop, frame_skip=params.frame_skip)
+    return [c.frame_num for c in sm.get_cut_list() if own_start <= c.frame_num < own_stop]
+
+def _reconcile(cuts: list[int], min_scene_len: int) -> list[int]:
+    """
+    Merge per-chunk cuts: de-duplicate and re-apply min_scene_len across the
+    seams (two chunks may each keep a cut a few frames either side of one).
+    """
+    kept: list[int] = []
+    last = 0
+    for c in sorted(set(cuts)):
+        if c - last >= min_scene_len:
+            kept.append(c)
+            last = c
+    return kept
+
+def plan_chunks(total: int, chunk: int, overlap: int) -> list[tuple[int, int, int, int]]:
+    """(start, stop, own_start, own_stop) per chunk; owned ranges tile [0, total)."""
+    chunk = max(1, chunk)
+    out = []
+    for own_start in range(0, total, chunk):
+        own_stop = min(total, own_start + chunk)
+        out.append((max(0, own_start - overlap), min(total, own_stop + overlap), own_start, own_stop))
+    return out
+
+@instrument.stage
+def detect_scenes_inprocess(
+    inp: Path,
+    outdir: Optional[Path] = None,
+    mode: str = "adaptive",
+    threshold: Optional[float] = None,
+    cfg: Optional[dict] = None,
+    jobs: Optional[int] = None,
+) -> Path:
+    """
+    PySceneDetect's detectors run in-process (no `scenedetect` CLI), on frames
+    downscaled by `downscale_factor` and optionally thinned by `frame_skip`.
+    The timeline is split into `chunk_seconds` slices detected by `jobs`
+    worker processes, each decoding `overlap_seconds` past its seams; cuts are
+    reconciled at the seams. Writes the same <movie>-Scenes.csv as detect_scenes().
+    """
+    from scenedetect import open_video
+
+    cfg = load_scenedetect_config() if cfg is None else cfg
+    params = DetectParams.from_config(cfg, mode, threshold)
+    opts = cfg.get("inprocess") or {}
+    backend = opts.get("backend", "opencv")
+
+    video = open_video(str(inp), backend=backend)
+    fps = float(video.frame_rate)
+    total = video.duration.frame_num
+    del video
+
+    chunk = int(float(opts.get("chunk_seconds", 300)) * fps)
+    overlap = max(int(float(opts.get("overlap_seconds", 10)) * fps), params.warmup)
+    jobs = jobs or os.cpu_count() or 1
+    chunks = plan_chunks(total, chunk if jobs > 1 else total, overlap)
+    jobs = max(1, min(len(chunks), jobs))
+
+    if jobs == 1:
+        parts = [_detect_chunk(str(inp), params, backend, *c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            parts = list(ex.map(_detect_chunk, *zip(*[(str(inp), params, backend, *c) for c in chunks])))
+    cuts = _reconcile([c for part in parts for c in part], params.min_scene_len)
+    return write_scene_csv(scene_csv_path(inp, outdir), cuts, total, fps)
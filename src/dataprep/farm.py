@@ -0,0 +1,383 @@
+# src/dataprep/farm.py
+from __future__ import annotations
+import json, os, shutil, subprocess, threading, time, urllib.error, urllib.request
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Union
+
+from . import instrument
+from .core import _ensure_dir, _ffmpeg_cut, _part_tag, _scene_table, _tc_seconds, _which
+from .jobqueue import LEASE_SECONDS, MAX_ATTEMPTS, Heartbeat, Job, JobQueue, worker_id
+from .pipeline import (
+    Log, Manifest, RunSettings, _digest, clip_keys, file_sha, file_sig,
+    find_sources, set_name, source_encode, split_params, stage_plan, stage_scenes,
+)
+from .profiles import EncodePlan
+
+# ------------------------------------------------------------
+# Clip-range jobs: one per scene row, cut by any node sharing the files
+# ------------------------------------------------------------
+
+CLIP_JOB = "clip"
+DEFAULT_FARM_QUEUE = Path("data/.state/farm.sqlite")
+DEFAULT_PORT = 8765
+FARM_ENGINES = ("ffmpeg", "ffmpeg-smart", "mkvmerge")  # per-clip engines (ffmpeg-segment is one process per source)
+
+def clip_jobs(src: Path, csv_path: Path, outdir: Path, s: RunSettings,
+              encode: Optional[EncodePlan] = None) -> list[tuple[str, dict]]:
+    """
+    (key, payload) per scene row: cut `src` start→end into <outdir>/00001.mkv, ...
+    Paths are absolute, so every node must mount the data at the same path.
+    The payload carries the source size/mtime and range key: a re-rip or a
+    changed plan re-queues the clip, an unchanged finished one stays done.
+    """
+    if s.engine not in FARM_ENGINES:
+        raise ValueError(f"The farm cuts clips one by one: engine must be one of {FARM_ENGINES}, not {s.engine}")
+    params = split_params(s, encode)
+    sig = file_sig(src)
+    ranges = _scene_table(csv_path).ranges()
+    src, csv_path, outdir = src.resolve(), csv_path.resolve(), outdir.resolve()
+    extra = {}
+    if s.engine == "ffmpeg-smart":  # probed here: workers should not each open a SQLite cache over NFS
+        from .probe import ProbeCache
+
+        with ProbeCache() as cache:
+            extra["has_audio"] = any(st.get("codec_type") == "audio" for st in cache.probe(src).get("streams", []))
+    archive = (s.archive_root / set_name(src)).resolve() if encode and encode.archive else None
+    return [(str(outdir / name), {"src": str(src), "csv": str(csv_path), "out": str(outdir / name),
+                                  "start": a, "end": b, "params": params, "range": rk, "src_sig": sig,
+                                  **({"archive": str(archive / name)} if archive else {}), **extra})
+            for (name, rk), (a, b) in zip(clip_keys(sig, ranges, params).items(), ranges)]
+
+def _mkvmerge_cut(mkvmerge: str, inp: Path, start: str, end: str, out: Path) -> Optional[str]:
+    """One `--split parts:` range into `out` via a private work dir; returns the error text instead of raising."""
+    work = out.with_name(f".{out.stem}.{_part_tag()}.mkvmerge")
+    shutil.rmtree(work, ignore_errors=True)
+    _ensure_dir(work)
+    try:
+        res = instrument.run([mkvmerge, "-o", str(work / "part.mkv"), "--split", f"parts:{start}-{end}", str(inp)],
+                             capture_output=True, text=True, errors="replace")
+        produced = sorted(work.glob("*.mkv"))
+        if res.returncode >= 2 or not produced:  # 1 = warnings only
+            return (res.stdout + res.stderr).strip() or f"mkvmerge exited with {res.returncode}"
+        os.replace(produced[0], out)
+        return None
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return str(e)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+_kf_lock = threading.Lock()
+_kf_index: dict[str, object] = {}
+
+def _keyframes(src: Path, csv_path: Path):
+    """Keyframe index next to the scene CSV, loaded once per worker process (built by submit)."""
+    from .keyframes import load_keyframe_index
+
+    with _kf_lock:
+        idx = _kf_index.get(str(src))
+        if idx is None:
+            idx = _kf_index[str(src)] = load_keyframe_index(src, csv_path.parent)
+        return idx
+
+def run_clip_job(payload: dict) -> Optional[str]:
+    """Cut one clip as described by clip_jobs(); returns the error text, None on success."""
+    src, out = Path(payload["src"]), Path(payload["out"])
+    try:
+        if file_sig(src) != payload["src_sig"]:
+            return f"{src} changed since the job was queued"
+    except OSError as e:
+        return str(e)
+    _ensure_dir(out.parent)
+    params, start, end = payload["params"], payload["start"], payload["end"]
+    if params["engine"] == "mkvmerge":
+        return _mkvmerge_cut(_which("mkvmerge"), src, start, end, out)
+    if params["engine"] == "ffmpeg-smart":
+        from .keyframes import _smart_cut
+
+        return _smart_cut(_which("ffmpeg"), src, _keyframes(src, Path(payload["csv"])), payload["has_audio"],
+                          _tc_seconds(start), _tc_seconds(end), out, params["snap"])
+    encode = params.get("encode")
+    archive = (Path(payload["archive"]), params["archive"]) if "archive" in payload else None
+    return _ffmpeg_cut(_which("ffmpeg"), src, start, end, out, params.get("copy", True) and not encode, encode, archive)
+
+# ------------------------------------------------------------
+# HTTP coordinator: the queue file stays on one node, workers talk JSON
+# ------------------------------------------------------------
+
+_REMOTE_CALLS = ("lease", "heartbeat", "complete", "fail", "release", "due", "counts")
+
+def _job(d: dict) -> Job:
+    return Job(**{k: d[k] for k in ("id", "kind", "key", "payload", "attempts", "max_attempts", "worker")})
+
+class _Handler(BaseHTTPRequestHandler):
+    queue: JobQueue
+
+    def log_message(self, *args) -> None:  # one line per heartbeat would drown the coordinator's log
+        pass
+
+    def _reply(self, code: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/counts":
+            self._reply(200, self.queue.counts())
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        call = self.path.strip("/")
+        if call not in _REMOTE_CALLS:
+            self._reply(404, {"error": f"unknown call {call}"})
+            return
+        try:
+            a = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            q = self.queue
+            if call == "lease":
+                job = q.lease(a["worker"], a.get("kinds"), a.get("lease", LEASE_SECONDS))
+                out = asdict(job) if job else None
+            elif call == "heartbeat":
+                out = q.heartbeat(_job(a["job"]), a.get("lease", LEASE_SECONDS))
+            elif call == "complete":
+                out = q.complete(_job(a["job"]), a.get("result"))
+            elif call == "fail":
+                out = q.fail(_job(a["job"]), a["error"], a.get("retry", True))
+            elif call == "release":
+                out = q.release(_job(a["job"]))
+            elif call == "due":
+                out = q.due(a.get("kind"))
+            else:
+                out = q.counts(a.get("kind"))
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(200, out)
+
+def serve(queue: JobQueue, host: str = "0.0.0.0", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """An HTTP front for `queue` (call serve_forever()); workers use RemoteQueue(url)."""
+    handler = type("FarmHandler", (_Handler,), {"queue": queue})
+    return ThreadingHTTPServer((host, port), handler)
+
+class RemoteQueue:
+    """
+    The worker side of JobQueue (lease/heartbeat/complete/fail/release/due/counts)
+    over HTTP. One call, retries included, gives up after a quarter of `lease`,
+    so a heartbeat stuck on a dead coordinator still leaves the lease slack.
+    """
+
+    def __init__(self, url: str, lease: float = LEASE_SECONDS, timeout: float = 30.0):
+        self.url, self.budget = url.rstrip("/"), lease / 4
+        self.timeout = min(timeout, self.budget)
+
+    def _call(self, call: str, **args):
+        req = urllib.request.Request(f"{self.url}/{call}", data=json.dumps(args).encode(),
+                                     headers={"Content-Type": "application/json"})
+        deadline, attempt = time.monotonic() + self.budget, 0
+        while True:
+            try:
+                with urllib.request.urlopen(req, timeout=max(1.0, min(self.timeout, deadline - time.monotonic()))) as r:
+                    return json.loads(r.read())
+            except urllib.error.HTTPError:
+                raise
+            except (urllib.error.URLError, OSError):  # coordinator restarting / network blip
+                wait = 2 ** attempt
+                if time.monotonic() + wait >= deadline:
+                    raise
+                time.sleep(wait)
+                attempt += 1
+
+    def lease(self, worker: str, kinds=None, lease: float = LEASE_SECONDS) -> Optional[Job]:
+        d = self._call("lease", worker=worker, kinds=list(kinds or ()), lease=lease)
+        return Job(**d) if d else None
+
+    def heartbeat(self, job: Job, lease: float = LEASE_SECONDS) -> bool:
+        return self._call("heartbeat", job=asdict(job), lease=lease)
+
+    def complete(self, job: Job, result: Optional[dict] = None) -> bool:
+        return self._call("complete", job=asdict(job), result=result)
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> str:
+        return self._call("fail", job=asdict(job), error=error, retry=retry)
+
+    def release(self, job: Job) -> bool:
+        return self._call("release", job=asdict(job))
+
+    def due(self, kind: Optional[str] = None) -> int:
+        return self._call("due", kind=kind)
+
+    def counts(self, kind: Optional[str] = None) -> dict[str, int]:
+        return self._call("counts", kind=kind)
+
+    def close(self) -> None:
+        pass
+
+AnyQueue = Union[JobQueue, RemoteQueue]
+
+def open_queue(spec: str, shared: bool = False, lease: float = LEASE_SECONDS) -> AnyQueue:
+    """
+    http(s)://host:port → RemoteQueue (calls bounded by `lease`, the workers'
+    lease); anything else is a SQLite file (shared=True on NFS/SMB).
+    """
+    if spec.startswith(("http://", "https://")):
+        return RemoteQueue(spec, lease)
+    return JobQueue(Path(spec), shared=shared)
+
+# ------------------------------------------------------------
+# Worker: lease → cut → heartbeat → report
+# ------------------------------------------------------------
+
+def work(queue: AnyQueue, jobs: int = 1, exit_when_idle: bool = False, poll: float = 2.0,
+         lease: float = LEASE_SECONDS, stop: Optional[threading.Event] = None,
+         log: Optional[Log] = None) -> dict[str, int]:
+    """
+    Cut clips from `queue` on `jobs` threads until `stop` is set (or, with
+    `exit_when_idle`, until nothing is due or running). Each job is kept
+    leased by a heartbeat while ffmpeg/mkvmerge runs; a worker that dies
+    simply stops heartbeating and the job is handed out again. Anything a
+    job raises (a tool missing on this node, a queue call failing) is
+    recorded as that job's failure and the thread keeps leasing. Returns
+    {"done": n, "failed": n} for this worker.
+    """
+    stop = stop or threading.Event()
+    log = log or (lambda msg: None)
+    tally = {"done": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def _fail(job: Job, err: str) -> None:
+        state = queue.fail(job, err)
+        with lock:
+            tally["failed"] += 1
+        log(f"FAILED {job.key} (attempt {job.attempts}/{job.max_attempts}, {state}): {err.splitlines()[-1] if err else ''}")
+
+    def _one(wid: str, job: Job) -> None:
+        t0 = time.perf_counter()
+        with Heartbeat(queue, job, lease) as hb:
+            err = run_clip_job(job.payload)
+        if hb.lost:
+            log(f"lost lease on {job.key}; result dropped")
+        elif err is None:
+            if not queue.complete(job, {"worker": wid, "seconds": round(time.perf_counter() - t0, 2),
+                                        "size": os.path.getsize(job.payload["out"])}):
+                log(f"lost lease on {job.key}; result dropped")  # expired unseen: another worker has it now
+                return
+            with lock:
+                tally["done"] += 1
+            log(f"done {job.key} ({time.perf_counter() - t0:.1f}s)")
+        elif stop.is_set():
+            queue.release(job)
+        else:
+            _fail(job, err)
+
+    def _loop(n: int) -> None:
+        wid = worker_id(f"w{n}")
+        while not stop.is_set():
+            try:
+                job = queue.lease(wid, [CLIP_JOB], lease)
+                if job is None and exit_when_idle:
+                    c = queue.counts(CLIP_JOB)
+                    if not c["queued"] and not c["running"]:  # queued = due, or waiting out a retry backoff
+                        return
+            except Exception as e:  # coordinator unreachable past RemoteQueue's retries: try again later
+                log(f"queue: {e}")
+                job = None
+            if job is None:
+                stop.wait(poll)
+                continue
+            try:
+                _one(wid, job)
+            except Exception as e:
+                try:
+                    _fail(job, f"{type(e).__name__}: {e}")
+                except Exception as e2:  # not even recorded: the lease runs out and the job is handed out again
+                    log(f"FAILED {job.key}: {e}; could not report it: {e2}")
+                    stop.wait(poll)
+
+    pool = [threading.Thread(target=_loop, args=(n,), name=f"farm-{n}") for n in range(max(1, jobs))]
+    for t in pool:
+        t.start()
+    try:
+        for t in pool:
+            while t.is_alive():
+                t.join(0.5)  # keeps the main thread responsive to Ctrl-C
+    finally:
+        stop.set()
+        for t in pool:
+            t.join()
+    return tally
+
+# ------------------------------------------------------------
+# Coordinator: sources/CSVs → jobs; wait; record finished clips in the manifest
+# ------------------------------------------------------------
+
+def submit_csv(queue: JobQueue, src: Path, csv_path: Path, outdir: Path, s: RunSettings,
+               encode: Optional[EncodePlan] = None) -> list[str]:
+    """
+    Queue one job per row of `csv_path`. Clips already cut with the same
+    range/params whose file is still there stay done; rows gone from the
+    CSV lose their job and clip. Returns the job keys.
+    """
+    items = clip_jobs(src, csv_path, outdir, s, encode)
+    keys = {k for k, _ in items}
+    here = str(outdir.resolve())
+    stale = [j.key for j in queue.jobs(kind=CLIP_JOB) if os.path.dirname(j.key) == here and j.key not in keys]
+    for k in stale:
+        Path(k).unlink(missing_ok=True)
+    queue.delete(CLIP_JOB, stale)
+    queue.put_many(CLIP_JOB, items, MAX_ATTEMPTS)
+    queue.requeue(CLIP_JOB, [k for k, p in items if not (Path(k).exists() and Path(p.get("archive", k)).exists())],
+                  states=("done",))
+    return [k for k, _ in items]
+
+def wait(queue: JobQueue, keys: list[str], poll: float = 2.0, log: Optional[Log] = None) -> dict[str, Job]:
+    """Block until every job in `keys` is done or failed; returns key → Job."""
+    want, last = set(keys), None
+    while True:
+        jobs = {j.key: j for j in queue.jobs(kind=CLIP_JOB) if j.key in want}
+        count = {st: sum(1 for j in jobs.values() if j.state == st) for st in ("queued", "running", "done", "failed")}
+        if log and count != last:
+            log(" · ".join(f"{n} {st}" for st, n in count.items()))
+            last = count
+        if count["queued"] + count["running"] == 0:
+            return jobs
+        time.sleep(poll)
+
+def record_split(m: Manifest, src: Path, csv_path: Path, s: RunSettings, encode: Optional[EncodePlan],
+                 jobs: dict[str, Job]) -> None:
+    """Manifest split entry for the clips the farm finished, as stage_split would write it."""
+    params = split_params(s, encode)
+    outdir = s.clips_root / set_name(src)
+    clips = {}
+    for key, j in jobs.items():
+        out = Path(key)
+        if j.state == "done" and out.exists():
+            clips[out.name] = {"range": j.payload["range"], "sig": file_sig(out)}
+    with m.lock:
+        m.source(src)["split"] = {"key": _digest(file_sig(src), file_sha(csv_path), params),
+                                  "outdir": str(outdir), "params": params, "clips": clips}
+        m.save()
+
+def submit_sources(queue: JobQueue, s: RunSettings, m: Manifest, cfg: dict, force: bool = False,
+                   log: Optional[Log] = None) -> dict[Path, tuple[Path, list[str]]]:
+    """
+    Scene detection (and plan) for every source under s.sources_dir, run
+    here through the manifest like `wan21-dp run`, then one job per clip.
+    Returns source → (clip CSV, job keys).
+    """
+    log = log or (lambda msg: None)
+    out = {}
+    for src in find_sources(s.sources_dir):
+        _log = lambda msg, src=src: log(f"[{set_name(src)}] {msg}")
+        csv_path = stage_plan(src, stage_scenes(src, s, m, cfg, force, _log), s, m, cfg, force, _log)
+        if s.engine == "ffmpeg-smart":
+            from .keyframes import load_keyframe_index
+            load_keyframe_index(src, csv_path.parent)  # built once here, read by every worker
+        keys = submit_csv(queue, src, csv_path, s.clips_root / set_name(src), s, source_encode(src, s, m, cfg))
+        _log(f"farm: {len(keys)} clip jobs")
+        out[src] = (csv_path, keys)
+    return out
@@ -0,0 +1,263 @@
+# src/dataprep/fingerprint.py
+from __future__ import annotations
+import os, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+
+from . import instrument
+from .framecache import frame_reader
+from .probe import ProbeCache, probe_duration
+
+# ------------------------------------------------------------
+# Perceptual hashes (DCT pHash of a few sampled frames per clip)
+# ------------------------------------------------------------
+
+DEFAULT_INDEX = Path("data/.cache/fingerprints.npz")
+FP_FRAMES = 5          # frames sampled per clip, evenly over its duration
+HASH_SIDE = 32         # frames are decoded at 32x32 gray; the hash keeps the 8x8 lowest DCT terms
+FP_BITS = FP_FRAMES * 64
+DEFAULT_MAX_DIST = 16  # differing bits (of FP_BITS) still counted as the same footage; < 20 = exact band lookups
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int) -> np.ndarray:
+    k, x = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    d = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    d[0] /= np.sqrt(2.0)
+    return d.astype(np.float32)
+
+def phash(frames: np.ndarray) -> np.ndarray:
+    """(k, 32, 32) uint8 gray → (k,) uint64: sign of each 8x8 low DCT term against the frame's median."""
+    d = _dct_matrix(frames.shape[-1])[:8]
+    low = (d @ frames.astype(np.float32) @ d.T).reshape(len(frames), 64)
+    med = np.median(low[:, 1:], axis=1, keepdims=True)  # the DC term would skew the median
+    bits = np.packbits(low > med, axis=1)
+    return bits.view(">u8").astype(np.uint64).reshape(len(frames))
+
+if hasattr(np, "bitwise_count"):
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(a)
+else:  # NumPy < 2.0
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(a: np.ndarray) -> np.ndarray:
+        return _POP8[a[..., None].view(np.uint8)].sum(axis=-1, dtype=np.uint8)
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Differing bits between rows of (n, FP_FRAMES) uint64 fingerprints."""
+    return popcount(a ^ b).sum(axis=-1, dtype=np.int64)
+
+def clip_fingerprint(clip: Path, cache: ProbeCache, frames: int = FP_FRAMES) -> np.ndarray:
+    """
+    Decode `frames` evenly spaced 32x32 gray frames of a clip through one
+    ffmpeg pipe (fps filter at frames/duration) and hash them.
+    """
+    dur = probe_duration(cache.probe(clip))
+    if not dur:
+        raise RuntimeError(f"No duration for {clip}")
+    got = np.concatenate([b.copy() for b in
+                          frame_reader(clip, HASH_SIDE, HASH_SIDE, gray=True, fps=frames / dur, batch=frames + 2)])
+    if not len(got):
+        raise RuntimeError(f"No frames decoded from {clip}")
+    pick = np.rint(np.linspace(0, len(got) - 1, frames)).astype(np.int64)  # ±1 frame from fps rounding
+    return phash(got[pick])
+
+# ------------------------------------------------------------
+# Index (one .npz for the whole corpus) + near-duplicate clustering
+# ------------------------------------------------------------
+
+class FingerprintIndex:
+    """
+    Fingerprints of every clip seen so far, in the order they were added:
+    `paths`, file signature (`size`, `mtime_ns`) and `hashes` (n, FP_FRAMES)
+    uint64. 100k clips take about 5 MB on disk.
+    """
+
+    def __init__(self, path: Path = DEFAULT_INDEX):
+        self.path = path
+        self.paths: list[str] = []
+        self.sig = np.zeros((0, 2), dtype=np.int64)
+        self.hashes = np.zeros((0, FP_FRAMES), dtype=np.uint64)
+        if path.exists():
+            with np.load(path) as z:
+                self.paths = z["paths"].tolist()
+                self.sig, self.hashes = z["sig"], z["hashes"]
+        self._pos = {p: i for i, p in enumerate(self.paths)}
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def save(self) -> Path:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.stem}.part.npz")
+        with tmp.open("wb") as f:
+            np.savez(f, paths=np.array(self.paths, dtype=str), sig=self.sig, hashes=self.hashes)
+        os.replace(tmp, self.path)
+        return self.path
+
+    def stale(self, clips: Iterable[Path]) -> list[Path]:
+        """Clips not in the index, or changed on disk since they were hashed."""
+        out = []
+        for c in clips:
+            i = self._pos.get(str(c))
+            st = c.stat()
+            if i is None or tuple(self.sig[i]) != (st.st_size, st.st_mtime_ns):
+                out.append(c)
+        return out
+
+    def put(self, fps: dict[Path, np.ndarray]) -> None:
+        """Add or replace fingerprints; a replaced clip keeps its place (and so its seniority)."""
+        new_paths, new_sig, new_h = [], [], []
+        for c, h in fps.items():
+            st = c.stat()
+            i = self._pos.get(str(c))
+            if i is None:
+                self._pos[str(c)] = len(self.paths) + len(new_paths)
+                new_paths.append(str(c))
+                new_sig.append((st.st_size, st.st_mtime_ns))
+                new_h.append(h)
+            else:
+                self.sig[i], self.hashes[i] = (st.st_size, st.st_mtime_ns), h
+        if new_paths:
+            self.paths += new_paths
+            self.sig = np.concatenate([self.sig, np.array(new_sig, dtype=np.int64)])
+            self.hashes = np.concatenate([self.hashes, np.array(new_h, dtype=np.uint64)])
+
+    def drop(self, keep: np.ndarray) -> int:
+        """Keep only rows where `keep` is True; returns how many were dropped."""
+        dropped = int((~keep).sum())
+        if dropped:
+            self.paths = [p for p, k in zip(self.paths, keep.tolist()) if k]
+            self.sig, self.hashes = self.sig[keep], self.hashes[keep]
+            self._pos = {p: i for i, p in enumerate(self.paths)}
+        return dropped
+
+    def prune(self) -> int:
+        """Drop clips that no longer exist."""
+        return self.drop(np.array([Path(p).exists() for p in self.paths], dtype=bool))
+
+    def clusters(self, max_dist: int = DEFAULT_MAX_DIST) -> np.ndarray:
+        """Cluster label per clip (the index of its oldest member); see near_duplicate_labels."""
+        return near_duplicate_labels(self.hashes, max_dist)
+
+    def duplicates(self, max_dist: int = DEFAULT_MAX_DIST) -> dict[str, str]:
+        """Every clip that repeats older footage → the oldest clip of its cluster."""
+        labels = self.clusters(max_dist)
+        return {self.paths[i]: self.paths[j] for i, j in enumerate(labels.tolist()) if i != j}
+
+def _band_pairs(keys: np.ndarray, radius: int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """(i, j), i < j, whose 16-bit band keys differ in at most `radius` (0 or 1) bits; one batch per probe."""
+    order = np.argsort(keys, kind="stable")
+    count = np.bincount(keys, minlength=1 << 16)  # bucket table: a probe is a gather, not a search
+    first = np.cumsum(count) - count
+    for m in [0] + ([1 << b for b in range(16)] if radius else []):
+        q = keys ^ m
+        lo, cnt = first[q], count[q]
+        if not cnt.any():
+            continue
+        i = np.repeat(np.arange(len(keys)), cnt)
+        j = order[np.repeat(lo - np.cumsum(cnt) + cnt, cnt) + np.arange(cnt.sum())]
+        keep = i < j
+        yield i[keep], j[keep]
+
+def near_duplicate_labels(hashes: np.ndarray, max_dist: int = DEFAULT_MAX_DIST) -> np.ndarray:
+    """
+    Connected components of "fingerprints within `max_dist` bits", labelled
+    by their lowest row index, without comparing all pairs:
+      • identical fingerprints are collapsed first (np.unique)
+      • candidates come from multi-index hashing: the FP_BITS are cut into
+        16-bit bands, and two fingerprints within max_dist bits must agree
+        exactly on one band (max_dist < bands) or within one bit on one band
+        (max_dist < 2 × bands, probed with the 16 one-bit flips); each probe
+        is a lookup in a 2^16-bucket table, so the cost grows with n times
+        the bands plus the number of candidates
+      • candidates are verified with a vectorized popcount, and components
+        found by min-label propagation with pointer jumping
+    """
+    n = len(hashes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    uniq, first, inv = np.unique(hashes, axis=0, return_index=True, return_inverse=True)
+    inv = inv.reshape(-1)
+    bands = np.ascontiguousarray(uniq).view(np.uint16).astype(np.int64)
+    nb = bands.shape[1]
+    if max_dist >= 2 * nb:
+        raise ValueError(f"max_dist must be < {2 * nb} for {FP_BITS}-bit fingerprints")
+    radius = 0 if max_dist < nb else 1
+    labels = first.astype(np.int64)  # oldest clip with this exact fingerprint
+    pi, pj = [], []
+    for b in range(nb):
+        for i, j in _band_pairs(bands[:, b], radius):  # verified per probe to keep memory flat
+            ok = hamming(uniq[i], uniq[j]) <= max_dist
+            pi.append(i[ok])
+            pj.append(j[ok])
+    i, j = np.concatenate(pi), np.concatenate(pj)  # probe 0 always yields (each key finds itself)
+    if len(i):
+        pair = np.unique(i * len(uniq) + j)
+        i, j = pair // len(uniq), pair % len(uniq)
+        while True:
+            m = np.minimum(labels[i], labels[j])
+            new = labels.copy()
+            np.minimum.at(new, i, m)
+            np.minimum.at(new, j, m)
+            # pointer jumping: labels are row indices of the oldest clip, map them back to unique rows
+            new = np.minimum(new, new[inv[new]])
+            if np.array_equal(new, labels):
+                break
+            labels = new
+    return labels[inv]
+
+# ------------------------------------------------------------
+# Stage
+# ------------------------------------------------------------
+
+_index_lock = threading.Lock()  # batch runs review (and so this stage) for several sources at once
+
+@instrument.stage
+def fingerprint_clips(
+    clips: list[Path],
+    index_path: Path = DEFAULT_INDEX,
+    jobs: Optional[int] = None,
+    cache: Optional[ProbeCache] = None,
+    on_clip: Optional[Callable[[Path, Optional[str]], None]] = None,
+) -> FingerprintIndex:
+    """
+    Hash the clips that are new or changed since the last run (`jobs` ffmpeg
+    pipes at a time) and merge them into the corpus index at `index_path`.
+    Clips of the same folders that have disappeared are dropped from it.
+    `on_clip(path, error)` is called as each clip is hashed.
+    """
+    with _index_lock:
+        todo = FingerprintIndex(index_path).stale(clips)
+    fps: dict[Path, np.ndarray] = {}
+    if todo:
+        own_cache = cache is None
+        if own_cache:
+            cache = ProbeCache()
+        cache.probe_many(todo)  # durations in one batch; the workers then hit the cache
+        ex = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+        try:
+            futs = {instrument.submit(ex, clip_fingerprint, c, cache): c for c in todo}
+            for fut in as_completed(futs):
+                c = futs[fut]
+                try:
+                    fps[c] = fut.result()
+                    err = None
+                except RuntimeError as e:  # unreadable clip: leave it out of the index
+                    err = str(e)
+                if on_clip:
+                    on_clip(c, err)
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+            if own_cache:
+                cache.close()
+    with _index_lock:
+        idx = FingerprintIndex(index_path)  # re-read: another source may have saved meanwhile
+        idx.put(fps)
+        dirs, have = {str(c.parent) for c in clips}, {str(c) for c in clips}
+        idx.drop(np.array([str(Path(p).parent) not in dirs or p in have for p in idx.paths], dtype=bool))
+        idx.save()
+    return idx
@@ -0,0 +1,265 @@
+# src/dataprep/framecache.py
+from __future__ import annotations
+import hashlib, json, os, threading, time
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import numpy as np
+
+from .core import _ensure_dir
+from .framediff import RawFrameReader
+
+# ------------------------------------------------------------
+# Decoded analysis frames on disk: JSON header + raw uint8, memory-mapped
+# ------------------------------------------------------------
+
+DEFAULT_ROOT = Path("data/.cache/frames")
+DEFAULT_BUDGET_MB = 8192
+HEADER_BYTES = 4096       # frames start page-aligned after the header
+FORMAT = "wan21-frames/1"
+SUFFIX = ".frames"
+STALE_PART = 3600.0       # seconds before an unfinished .part (crashed run) is swept by evict()
+
+def _header(inp: Path, shape: tuple, gray: bool, fps: Optional[float]) -> bytes:
+    head = json.dumps({"format": FORMAT, "source": str(inp), "shape": list(shape), "dtype": "uint8",
+                       "pix_fmt": "gray" if gray else "rgb24", "fps": fps}).encode()
+    if len(head) >= HEADER_BYTES:
+        raise ValueError(f"Frame cache header too long for {inp}")
+    return head + b"\n" + b" " * (HEADER_BYTES - len(head) - 1)
+
+def read_frames(path: Path) -> Optional[np.ndarray]:
+    """
+    The frames of a cache file as a read-only (n, h, w[, 3]) uint8 memmap, or
+    None if it is missing, truncated or not a frame cache file.
+    """
+    try:
+        with path.open("rb") as f:
+            head = json.loads(f.read(HEADER_BYTES))
+            size = os.fstat(f.fileno()).st_size
+        if head.get("format") != FORMAT:
+            return None
+        shape = tuple(int(n) for n in head["shape"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if size != HEADER_BYTES + int(np.prod(shape)):
+        return None
+    if not shape[0]:
+        return np.zeros(shape, dtype=np.uint8)  # mmap cannot map zero bytes
+    try:
+        return np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_BYTES, shape=shape)
+    except (OSError, ValueError):
+        return None
+
+class FrameCache:
+    """
+    Low-res decodes of clips/sources, one file per (source, width x height,
+    gray/rgb24, fps) under `root`: a HEADER_BYTES JSON header then the frames
+    as raw uint8, which analyses read through np.memmap as zero-copy views.
+
+    Sources are identified by device/inode + size + mtime, so a clip that is
+    moved or hard-linked (keep/, reject/) still hits, and an edited one misses.
+    Once the files take more than `budget_mb`, the least recently used are
+    deleted; a single decode bigger than the whole budget is streamed and not
+    stored. Safe to share between threads and processes: entries appear with
+    an atomic rename, and a file deleted while mapped stays readable on POSIX.
+    """
+
+    def __init__(self, root: Path = DEFAULT_ROOT, budget_mb: float = DEFAULT_BUDGET_MB):
+        self.root = root
+        self.budget = int(budget_mb * 2**20)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, inp: Path, width: int, height: int, gray: bool = False, fps: Optional[float] = None) -> Path:
+        """Cache file for this rendition of `inp` (whether or not it exists yet)."""
+        st = inp.stat()
+        key = (f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:"
+               f"{width}x{height}:{'gray' if gray else 'rgb24'}:{fps or ''}")
+        return self.root / f"{hashlib.sha1(key.encode()).hexdigest()[:24]}{SUFFIX}"
+
+    def get(self, inp: Path, width: int, height: int, gray: bool = False,
+            fps: Optional[float] = None) -> Optional[np.ndarray]:
+        """Cached frames as a read-only memmap, or None (nothing is decoded)."""
+        p = self.path(inp, width, height, gray, fps)
+        arr = read_frames(p)
+        if arr is not None:
+            try:
+                os.utime(p)  # mtime = last use, for LRU eviction (atime is often off)
+            except OSError:
+                pass
+        return arr
+
+    def reader(self, inp: Path, width: int, height: int, gray: bool = False,
+               fps: Optional[float] = None, batch: int = 64) -> "CachedFrameReader":
+        return CachedFrameReader(self, inp, width, height, gray, fps, batch)
+
+    def _store(self, inp: Path, width: int, height: int, gray: bool, fps: Optional[float],
+               batches: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        """
+        Pass `batches` through while writing them to a .part file that is
+        renamed into place once they are exhausted; returns whether it was.
+        """
+        final = self.path(inp, width, height, gray, fps)
+        _ensure_dir(self.root)
+        tmp = final.with_name(f"{final.stem}.{os.getpid()}.{threading.get_ident()}.part")
+        f = tmp.open("wb")
+        f.seek(HEADER_BYTES)
+        written, n, done = 0, 0, False
+        try:
+            for b in batches:
+                if f is not None:
+                    written += b.nbytes
+                    if written > self.budget:  # would evict everything else: stream only
+                        f.close()
+                        tmp.unlink(missing_ok=True)
+                        f = None
+                    else:
+                        f.write(np.ascontiguousarray(b).data)
+                n += len(b)
+                yield b
+            done = True
+        finally:
+            if f is not None:
+                if done:
+                    f.seek(0)
+                    f.write(_header(inp, (n, height, width) + (() if gray else (3,)), gray, fps))
+                f.close()
+                if done:
+                    os.replace(tmp, final)
+                else:  # decode failed or the consumer stopped early
+                    tmp.unlink(missing_ok=True)
+        if f is None:
+            return False
+        self.evict(keep=final)
+        return True
+
+    def entries(self) -> list[tuple[Path, os.stat_result]]:
+        out = []
+        for p in self.root.glob(f"*{SUFFIX}"):
+            try:
+                out.append((p, p.stat()))
+            except OSError:  # evicted by another process meanwhile
+                pass
+        return out
+
+    def usage(self) -> tuple[int, int]:
+        """(entries, bytes on disk)."""
+        e = self.entries()
+        return len(e), sum(st.st_size for _, st in e)
+
+    def evict(self, budget: Optional[int] = None, keep: Optional[Path] = None) -> int:
+        """Delete least recently used entries until they fit `budget` bytes (default: self.budget)."""
+        budget = self.budget if budget is None else budget
+        removed = 0
+        with self._lock:
+            now = time.time()
+            for p in self.root.glob("*.part"):
+                try:
+                    if now - p.stat().st_mtime > STALE_PART:
+                        p.unlink()
+                except OSError:
+                    pass
+            e = sorted(self.entries(), key=lambda x: x[1].st_mtime)
+            total = sum(st.st_size for _, st in e)
+            for p, st in e:
+                if total <= budget:
+                    break
+                if p == keep:
+                    continue
+                try:
+                    p.unlink()
+                except OSError:  # still mapped on Windows: try again next time
+                    continue
+                total -= st.st_size
+                removed += 1
+        return removed
+
+    def clear(self) -> int:
+        return self.evict(budget=0)
+
+class CachedFrameReader:
+    """
+    Drop-in for RawFrameReader that reads through a FrameCache: batches are
+    slices of the cached memmap on a hit, or RawFrameReader's batches (written
+    to the cache as they go by) on a miss. `stored` tells whether the rendition
+    is in the cache after a complete pass.
+    """
+
+    def __init__(self, cache: FrameCache, inp: Path, width: int, height: int,
+                 gray: bool = False, fps: Optional[float] = None, batch: int = 64):
+        self.cache, self.inp = cache, inp
+        self.width, self.height, self.gray, self.fps = width, height, gray, fps
+        self.batch = max(1, batch)
+        self.frames_read = 0
+        self.stored = False
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        c = self.cache
+        arr = c.get(self.inp, self.width, self.height, self.gray, self.fps)
+        if arr is not None:
+            with c._lock:
+                c.hits += 1
+            self.stored = True
+            yield from self._count(arr[i:i + self.batch] for i in range(0, len(arr), self.batch))
+            return
+        with c._lock:
+            c.misses += 1
+        raw = RawFrameReader(self.inp, self.width, self.height, gray=self.gray, fps=self.fps, batch=self.batch)
+        self.stored = yield from c._store(self.inp, self.width, self.height, self.gray, self.fps, self._count(raw))
+
+    def _count(self, batches) -> Iterator[np.ndarray]:
+        for b in batches:
+            self.frames_read += len(b)
+            yield b
+
+# ------------------------------------------------------------
+# Process-wide cache (WAN21_DP_FRAME_CACHE_MB, 0 disables)
+# ------------------------------------------------------------
+
+_cache: Optional[FrameCache] = None
+_configured = False
+_cache_lock = threading.Lock()
+
+def _budget(value: Union[str, float, None], what: str) -> float:
+    try:
+        mb = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{what}: expected a size in MB, got {value!r}")
+    if mb < 0:
+        raise ValueError(f"{what}: size must be >= 0, got {value!r}")
+    return mb
+
+def frame_cache() -> Optional[FrameCache]:
+    """The shared frame cache, or None when it is disabled (budget 0)."""
+    global _cache, _configured
+    with _cache_lock:
+        if not _configured:
+            env = os.environ.get("WAN21_DP_FRAME_CACHE_MB")
+            mb = DEFAULT_BUDGET_MB if env in (None, "") else _budget(env, "WAN21_DP_FRAME_CACHE_MB")
+            _cache = FrameCache(DEFAULT_ROOT, mb) if mb else None
+            _configured = True
+        return _cache
+
+def configure(budget_mb: Optional[float] = None, root: Optional[Path] = None) -> Optional[FrameCache]:
+    """Replace the shared cache's budget and/or location (e.g. from CLI options) before stages start."""
+    global _cache, _configured
+    cur = frame_cache()
+    mb = (cur.budget / 2**20 if cur else 0) if budget_mb is None else _budget(budget_mb, "--frame-cache-mb")
+    with _cache_lock:
+        _cache = FrameCache(root or (cur.root if cur else DEFAULT_ROOT), mb) if mb else None
+        _configured = True
+        return _cache
+
+def frame_reader(inp: Path, width: int, height: int, gray: bool = False, fps: Optional[float] = None,
+                 batch: int = 64, frames_hint: Optional[float] = None) -> Union[RawFrameReader, CachedFrameReader]:
+    """
+    Batches of decoded frames, through the shared frame cache when it is
+    enabled. With `frames_hint` (expected frame count), a rendition that could
+    not fit the budget is decoded directly instead of being written in vain.
+    """
+    c = frame_cache()
+    if c is None or (frames_hint and frames_hint * width * height * (1 if gray else 3) > c.budget
+                     and c.get(inp, width, height, gray, fps) is None):
+        return RawFrameReader(inp, width, height, gray=gray, fps=fps, batch=batch)
+    return c.reader(inp, width, height, gray, fps, batch)
@@ -0,0 +1,301 @@
+# src/dataprep/framediff.py
+from __future__ import annotations
+import subprocess, time
+from fractions import Fraction
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Optional
+
+import numpy as np
+
+from . import instrument, procs
+from .core import _which, scene_csv_path, write_scene_csv
+from .config import load_scenedetect_config
+
+if TYPE_CHECKING:
+    from .probe import ProbeCache
+
+# ------------------------------------------------------------
+# Raw frame source: ffmpeg rawvideo pipe → preallocated ring of batches
+# ------------------------------------------------------------
+
+class RawFrameReader:
+    """
+    Decode `inp` with ffmpeg straight to raw rgb24 (or gray) at `width`x`height`
+    and yield frames in batches of up to `batch`. Batches are views into a
+    preallocated ring of `ring` slots filled with readinto(), so no per-frame
+    allocation happens; a yielded view stays valid for the next `ring - 1`
+    batches, copy it if you need it longer. `keyframes` decodes only the
+    keyframes (a quick look at a whole film); `cover` scales to cover
+    width x height and center-crops instead of stretching.
+    """
+
+    def __init__(self, inp: Path, width: int, height: int, gray: bool = False,
+                 fps: Optional[float] = None, batch: int = 64, ring: int = 2, keyframes: bool = False,
+                 cover: bool = False):
+        self.inp, self.width, self.height, self.gray = inp, width, height, gray
+        self.fps, self.batch, self.keyframes, self.cover = fps, max(1, batch), keyframes, cover
+        shape = (height, width) if gray else (height, width, 3)
+        self._buf = np.empty((max(2, ring), self.batch, *shape), dtype=np.uint8)
+        self.frame_bytes = int(np.prod(shape))
+        self.frames_read = 0
+
+    def _cmd(self) -> list[str]:
+        vf = f"scale={self.width}:{self.height}:flags=area"
+        if self.cover:
+            vf += f":force_original_aspect_ratio=increase,crop={self.width}:{self.height}"
+        if self.fps:
+            vf += f",fps={self.fps}"
+        return [_which("ffmpeg"), "-hide_banner", "-loglevel", "error", "-nostdin",
+                *(["-skip_frame", "nokey"] if self.keyframes else []), "-i", str(self.inp), "-an", "-sn", "-vf", vf,
+                "-fps_mode", "passthrough",  # no duplicated/dropped frames: indices = source frames
+                "-f", "rawvideo", "-pix_fmt", "gray" if self.gray else "rgb24", "-"]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        cmd = self._cmd()
+        # Holds one of the shared ffmpeg slots (procs) for as long as the consumer reads.
+        with procs.executor().popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    bufsize=self.frame_bytes * self.batch) as proc:
+            started, t0 = time.time(), time.perf_counter()
+            finished, rss = False, None
+            try:
+                slot = 0
+                while True:
+                    view = self._buf[slot]
+                    mv = memoryview(view.reshape(-1))
+                    got = 0
+                    while got < len(mv):
+                        n = proc.stdout.readinto(mv[got:])
+                        if not n:
+                            break
+                        got += n
+                    frames = got // self.frame_bytes
+                    rss = instrument.peak_rss_mb(proc.pid) or rss
+                    if frames:
+                        self.frames_read += frames
+                        yield view[:frames]
+                    if got < len(mv):
+                        break
+                    slot = (slot + 1) % len(self._buf)
+                finished = True
+            finally:
+                proc.stdout.close()
+                if not finished:  # consumer stopped early (or raised): don't decode the rest
+                    proc.kill()
+                err = proc.stderr.read().decode(errors="replace").strip()
+                proc.stderr.close()
+                rc = instrument.reap(proc, cmd, started, t0, rss_mb=rss)
+        if rc != 0:
+            raise RuntimeError(f"ffmpeg decode failed for {self.inp}: {err or rc}")
+
+# ------------------------------------------------------------
+# Vectorized features / frame-difference scores
+# ------------------------------------------------------------
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """uint8 RGB (..., 3) → float32 HSV on OpenCV's scale (H 0-180, S/V 0-255)."""
+    # Channel-wise maximum/minimum: reducing over a length-3 last axis is ~10x slower.
+    r8, g8, b8 = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    v8 = np.maximum(np.maximum(r8, g8), b8)
+    d = v8.astype(np.float32) - np.minimum(np.minimum(r8, g8), b8)
+    r, g, b = (c.astype(np.float32) for c in (r8, g8, b8))
+    v = v8.astype(np.float32)
+    dd = np.maximum(d, 1e-6)
+    s = d * 255.0 / np.maximum(v, 1e-6)
+    h = np.where(v8 == r8, (g - b) / dd, np.where(v8 == g8, 2.0 + (b - r) / dd, 4.0 + (r - g) / dd))
+    h = np.where(d > 0, (h * 30.0) % 180.0, 0.0)
+    return np.stack([h, s, v], axis=-1)
+
+def rgb_to_luma(rgb: np.ndarray) -> np.ndarray:
+    """uint8 RGB (..., 3) → float32 BT.601 luma; gray input passes through as float32."""
+    if rgb.ndim >= 3 and rgb.shape[-1] == 3:
+        return rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return rgb.astype(np.float32)
+
+METRICS = ("hsv", "luma", "hist")
+
+class FrameDiffDetector:
+    """
+    Content / adaptive cut detector over batches of frames (N,H,W,3 RGB or
+    N,H,W gray), with no per-frame Python work:
+      • metric="hsv"  → mean |ΔH|,|ΔS|,|ΔV| between neighbours (PySceneDetect content_val scale)
+      • metric="luma" → mean |ΔY| (what luma_only does)
+      • metric="hist" → 32-bin luma histogram L1 distance, in percent (0-100)
+    Content mode cuts where the score ≥ `threshold`. Adaptive mode cuts where
+    score / mean(score of `window_width` frames each side) ≥ `threshold` and
+    score ≥ `min_content_val`; decisions therefore lag `window_width` frames
+    and are emitted by a later update() or flush(). Cuts closer than
+    `min_scene_len` frames to the previous one are dropped.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, min_scene_len: int = 15,
+                 metric: str = "hsv", adaptive: bool = False, window_width: int = 2,
+                 min_content_val: float = 15.0, bins: int = 32):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+        self.metric, self.adaptive = metric, adaptive
+        self.threshold = float(threshold if threshold is not None else (3.0 if adaptive else 27.0))
+        self.min_scene_len = int(min_scene_len)
+        self.window = int(window_width)
+        self.min_content_val = float(min_content_val)
+        self.bins = int(bins)
+        self.frames = 0          # frames consumed so far
+        self.last_cut = 0
+        self._prev: Optional[np.ndarray] = None
+        # adaptive: scores of frames [tail_start, frames) still needed as window or undecided
+        self._tail = np.empty(0, dtype=np.float32)
+        self._tail_start = 0
+
+    # -- features ------------------------------------------------------
+
+    def features(self, frames: np.ndarray) -> np.ndarray:
+        """Per-frame feature arrays the score is a distance between."""
+        if self.metric == "hsv":
+            if frames.ndim != 4:
+                raise ValueError("metric='hsv' needs RGB frames (N,H,W,3)")
+            return rgb_to_hsv(frames)
+        y = rgb_to_luma(frames)
+        if self.metric == "luma":
+            return y
+        n = y.shape[0]
+        idx = np.minimum(y.reshape(n, -1) * (self.bins / 256.0), self.bins - 1).astype(np.int64)
+        idx += (np.arange(n, dtype=np.int64) * self.bins)[:, None]
+        hist = np.bincount(idx.ravel(), minlength=n * self.bins).reshape(n, self.bins)
+        return hist.astype(np.float32) / float(idx.shape[1])
+
+    def scores(self, frames: np.ndarray) -> np.ndarray:
+        """Score of each frame against its predecessor (0 for the very first frame)."""
+        feat = self.features(frames)
+        prev = feat[:1] if self._prev is None else self._prev
+        chain = np.concatenate([prev, feat], axis=0)
+        diff = np.abs(chain[1:] - chain[:-1])
+        self._prev = feat[-1:].copy()
+        if self.metric == "hist":
+            out = 50.0 * diff.sum(axis=1)
+        else:
+            out = diff.reshape(diff.shape[0], -1).mean(axis=1)
+        return out.astype(np.float32)
+
+    # -- decisions -----------------------------------------------------
+
+    def _accept(self, candidates: np.ndarray) -> list[int]:
+        cuts = []
+        for c in candidates.tolist():  # candidates only, not every frame
+            if c - self.last_cut >= self.min_scene_len:
+                cuts.append(c)
+                self.last_cut = c
+        return cuts
+
+    def update(self, frames: np.ndarray) -> list[int]:
+        """Feed the next batch; returns cut frame indices decided so far (ascending)."""
+        if len(frames) == 0:
+            return []
+        s = self.scores(frames)
+        first = self.frames
+        self.frames += len(s)
+        if not self.adaptive:
+            return self._accept(first + np.flatnonzero(s >= self.threshold))
+
+        w = self.window
+        tail = np.concatenate([self._tail, s])
+        # centres with w neighbours on both sides: tail[w : len-w]
+        n_dec = len(tail) - 2 * w
+        cuts: list[int] = []
+        if n_dec > 0:
+            csum = np.concatenate([[0.0], np.cumsum(tail, dtype=np.float64)])
+            centre = np.arange(w, w + n_dec)
+            around = (csum[centre + w + 1] - csum[centre - w]) - tail[centre]
+            avg = around / (2 * w) if w else np.zeros(n_dec)
+            score = tail[centre]
+            ratio = np.where(avg > 0, score / np.maximum(avg, 1e-9),
+                             np.where(score >= self.min_content_val, 255.0, 0.0))
+            hit = (ratio >= self.threshold) & (score >= self.min_content_val)
+            # frame index of tail[i] is tail_start + i; the first frame overall never cuts
+            idx = self._tail_start + centre[hit]
+            cuts = self._accept(idx[idx > 0])
+            keep_from = n_dec  # keep last 2w scores: w as history + w undecided
+            self._tail = tail[keep_from:].copy()
+            self._tail_start += keep_from
+        else:
+            self._tail = tail
+        return cuts
+
+    def flush(self) -> list[int]:
+        """
+        End of stream. The last `window_width` frames have no right-hand
+        window and stay undecided (same as PySceneDetect's adaptive detector).
+        """
+        return []
+
+    def detect(self, batches) -> list[int]:
+        """Run over an iterable of frame batches and return all cuts."""
+        cuts: list[int] = []
+        for b in batches:
+            cuts += self.update(b)
+        return cuts + self.flush()
+
+# ------------------------------------------------------------
+# Pipeline entry point
+# ------------------------------------------------------------
+
+def _rate(s: str) -> float:
+    try:
+        return float(Fraction(s))
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+@instrument.stage
+def detect_scenes_numpy(
+    inp: Path,
+    outdir: Optional[Path] = None,
+    mode: str = "adaptive",
+    threshold: Optional[float] = None,
+    cfg: Optional[dict] = None,
+    metric: Optional[str] = None,
+    batch_mb: int = 64,
+    cache: Optional[ProbeCache] = None,
+) -> Path:
+    """
+    Detect scenes with FrameDiffDetector on frames decoded by ffmpeg at
+    1/downscale_factor resolution. Honors threshold / min_scene_len (and
+    luma_only → metric="luma") from configs/scenedetect.yaml; kernel_size only
+    applies to PySceneDetect's edge term and is ignored here. Frames go through
+    the shared frame cache, so re-running with another threshold or mode does
+    not decode the source again. Writes the same <movie>-Scenes.csv as
+    detect_scenes().
+    """
+    from .framecache import frame_reader
+    from .probe import ProbeCache, probe_duration
+
+    cfg = load_scenedetect_config() if cfg is None else cfg
+    sec = cfg.get(f"detect_{mode}") or cfg.get("detect_content") or {}
+    own_cache = cache is None
+    if own_cache:
+        cache = ProbeCache()
+    try:
+        info = cache.probe(inp)
+    finally:
+        if own_cache:
+            cache.close()
+    v = next(s for s in info.get("streams", []) if s.get("codec_type") == "video")
+    fps = _rate(v.get("avg_frame_rate", "0/0")) or _rate(v.get("r_frame_rate", "0/0")) or 25.0
+
+    factor = max(1, int(sec.get("downscale_factor") or 1))
+    width, height = max(2, int(v["width"]) // factor // 2 * 2), max(2, int(v["height"]) // factor // 2 * 2)
+    metric = metric or ("luma" if sec.get("luma_only") else "hsv")
+    gray = metric != "hsv"
+
+    if mode == "adaptive":
+        thr = threshold if threshold is not None else sec.get("adaptive_threshold")
+        det = FrameDiffDetector(thr, int(sec.get("min_scene_len", 15)), metric, adaptive=True,
+                                window_width=int(sec.get("window_width", 2)),
+                                min_content_val=float(sec.get("min_content_val", 15.0)))
+    else:
+        thr = threshold if threshold is not None else sec.get("threshold")
+        det = FrameDiffDetector(thr, int(sec.get("min_scene_len", 15)), metric)
+
+    frame_bytes = width * height * (1 if gray else 3)
+    reader = frame_reader(inp, width, height, gray=gray,
+                          batch=max(1, batch_mb * 2**20 // frame_bytes // 8),
+                          frames_hint=(probe_duration(info) or 0) * fps)
+    cuts = det.detect(reader)
+    return write_scene_csv(scene_csv_path(inp, outdir), cuts, reader.frames_read, fps)
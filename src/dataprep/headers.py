@@ -0,0 +1,283 @@
+# src/dataprep/headers.py
+from __future__ import annotations
+import struct
+from fractions import Fraction
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+# ------------------------------------------------------------
+# Container headers without ffprobe (Matroska/WebM, MP4/MOV)
+# ------------------------------------------------------------
+#
+# read_header() returns the subset of `ffprobe -show_streams -show_format`
+# JSON this package reads (format.duration/format_name, and per stream
+# codec_type, codec_name, width/height, r_frame_rate/avg_frame_rate,
+# sample_rate/channels), marked "probed_by": "header". Anything it cannot
+# vouch for (unknown-size segments without a Duration, fragmented MP4,
+# video without a frame rate, ...) returns None so the caller falls back
+# to ffprobe.
+
+HEAD_BYTES = 64 * 1024        # first read; Info/Tracks of muxer-written MKVs sit well inside
+MAX_ELEMENT = 16 * 2**20      # larger Info/Tracks/moov than this is not a header we want to parse
+
+def read_header(path: Path) -> Optional[dict]:
+    """ffprobe-shaped header info for an .mkv/.webm/.mp4/.mov file, or None (use ffprobe)."""
+    try:
+        with path.open("rb") as f:
+            head = f.read(HEAD_BYTES)
+            if head[:4] == b"\x1a\x45\xdf\xa3":
+                return _mkv(f, head)
+            if head[4:8] in (b"ftyp", b"moov", b"free", b"wide", b"mdat", b"skip"):
+                return _mp4(f, head)
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+def _rate(fps: Fraction) -> str:
+    return f"{fps.numerator}/{fps.denominator}"
+
+def _info(format_name: str, duration: float, size: int, streams: list[dict]) -> Optional[dict]:
+    video = [s for s in streams if s["codec_type"] == "video"]
+    if not duration or duration <= 0 or not video:
+        return None
+    if any(not s.get("width") or not s.get("height") or "r_frame_rate" not in s for s in video):
+        return None
+    for i, s in enumerate(streams):
+        s["index"] = i
+    return {"format": {"format_name": format_name, "duration": f"{duration:.6f}", "size": str(size),
+                       "nb_streams": len(streams)},
+            "streams": streams, "probed_by": "header"}
+
+# ------------------------------------------------------------
+# Matroska (EBML)
+# ------------------------------------------------------------
+
+_SEGMENT, _SEEKHEAD, _INFO, _TRACKS, _CLUSTER = 0x18538067, 0x114D9B74, 0x1549A966, 0x1654AE6B, 0x1F43B675
+
+_MKV_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP8": "vp8", "V_VP9": "vp9",
+    "V_MPEG2": "mpeg2video", "V_MPEG1": "mpeg1video", "V_MPEG4/ISO/ASP": "mpeg4", "V_MJPEG": "mjpeg",
+    "V_PRORES": "prores", "V_FFV1": "ffv1", "V_UNCOMPRESSED": "rawvideo", "V_THEORA": "theora",
+    "A_AAC": "aac", "A_AC3": "ac3", "A_EAC3": "eac3", "A_DTS": "dts", "A_OPUS": "opus", "A_VORBIS": "vorbis",
+    "A_FLAC": "flac", "A_MPEG/L3": "mp3", "A_MPEG/L2": "mp2", "A_TRUEHD": "truehd", "A_ALAC": "alac",
+    "S_TEXT/UTF8": "subrip", "S_TEXT/ASS": "ass", "S_TEXT/SSA": "ssa", "S_TEXT/WEBVTT": "webvtt",
+    "S_HDMV/PGS": "hdmv_pgs_subtitle", "S_VOBSUB": "dvd_subtitle",
+}
+_MKV_TYPES = {1: "video", 2: "audio", 17: "subtitle"}
+
+def _ebml_id(buf: bytes, pos: int) -> tuple[int, int]:
+    n = 9 - buf[pos].bit_length()
+    if n > 4:
+        raise ValueError("bad EBML id")
+    return int.from_bytes(buf[pos:pos + n], "big"), pos + n
+
+def _ebml_size(buf: bytes, pos: int) -> tuple[Optional[int], int]:
+    n = 9 - buf[pos].bit_length()
+    if n > 8:
+        raise ValueError("bad EBML size")
+    v = int.from_bytes(buf[pos:pos + n], "big") & ((1 << (7 * n)) - 1)
+    if pos + n > len(buf):
+        raise IndexError("truncated EBML size")
+    return (None if v == (1 << (7 * n)) - 1 else v), pos + n  # all ones: unknown size
+
+def _elements(buf: bytes, pos: int, end: int) -> Iterator[tuple[int, int, int]]:
+    """(id, data start, data end) of the elements in buf[pos:end]; data may run past the buffer."""
+    while pos < end and pos < len(buf) - 1:
+        eid, p = _ebml_id(buf, pos)
+        size, p = _ebml_size(buf, p)
+        stop = end if size is None else p + size
+        yield eid, p, stop
+        pos = stop
+
+def _uint(b: bytes) -> int:
+    return int.from_bytes(b, "big")
+
+def _float(b: bytes) -> float:
+    return struct.unpack(">f" if len(b) == 4 else ">d", b)[0] if b else 0.0
+
+def _mkv(f: BinaryIO, head: bytes) -> Optional[dict]:
+    _, p, stop = next(_elements(head, 0, len(head)))  # EBML header
+    doc = {eid: head[a:b] for eid, a, b in _elements(head, p, stop)}.get(0x4282, b"matroska")
+    if doc not in (b"matroska", b"webm"):
+        return None
+    eid, seg, seg_end = next(_elements(head, stop, len(head)))
+    if eid != _SEGMENT:
+        return None
+    f.seek(0, 2)
+    size = f.tell()
+    found: dict[int, bytes] = {}
+    seek: dict[int, int] = {}
+    for eid, a, b in _elements(head, seg, min(seg_end, size)):
+        if eid == _CLUSTER or b > len(head) and eid not in (_INFO, _TRACKS):
+            break
+        if eid in (_INFO, _TRACKS, _SEEKHEAD):
+            if b - a > MAX_ELEMENT:
+                return None
+            data = head[a:b] if b <= len(head) else _read_at(f, a, b - a)
+            if eid == _SEEKHEAD:
+                for sid, sa, sb in _elements(data, 0, len(data)):
+                    if sid == 0x4DBB:  # Seek
+                        kv = {k: data[ka:kb] for k, ka, kb in _elements(data, sa, sb)}
+                        if 0x53AB in kv and 0x53AC in kv:
+                            seek[_uint(kv[0x53AB])] = _uint(kv[0x53AC])
+            else:
+                found[eid] = data
+        if _INFO in found and _TRACKS in found:
+            break
+    for eid in (_INFO, _TRACKS):  # after the clusters (e.g. written on close): follow the SeekHead
+        if eid not in found and eid in seek:
+            pos = seg + seek[eid]
+            hdr = _read_at(f, pos, 16)
+            got, p = _ebml_id(hdr, 0)
+            n, p = _ebml_size(hdr, p)
+            if got != eid or n is None or n > MAX_ELEMENT:
+                return None
+            found[eid] = _read_at(f, pos + p, n)
+    if _INFO not in found or _TRACKS not in found:
+        return None
+
+    info = {eid: found[_INFO][a:b] for eid, a, b in _elements(found[_INFO], 0, len(found[_INFO]))}
+    scale = _uint(info[0x2AD7B1]) if 0x2AD7B1 in info else 1_000_000
+    duration = _float(info.get(0x4489, b"")) * scale / 1e9
+    streams = []
+    tracks = found[_TRACKS]
+    for eid, a, b in _elements(tracks, 0, len(tracks)):
+        if eid != 0xAE:  # TrackEntry
+            continue
+        t = {k: tracks[ka:kb] for k, ka, kb in _elements(tracks, a, b)}
+        kind = _MKV_TYPES.get(_uint(t.get(0x83, b"")))
+        if kind is None:
+            continue
+        codec_id = t.get(0x86, b"").decode("ascii", "replace")
+        s = {"codec_type": kind, "codec_name": _MKV_CODECS.get(codec_id, codec_id.lower())}
+        if kind == "video":
+            v = {k: t[0xE0][ka:kb] for k, ka, kb in _elements(t.get(0xE0, b""), 0, len(t.get(0xE0, b"")))}
+            s["width"], s["height"] = _uint(v.get(0xB0, b"")), _uint(v.get(0xBA, b""))
+            frame_ns = _uint(t.get(0x23E383, b""))  # DefaultDuration
+            if frame_ns:
+                s["r_frame_rate"] = s["avg_frame_rate"] = _rate(Fraction(10**9, frame_ns).limit_denominator(1001))
+        elif kind == "audio":
+            au = {k: t[0xE1][ka:kb] for k, ka, kb in _elements(t.get(0xE1, b""), 0, len(t.get(0xE1, b"")))}
+            s["sample_rate"] = str(int(_float(au.get(0xB5, b"")) or 8000))
+            s["channels"] = _uint(au.get(0x9F, b"\x01"))
+        streams.append(s)
+    return _info("matroska,webm", duration, size, streams)
+
+def _read_at(f: BinaryIO, pos: int, n: int) -> bytes:
+    f.seek(pos)
+    data = f.read(n)
+    if len(data) < n:
+        raise ValueError("truncated element")
+    return data
+
+# ------------------------------------------------------------
+# MP4 / QuickTime (ISO BMFF boxes)
+# ------------------------------------------------------------
+
+_MP4_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hev1": "hevc", "hvc1": "hevc", "vp09": "vp9", "av01": "av1",
+    "mp4v": "mpeg4", "jpeg": "mjpeg", "mjpa": "mjpeg", "apch": "prores", "apcn": "prores", "apcs": "prores",
+    "apco": "prores", "ap4h": "prores", "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus",
+    "fLaC": "flac", ".mp3": "mp3", "alac": "alac", "tx3g": "mov_text", "wvtt": "webvtt",
+}
+_MP4_TYPES = {b"vide": "video", b"soun": "audio", b"subt": "subtitle", b"text": "subtitle", b"sbtl": "subtitle"}
+
+def _boxes(buf: bytes, pos: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """(type, data start, data end) of the boxes in buf[pos:end]."""
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        p = pos + 8
+        if size == 1:
+            size = struct.unpack_from(">Q", buf, p)[0]
+            p += 8
+        elif size == 0:
+            size = end - pos
+        if size < p - pos:
+            raise ValueError("bad box size")
+        yield kind, p, min(pos + size, end)
+        pos += size
+
+def _child(buf: bytes, a: int, b: int, *path: bytes) -> Optional[tuple[int, int]]:
+    for kind in path:
+        for k, ca, cb in _boxes(buf, a, b):
+            if k == kind:
+                a, b = ca, cb
+                break
+        else:
+            return None
+    return a, b
+
+def _mp4(f: BinaryIO, head: bytes) -> Optional[dict]:
+    f.seek(0, 2)
+    size = f.tell()
+    pos, moov = 0, None
+    while pos + 8 <= size:  # top-level walk: moov may follow a large mdat
+        hdr = head[pos:pos + 16] if pos + 16 <= len(head) else _read_at(f, pos, min(16, size - pos))
+        n, kind = struct.unpack_from(">I4s", hdr)
+        p = 8
+        if n == 1:
+            n, p = struct.unpack_from(">Q", hdr, 8)[0], 16
+        elif n == 0:
+            n = size - pos
+        if n < p:
+            return None
+        if kind == b"moov":
+            if n > MAX_ELEMENT:
+                return None
+            moov = head[pos + p:pos + n] if pos + n <= len(head) else _read_at(f, pos + p, n - p)
+            break
+        pos += n
+    if moov is None:
+        return None
+
+    mvhd = _child(moov, 0, len(moov), b"mvhd")
+    if mvhd is None:
+        return None
+    a = mvhd[0]
+    if moov[a] == 1:
+        timescale, dur = struct.unpack_from(">IQ", moov, a + 20)
+    else:
+        timescale, dur = struct.unpack_from(">II", moov, a + 12)
+    if _child(moov, 0, len(moov), b"mvex") is not None or not timescale or dur in (0, 0xFFFFFFFF):
+        return None  # fragmented: the real duration is in the fragments
+    streams = []
+    for kind, ta, tb in _boxes(moov, 0, len(moov)):
+        if kind != b"trak":
+            continue
+        hdlr = _child(moov, ta, tb, b"mdia", b"hdlr")
+        mdhd = _child(moov, ta, tb, b"mdia", b"mdhd")
+        stbl = _child(moov, ta, tb, b"mdia", b"minf", b"stbl")
+        if hdlr is None or mdhd is None or stbl is None:
+            continue
+        ctype = _MP4_TYPES.get(moov[hdlr[0] + 8:hdlr[0] + 12])
+        if ctype is None:
+            continue
+        m = mdhd[0]
+        if moov[m] == 1:
+            tscale, tdur = struct.unpack_from(">IQ", moov, m + 20)
+        else:
+            tscale, tdur = struct.unpack_from(">II", moov, m + 12)
+        stsd = _child(moov, *stbl, b"stsd")
+        if stsd is None:
+            continue
+        e = stsd[0] + 8  # version/flags + entry_count → first sample entry
+        fourcc = moov[e + 4:e + 8].decode("latin-1")
+        s = {"codec_type": ctype, "codec_name": _MP4_CODECS.get(fourcc, fourcc.strip().lower())}
+        if ctype == "video":
+            s["width"], s["height"] = struct.unpack_from(">HH", moov, e + 8 + 24)
+            stts = _child(moov, *stbl, b"stts")
+            if stts is not None and tscale and tdur:
+                n = struct.unpack_from(">I", moov, stts[0] + 4)[0]
+                entries = struct.unpack_from(f">{2 * n}I", moov, stts[0] + 8)
+                counts, deltas = entries[0::2], entries[1::2]
+                frames = sum(counts)
+                if frames and max(deltas):
+                    common = max(zip(counts, deltas))[1]  # ffprobe's r_frame_rate: the dominant frame duration
+                    s["r_frame_rate"] = _rate(Fraction(tscale, common or max(deltas)))
+                    s["avg_frame_rate"] = _rate(Fraction(frames * tscale, tdur))
+        elif ctype == "audio":
+            channels, = struct.unpack_from(">H", moov, e + 8 + 16)
+            rate, = struct.unpack_from(">I", moov, e + 8 + 24)
+            s["sample_rate"], s["channels"] = str(rate >> 16), channels
+        streams.append(s)
+    return _info("mov,mp4,m4a,3gp,3g2,mj2", dur / timescale, size, streams)
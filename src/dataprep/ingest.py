@@ -0,0 +1,429 @@
+# src/dataprep/ingest.py
+from __future__ import annotations
+import ctypes, ctypes.util, json, os, select, sqlite3, struct, sys, threading, time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+
+from .core import _ensure_dir
+from .jobqueue import DEFAULT_QUEUE, Heartbeat, Job, JobQueue, worker_id
+from .pipeline import DEFAULT_STATE, SOURCE_EXTS, Log, Manifest, RunSettings, process_source
+
+# ------------------------------------------------------------
+# Source index: only folders whose mtime changed are listed again
+# ------------------------------------------------------------
+
+DEFAULT_INDEX = Path("data/.state/sources.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path     TEXT PRIMARY KEY,
+    parent   TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    dir      TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    settled  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+"""
+
+def _is_source(name: str) -> bool:
+    return name.lower().endswith(SOURCE_EXTS)
+
+def _under(top: str) -> tuple[str, int, str]:
+    """SQL args for "`top` or below it" (substr, not LIKE: paths may hold _ and %)."""
+    prefix = top.rstrip(os.sep) + os.sep
+    return top, len(prefix), prefix
+
+class SourceIndex:
+    """
+    Every .mkv/.mp4 under the watched roots with its size/mtime, plus each
+    folder's mtime. rescan() lists only folders whose mtime moved (an entry
+    was added, removed or renamed); elsewhere it stats the sources it already
+    knows, so a restart costs a stat per folder and per source instead of
+    listing every file of the tree (MakeMKV backups, subtitles, extras).
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_INDEX):
+        _ensure_dir(db_path.parent)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> "SourceIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def rescan(self, root: Path, full: bool = False) -> list[Path]:
+        """Sources under `root` that are new, changed, or not settled yet."""
+        top = str(root)
+        under = _under(top)
+        with self._lock:
+            dirs = {p: (parent, m) for p, parent, m in self._db.execute(
+                "SELECT path, parent, mtime_ns FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", under)}
+            files: dict[str, dict[str, tuple]] = {}
+            for p, d, size, m, settled in self._db.execute(
+                    "SELECT path, dir, size, mtime_ns, settled FROM files "
+                    "WHERE dir = ? OR substr(dir, 1, ?) = ?", under):
+                files.setdefault(d, {})[p] = (size, m, settled)
+        children: dict[str, list[str]] = {}
+        for p, (parent, _) in dirs.items():
+            children.setdefault(parent, []).append(p)
+
+        changed, seen = [], set()
+        dir_rows, file_rows, gone = [], [], []
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(d)
+            old = files.get(d, {})
+            if full or d not in dirs or dirs[d][1] != mtime:
+                subdirs, now = [], {}
+                try:
+                    with os.scandir(d) as it:
+                        for e in it:
+                            try:
+                                if e.is_dir():
+                                    subdirs.append(e.path)
+                                elif _is_source(e.name) and e.is_file():
+                                    st = e.stat()
+                                    now[e.path] = (st.st_size, st.st_mtime_ns)
+                            except OSError:  # vanished mid-listing
+                                pass
+                except OSError:
+                    continue
+                dir_rows.append((d, os.path.dirname(d) if d != top else None, mtime))
+                gone += [p for p in old if p not in now]
+                for p, sig in now.items():
+                    o = old.get(p)
+                    if o is None or o[:2] != sig or not o[2]:
+                        changed.append(Path(p))
+                        file_rows.append((p, d, *sig))
+                stack += subdirs
+            else:  # same entries: stat the known sources (a re-rip may overwrite in place)
+                for p, o in old.items():
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        gone.append(p)
+                        continue
+                    sig = (st.st_size, st.st_mtime_ns)
+                    if o[:2] != sig or not o[2]:
+                        changed.append(Path(p))
+                        file_rows.append((p, d, *sig))
+                stack += children.get(d, [])
+        gone_dirs = [p for p in dirs if p not in seen]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)", dir_rows)
+            self._db.executemany("INSERT OR REPLACE INTO files (path, dir, size, mtime_ns, settled) "
+                                 "VALUES (?, ?, ?, ?, 0)", file_rows)
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+            self._db.executemany("DELETE FROM dirs WHERE path = ?", [(p,) for p in gone_dirs])
+            self._db.executemany("DELETE FROM files WHERE dir = ?", [(p,) for p in gone_dirs])
+        return changed
+
+    def settle(self, path: Path, sig: tuple[int, int]) -> None:
+        """Record `path` as completely written at `sig` (size, mtime_ns)."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO files (path, dir, size, mtime_ns, settled) VALUES (?, ?, ?, ?, 1)",
+                             (str(path), str(path.parent), *sig))
+
+    def forget(self, path: Path) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE path = ?", (str(path),))
+
+    def latest(self, root: Path, exts: tuple[str, ...] = SOURCE_EXTS) -> Optional[Path]:
+        """Newest indexed file under `root` with one of `exts` (after rescan())."""
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM files WHERE dir = ? OR substr(dir, 1, ?) = ? "
+                                    "ORDER BY mtime_ns DESC", _under(str(root)))
+            return next((Path(p) for (p,) in rows if p.lower().endswith(exts)), None)
+
+# ------------------------------------------------------------
+# Debounce: a rip is done once its size/mtime held still for `settle` s
+# ------------------------------------------------------------
+
+def _openable(path: Path) -> bool:
+    try:
+        with path.open("rb"):
+            return True
+    except OSError:  # Windows: still locked by the ripper
+        return False
+
+class Settler:
+    """
+    Files waiting to be complete. touch(path, sig) records a change seen
+    now: with the (size, mtime_ns) observed by a scan, the file is ready once
+    a stat `settle` seconds later still shows that sig; with sig=None (an
+    inotify event, so the writer is local and reports every write) it is
+    ready once no event came for `settle` seconds.
+    """
+
+    def __init__(self, settle: float):
+        self.settle = settle
+        self.pending: dict[Path, tuple[Optional[tuple[int, int]], float]] = {}
+
+    def touch(self, path: Path, sig: Optional[tuple[int, int]] = None) -> None:
+        self.pending[path] = (sig, time.monotonic())
+
+    def forget(self, path: Path) -> None:
+        self.pending.pop(path, None)
+
+    def next_due(self) -> float:
+        return min((t for _, t in self.pending.values()), default=float("inf")) + self.settle
+
+    def ready(self) -> list[tuple[Path, tuple[int, int]]]:
+        now, out = time.monotonic(), []
+        for p, (sig, since) in list(self.pending.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                del self.pending[p]
+                continue
+            cur = (st.st_size, st.st_mtime_ns)
+            if (sig is not None and cur != sig) or not _openable(p):
+                self.pending[p] = (cur, now)  # still growing: wait another quiet period
+                continue
+            del self.pending[p]
+            out.append((p, cur))
+        return out
+
+# ------------------------------------------------------------
+# inotify (Linux, through libc) — anything else falls back to polling
+# ------------------------------------------------------------
+
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x2, 0x8, 0x40, 0x80
+IN_CREATE, IN_DELETE, IN_DELETE_SELF = 0x100, 0x200, 0x400
+IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+class Inotify:
+    """Folder watches on one inotify descriptor; raises OSError where inotify is unavailable."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify needs Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes, self._add.restype = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32], ctypes.c_int
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs: dict[int, str] = {}
+
+    def watch_tree(self, root: str) -> None:
+        """Watch `root` and every folder below it (ENOSPC: raise fs.inotify.max_user_watches)."""
+        for d, _, _ in os.walk(root):
+            wd = self._add(self.fd, os.fsencode(d), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err), d)
+            self.dirs[wd] = d
+
+    def read(self, timeout: float) -> list[tuple[str, int]]:
+        """(path, mask) events within `timeout` seconds; ("", IN_Q_OVERFLOW) when events were lost."""
+        if not select.select([self.fd], [], [], max(0.0, timeout))[0]:
+            return []
+        try:
+            buf = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        out, i = [], 0
+        while i + _EVENT.size <= len(buf):
+            wd, mask, _, n = _EVENT.unpack_from(buf, i)
+            name = buf[i + _EVENT.size: i + _EVENT.size + n].rstrip(b"\0")
+            i += _EVENT.size + n
+            if mask & IN_Q_OVERFLOW:
+                out.append(("", mask))
+            elif mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+            elif wd in self.dirs:
+                out.append((os.path.join(self.dirs[wd], os.fsdecode(name)) if name else self.dirs[wd], mask))
+        return out
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+# ------------------------------------------------------------
+# Daemon: watch → settle → queue → bounded workers → process_source
+# ------------------------------------------------------------
+
+SOURCE_JOB = "source"
+DEFAULT_SETTLE = 60.0    # seconds a rip must stay unchanged before it is queued
+DEFAULT_POLL = 10.0      # polling rescan interval without inotify
+EVENT_RESCAN = 60.0      # rescan interval with inotify (catches writes over SMB/NFS, which send no events)
+
+class IngestDaemon:
+    """
+    Watch `s.sources_dir` and run detect → split → review on every source
+    once it has finished writing. Sources are queued in a persistent JobQueue
+    (kind "source", keyed by path, payload = size/mtime, so a re-rip is queued
+    again) and taken by `workers` threads; a daemon restarted after a crash
+    picks up queued jobs and, once their lease lapses, the ones that were
+    running. Failed sources are retried with backoff (see JobQueue).
+    """
+
+    def __init__(self, s: RunSettings, cfg: dict, workers: int = 1,
+                 settle: float = DEFAULT_SETTLE, poll: float = DEFAULT_POLL, inotify: bool = True,
+                 state: Path = DEFAULT_STATE, queue: Path = DEFAULT_QUEUE, index: Path = DEFAULT_INDEX,
+                 log: Optional[Log] = None):
+        self.s, self.cfg = s, cfg
+        self.workers, self.poll, self.use_inotify = max(1, workers), poll, inotify
+        self.settler = Settler(settle)
+        self.m = Manifest(state)
+        self.m.data["settings"] = json.loads(json.dumps(asdict(s), default=str))
+        self.queue, self.index = JobQueue(queue), SourceIndex(index)
+        self.log = log or (lambda msg: None)
+        self._wake = threading.Event()
+
+    def close(self) -> None:
+        self.queue.close()
+        self.index.close()
+
+    # -- workers ---------------------------------------------------------
+
+    def _work(self, n: int, stop: threading.Event) -> None:
+        wid = worker_id(f"ingest-{n}")
+        while not stop.is_set():
+            job = self.queue.lease(wid, [SOURCE_JOB])
+            if job is None:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                continue
+            self._run(job, stop)
+
+    def _run(self, job: Job, stop: threading.Event) -> None:
+        src = Path(job.payload["path"])
+        if not src.exists():
+            self.queue.fail(job, f"{src} no longer exists", retry=False)
+            return
+        self.log(f"[ingest] processing {src} (attempt {job.attempts}/{job.max_attempts})")
+        with Heartbeat(self.queue, job) as hb:
+            out = process_source(src, self.s, self.m, self.cfg, log=self.log)
+        if hb.lost:
+            self.log(f"[ingest] lease on {src} was taken over; result dropped")
+        elif out.ok:
+            self.queue.complete(job, {"stages": out.stages})
+        elif stop.is_set():  # interrupted, not broken: back to the queue without using an attempt
+            self.queue.release(job)
+        else:
+            state = self.queue.fail(job, out.error or "failed")
+            self.log(f"[ingest] {src}: {'will retry' if state == 'queued' else state}")
+
+    # -- watcher ---------------------------------------------------------
+
+    def _enqueue(self) -> None:
+        for p, sig in self.settler.ready():
+            self.index.settle(p, sig)
+            if self.queue.put(SOURCE_JOB, str(p), {"path": str(p), "size": sig[0], "mtime_ns": sig[1]}):
+                self.log(f"[ingest] queued {p}")
+                self._wake.set()
+
+    def _scan(self, full: bool = False) -> None:
+        for p in self.index.rescan(self.s.sources_dir, full):
+            if p not in self.settler.pending:
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                self.settler.touch(p, (st.st_size, st.st_mtime_ns))
+
+    def _events(self, ino: Inotify, timeout: float) -> int:
+        """Apply inotify events; 1 when folders changed (rescan), 2 when events were lost (full rescan)."""
+        rescan = 0
+        for path, mask in ino.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                rescan = 2
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        ino.watch_tree(path)
+                    except OSError as e:  # gone again, or out of watches: the periodic rescan still sees it
+                        self.log(f"[ingest] cannot watch {path} ({e})")
+                rescan = max(rescan, 1)
+            elif _is_source(path):
+                p = Path(path)
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.settler.forget(p)
+                    self.index.forget(p)
+                else:
+                    self.settler.touch(p)
+        return rescan
+
+    def _open_inotify(self) -> Optional[Inotify]:
+        if not self.use_inotify:
+            return None
+        try:
+            ino = Inotify()
+        except OSError as e:
+            self.log(f"[ingest] inotify unavailable ({e}); polling every {self.poll:g}s")
+            return None
+        try:
+            ino.watch_tree(str(self.s.sources_dir))
+        except OSError as e:
+            ino.close()
+            self.log(f"[ingest] cannot watch {self.s.sources_dir} ({e}); polling every {self.poll:g}s")
+            return None
+        return ino
+
+    def _idle(self) -> bool:
+        c = self.queue.counts(SOURCE_JOB)
+        return not self.settler.pending and c["running"] == 0 and self.queue.due(SOURCE_JOB) == 0
+
+    def run(self, stop: Optional[threading.Event] = None, once: bool = False) -> None:
+        """
+        Watch until `stop` is set (or Ctrl-C). With `once`, return as soon as
+        every source found has settled and the queue has nothing due.
+        """
+        stop = stop or threading.Event()
+        _ensure_dir(self.s.sources_dir)
+        ino = self._open_inotify()
+        pool = [threading.Thread(target=self._work, args=(n, stop), name=f"ingest-{n}")
+                for n in range(self.workers)]
+        for t in pool:
+            t.start()
+        try:
+            self._scan()
+            next_scan = time.monotonic() + (EVENT_RESCAN if ino else self.poll)
+            while not stop.is_set():
+                self._enqueue()
+                if once and self._idle():
+                    break
+                wait = min(self.poll, max(0.05, min(next_scan, self.settler.next_due()) - time.monotonic()))
+                if ino:
+                    rescan = self._events(ino, wait)
+                else:
+                    stop.wait(wait)
+                    rescan = 0
+                if rescan or time.monotonic() >= next_scan:
+                    self._scan(full=rescan == 2)
+                    next_scan = time.monotonic() + (EVENT_RESCAN if ino else self.poll)
+        finally:
+            stop.set()
+            self._wake.set()
+            for t in pool:
+                t.join()
+            if ino:
+                ino.close()
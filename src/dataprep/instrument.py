@@ -0,0 +1,247 @@
+# src/dataprep/instrument.py
+from __future__ import annotations
+import contextvars, csv, functools, json, os, subprocess, sys, threading, time
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+try:  # POSIX only; on Windows we still record wall time and exit status
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# ------------------------------------------------------------
+# Records
+# ------------------------------------------------------------
+
+@dataclass
+class Record:
+    """One external tool invocation (kind="tool") or stage function call (kind="stage")."""
+    kind: str
+    name: str                         # tool: ffmpeg/ffprobe/...; stage: function name
+    stage: Optional[str]              # enclosing stage (tools only)
+    started: float                    # epoch seconds
+    wall_s: float
+    user_s: Optional[float] = None    # tool: child CPU; stage: own + reaped children CPU
+    sys_s: Optional[float] = None
+    max_rss_mb: Optional[float] = None   # None: exited before it could be sampled
+    read_bytes: Optional[int] = None  # bytes the child read()/wrote() (files and pipes)
+    write_bytes: Optional[int] = None
+    returncode: Optional[int] = None
+    error: Optional[str] = None
+    cmd: Optional[str] = None
+
+class Recorder:
+    """Thread-safe, process-wide list of Records (see `recorder`)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: list[Record] = []
+
+    def add(self, rec: Record) -> None:
+        with self._lock:
+            self.records.append(rec)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+    def summary(self) -> list[dict]:
+        """Totals per (kind, name): calls, failures, wall, CPU, peak RSS, I/O."""
+        groups: dict[tuple[str, str], dict] = {}
+        with self._lock:
+            records = list(self.records)
+        for r in records:
+            g = groups.setdefault((r.kind, r.name), {
+                "kind": r.kind, "name": r.name, "calls": 0, "failed": 0, "wall_s": 0.0,
+                "cpu_s": 0.0, "max_rss_mb": 0.0, "read_mb": 0.0, "write_mb": 0.0,
+            })
+            g["calls"] += 1
+            g["failed"] += int(bool(r.error) or (r.returncode not in (None, 0)))
+            g["wall_s"] += r.wall_s
+            g["cpu_s"] += (r.user_s or 0.0) + (r.sys_s or 0.0)
+            g["max_rss_mb"] = max(g["max_rss_mb"], r.max_rss_mb or 0.0)
+            g["read_mb"] += (r.read_bytes or 0) / 2**20
+            g["write_mb"] += (r.write_bytes or 0) / 2**20
+        return sorted(groups.values(), key=lambda g: (g["kind"] != "stage", -g["wall_s"]))
+
+    def write_report(self, path: Path) -> Path:
+        """Machine-readable run report: .csv → one row per record; otherwise JSON with a summary."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            records = [asdict(r) for r in self.records]
+        if path.suffix.lower() == ".csv":
+            with path.open("w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=[fl.name for fl in fields(Record)])
+                w.writeheader()
+                w.writerows(records)
+        else:
+            with path.open("w", encoding="utf-8") as f:
+                json.dump({"summary": self.summary(), "records": records}, f, indent=1)
+        return path
+
+    def print_summary(self, console=None) -> None:
+        """`--profile` table via rich."""
+        rows = self.summary()
+        if not rows:
+            return
+        from rich.console import Console
+        from rich.table import Table
+        t = Table(title="Run profile")
+        for col in ("kind", "name", "calls", "failed", "wall s", "cpu s", "peak RSS MB", "read MB", "write MB"):
+            t.add_column(col, justify="left" if col in ("kind", "name") else "right")
+        for g in rows:
+            t.add_row(g["kind"], g["name"], str(g["calls"]), str(g["failed"]),
+                      f"{g['wall_s']:.2f}", f"{g['cpu_s']:.2f}", f"{g['max_rss_mb']:.0f}",
+                      f"{g['read_mb']:.1f}", f"{g['write_mb']:.1f}")
+        (console or Console(stderr=True)).print(t)
+
+recorder = Recorder()
+
+# Name of the stage the current code runs in (propagate into worker threads with copy_context()).
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("stage", default=None)
+
+def _rss_mb(maxrss: int) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM (peak RSS) of a running process (Linux /proc), else None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def has_exited(proc: subprocess.Popen) -> bool:
+    """Whether `proc` has exited, without reaping it where waitid() exists (see reap())."""
+    if proc.returncode is not None:
+        return True
+    if not hasattr(os, "waitid"):
+        return proc.poll() is not None
+    try:
+        return os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT | os.WNOHANG) is not None
+    except ChildProcessError:
+        return True
+
+def _wait_exited(proc: subprocess.Popen, hwm: Optional[float] = None) -> Optional[float]:
+    """
+    Block until `proc` exits, without reaping it; returns its last sampled
+    VmHWM. wait4()'s ru_maxrss cannot be used for the child's own peak: on
+    Linux exec() carries the parent's RSS high-water mark over, so every
+    tool would report at least the size of this Python process. Polling
+    starts at 1 ms and backs off to 100 ms, so short ffprobe calls are not
+    delayed noticeably.
+    """
+    delay = 0.001
+    while not has_exited(proc):
+        hwm = peak_rss_mb(proc.pid) or hwm
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    return hwm
+
+def _proc_io(pid: int) -> tuple[Optional[int], Optional[int]]:
+    """rchar/wchar of an exited-but-unreaped child (Linux /proc), else (None, None)."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            kv = dict(line.split(":", 1) for line in f)
+        return int(kv["rchar"]), int(kv["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+# ------------------------------------------------------------
+# Tools
+# ------------------------------------------------------------
+
+def reap(proc: subprocess.Popen, cmd: Sequence[str], started: float,
+         t0: Optional[float] = None, error: Optional[str] = None, rss_mb: Optional[float] = None) -> int:
+    """
+    Wait for `proc` and record it. On POSIX the child is waited for without
+    reaping (to sample its peak RSS and read its /proc I/O counters) and then
+    reaped with wait4() for its own CPU times, so concurrent children never
+    mix their numbers. `t0` is the perf_counter() taken at spawn; streaming
+    callers that only reap after EOF pass the last peak_rss_mb() they sampled.
+    """
+    t0 = time.perf_counter() if t0 is None else t0
+    rec = Record("tool", Path(cmd[0]).stem.lower(), _current_stage.get(), started, 0.0,
+                 cmd=subprocess.list2cmdline([str(c) for c in cmd]), error=error)
+    if resource is not None and proc.returncode is None and hasattr(os, "wait4"):
+        if hasattr(os, "waitid"):
+            rec.max_rss_mb = _wait_exited(proc, rss_mb)
+            rec.read_bytes, rec.write_bytes = _proc_io(proc.pid)
+        try:
+            _, status, ru = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            rec.user_s, rec.sys_s = ru.ru_utime, ru.ru_stime
+            # ru_maxrss is the child's own peak only when it beats ours (see _wait_exited)
+            if ru.ru_maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+                rec.max_rss_mb = max(rec.max_rss_mb or 0.0, _rss_mb(ru.ru_maxrss))
+            if rec.read_bytes is None:  # no /proc: block I/O only
+                rec.read_bytes, rec.write_bytes = ru.ru_inblock * 512, ru.ru_oublock * 512
+        except ChildProcessError:
+            pass
+    rc = proc.wait()
+    rec.wall_s = time.perf_counter() - t0
+    rec.returncode = rc
+    recorder.add(rec)
+    return rc
+
+def run(cmd: Sequence[str], check: bool = False, **kw: Any) -> subprocess.CompletedProcess:
+    """
+    Drop-in for subprocess.run (no stdin input) that records wall time, child
+    CPU, peak RSS, bytes read/written and exit status. Runs on the shared
+    process executor (procs.executor()): it waits for a slot of the tool's
+    class, honours `timeout` (default per class) and takes `on_progress`
+    for ffmpeg's -progress blocks.
+    """
+    from .procs import executor
+    return executor().run(cmd, check=check, **kw)
+
+def check_output(cmd: Sequence[str], **kw: Any):
+    """Drop-in for subprocess.check_output, recorded like run()."""
+    return run(cmd, check=True, stdout=subprocess.PIPE, **kw).stdout
+
+# ------------------------------------------------------------
+# Stages
+# ------------------------------------------------------------
+
+def _self_and_children() -> tuple[float, float]:
+    if resource is None:
+        return time.process_time(), 0.0
+    me, kids = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + kids.ru_utime, me.ru_stime + kids.ru_stime
+
+def stage(fn: Callable) -> Callable:
+    """
+    Decorator for stage functions: records wall time and process + reaped
+    children CPU for the call, and tags every tool run inside it (including
+    in worker threads started with contextvars.copy_context()) with its name.
+    Nested stages are recorded separately.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current_stage.set(fn.__name__)
+        started, t0 = time.time(), time.perf_counter()
+        u0, s0 = _self_and_children()
+        err = None
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as e:
+            err = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            u1, s1 = _self_and_children()
+            rec = Record("stage", fn.__name__, None, started, time.perf_counter() - t0,
+                         u1 - u0, s1 - s0, error=err)
+            if resource is not None:
+                rec.max_rss_mb = _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+            recorder.add(rec)
+            _current_stage.reset(token)
+    return wrapper
+
+def submit(ex, fn: Callable, *args, **kwargs):
+    """executor.submit() that carries the current stage into the worker thread."""
+    return ex.submit(contextvars.copy_context().run, fn, *args, **kwargs)
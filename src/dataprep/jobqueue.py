@@ -0,0 +1,284 @@
+# src/dataprep/jobqueue.py
+from __future__ import annotations
+import json, os, socket, sqlite3, threading, time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .core import _ensure_dir
+
+# ------------------------------------------------------------
+# Persistent job queue (SQLite): leases, heartbeats, retry with backoff
+# ------------------------------------------------------------
+
+DEFAULT_QUEUE = Path("data/.state/queue.sqlite")
+LEASE_SECONDS = 120.0     # a job whose worker stops heartbeating is handed out again after this
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 30.0      # seconds before retry n is due: RETRY_BACKOFF * 2**(n-1)
+STATES = ("queued", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    key          TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    state        TEXT NOT NULL DEFAULT 'queued',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    not_before   REAL NOT NULL DEFAULT 0,
+    worker       TEXT,
+    lease_until  REAL,
+    created      REAL NOT NULL,
+    updated      REAL NOT NULL,
+    error        TEXT,
+    result       TEXT,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, not_before);
+"""
+
+# A known (kind, key) is only reset when its payload changed.
+_UPSERT = ("INSERT INTO jobs (kind, key, payload, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?) "
+           "ON CONFLICT (kind, key) DO UPDATE SET payload = excluded.payload, state = 'queued', "
+           "attempts = 0, not_before = 0, worker = NULL, lease_until = NULL, error = NULL, result = NULL, "
+           "max_attempts = excluded.max_attempts, updated = excluded.updated "
+           "WHERE jobs.payload != excluded.payload")
+
+def worker_id(tag: str = "") -> str:
+    """host:pid[:tag] — unique per worker thread/process across the nodes sharing a queue."""
+    return f"{socket.gethostname()}:{os.getpid()}" + (f":{tag}" if tag else "")
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    key: str
+    payload: dict
+    attempts: int = 0
+    max_attempts: int = MAX_ATTEMPTS
+    worker: Optional[str] = None
+    state: str = "queued"
+    error: Optional[str] = None
+    result: Optional[dict] = None
+
+    @classmethod
+    def from_row(cls, r: sqlite3.Row) -> "Job":
+        return cls(r["id"], r["kind"], r["key"], json.loads(r["payload"]), r["attempts"], r["max_attempts"],
+                   r["worker"], r["state"], r["error"], json.loads(r["result"]) if r["result"] else None)
+
+class JobQueue:
+    """
+    Jobs identified by (kind, key), e.g. ("source", "<path>"), each with a JSON
+    payload. Workers lease() the oldest due job for LEASE_SECONDS and keep it
+    with heartbeat(); a job whose lease runs out (worker killed, node gone) is
+    handed to the next lease() and counts as an attempt. fail() re-queues with
+    exponential backoff until `max_attempts`, then parks the job as failed.
+
+    Every state change is one IMMEDIATE transaction, so threads and processes
+    (and, with `shared=True`, nodes mounting the file over NFS/SMB, where WAL
+    cannot be used) can lease from the same file without double hand-outs.
+    Timestamps are wall-clock seconds: nodes sharing a queue need synced clocks.
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_QUEUE, shared: bool = False):
+        _ensure_dir(db_path.parent)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=60, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(f"PRAGMA journal_mode={'DELETE' if shared else 'WAL'}")
+        self._db.execute(f"PRAGMA synchronous={'FULL' if shared else 'NORMAL'}")
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _tx(self):
+        return _Immediate(self)
+
+    # -- producers -------------------------------------------------------
+
+    def put(self, kind: str, key: str, payload: dict, max_attempts: int = MAX_ATTEMPTS) -> bool:
+        """
+        Queue a job. An existing (kind, key) is re-queued only when its payload
+        changed (e.g. the source was re-ripped); returns whether anything was queued.
+        """
+        return self.put_many(kind, [(key, payload)], max_attempts) > 0
+
+    def put_many(self, kind: str, items: Iterable[tuple[str, dict]], max_attempts: int = MAX_ATTEMPTS) -> int:
+        """put() for many (key, payload) pairs in one transaction; returns how many were queued."""
+        now, n = time.time(), 0
+        with self._tx() as db:
+            for key, payload in items:
+                n += db.execute(_UPSERT,
+                                (kind, key, json.dumps(payload, sort_keys=True), max_attempts, now, now)).rowcount
+        return n
+
+    # -- workers ---------------------------------------------------------
+
+    def lease(self, worker: str, kinds: Optional[Iterable[str]] = None,
+              lease: float = LEASE_SECONDS) -> Optional[Job]:
+        """The oldest due job (queued, or running with an expired lease), now held by `worker`; None if idle."""
+        kinds = list(kinds or ())
+        only = f" AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+        with self._tx() as db:
+            while True:
+                now = time.time()
+                r = db.execute(
+                    "SELECT * FROM jobs WHERE ((state = 'queued' AND not_before <= ?) "
+                    "OR (state = 'running' AND lease_until < ?))" + only + " ORDER BY id LIMIT 1",
+                    (now, now, *kinds)).fetchone()
+                if r is None:
+                    return None
+                if r["state"] == "running" and r["attempts"] >= r["max_attempts"]:
+                    db.execute("UPDATE jobs SET state = 'failed', error = ?, worker = NULL, lease_until = NULL, "
+                               "updated = ? WHERE id = ?",
+                               (f"lease expired on {r['worker']} (attempt {r['attempts']})", now, r["id"]))
+                    continue
+                db.execute("UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, "
+                           "attempts = attempts + 1, updated = ? WHERE id = ?",
+                           (worker, now + lease, now, r["id"]))
+                job = Job.from_row(r)
+                job.attempts, job.worker, job.state = r["attempts"] + 1, worker, "running"
+                return job
+
+    def _finish(self, job: Job, sql: str, args: tuple) -> bool:
+        with self._tx() as db:
+            return db.execute(sql + " WHERE id = ? AND worker = ? AND state = 'running'",
+                              (*args, job.id, job.worker)).rowcount == 1
+
+    def heartbeat(self, job: Job, lease: float = LEASE_SECONDS) -> bool:
+        """Extend the lease; False if the job is no longer ours (expired and re-leased, or re-queued)."""
+        now = time.time()
+        return self._finish(job, "UPDATE jobs SET lease_until = ?, updated = ?", (now + lease, now))
+
+    def complete(self, job: Job, result: Optional[dict] = None) -> bool:
+        return self._finish(job, "UPDATE jobs SET state = 'done', lease_until = NULL, error = NULL, "
+                                 "result = ?, updated = ?",
+                            (json.dumps(result) if result is not None else None, time.time()))
+
+    def fail(self, job: Job, error: str, retry: bool = True, backoff: float = RETRY_BACKOFF) -> str:
+        """Re-queue after backoff, or park as failed once attempts are used up; returns the new state."""
+        state = "queued" if retry and job.attempts < job.max_attempts else "failed"
+        now = time.time()
+        due = now + backoff * 2 ** max(0, job.attempts - 1) if state == "queued" else 0
+        ok = self._finish(job, "UPDATE jobs SET state = ?, error = ?, not_before = ?, lease_until = NULL, "
+                               "updated = ?", (state, error, due, now))
+        return state if ok else "lost"
+
+    def release(self, job: Job) -> bool:
+        """Hand a job back untried (worker shutting down): queued again, the attempt not counted."""
+        return self._finish(job, "UPDATE jobs SET state = 'queued', attempts = MAX(0, attempts - 1), "
+                                 "lease_until = NULL, updated = ?", (time.time(),))
+
+    # -- inspection / admin ----------------------------------------------
+
+    def due(self, kind: Optional[str] = None) -> int:
+        """Jobs lease() would hand out right now."""
+        now = time.time()
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE ((state = 'queued' AND not_before <= ?) "
+                "OR (state = 'running' AND lease_until < ?))" + (" AND kind = ?" if kind else ""),
+                (now, now, kind) if kind else (now, now)).fetchone()[0]
+
+    def counts(self, kind: Optional[str] = None) -> dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs" + (" WHERE kind = ?" if kind else "")
+                                    + " GROUP BY state", (kind,) if kind else ()).fetchall()
+        out = dict.fromkeys(STATES, 0)
+        out.update({s: n for s, n in rows})
+        return out
+
+    def jobs(self, state: Optional[str] = None, kind: Optional[str] = None) -> list[Job]:
+        where = [w for w, v in (("state = ?", state), ("kind = ?", kind)) if v]
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs" + (" WHERE " + " AND ".join(where) if where else "")
+                                    + " ORDER BY id", tuple(v for v in (state, kind) if v)).fetchall()
+        return [Job.from_row(r) for r in rows]
+
+    def retry_failed(self, kind: Optional[str] = None) -> int:
+        with self._tx() as db:
+            return db.execute("UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, error = NULL, "
+                              "updated = ? WHERE state = 'failed'" + (" AND kind = ?" if kind else ""),
+                              (time.time(), kind) if kind else (time.time(),)).rowcount
+
+    def requeue(self, kind: str, keys: Iterable[str], states: Iterable[str] = ("done", "failed")) -> int:
+        """Queue these jobs again (fresh attempts) if they are in one of `states`."""
+        states, now, n = list(states), time.time(), 0
+        with self._tx() as db:
+            for key in keys:
+                n += db.execute("UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, error = NULL, "
+                                f"updated = ? WHERE kind = ? AND key = ? AND state IN ({','.join('?' * len(states))})",
+                                (now, kind, key, *states)).rowcount
+        return n
+
+    def delete(self, kind: str, keys: Iterable[str]) -> int:
+        with self._tx() as db:
+            return sum(db.execute("DELETE FROM jobs WHERE kind = ? AND key = ?", (kind, k)).rowcount for k in keys)
+
+    def purge(self, states: Iterable[str] = ("done",), kind: Optional[str] = None) -> int:
+        states = list(states)
+        with self._tx() as db:
+            return db.execute(f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(states))})"
+                              + (" AND kind = ?" if kind else ""),
+                              (*states, kind) if kind else tuple(states)).rowcount
+
+class _Immediate:
+    """BEGIN IMMEDIATE … COMMIT under the queue's thread lock: the write lock is taken up front."""
+
+    def __init__(self, q: JobQueue):
+        self.q = q
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.q._lock.acquire()
+        try:
+            self.q._db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.q._lock.release()
+            raise
+        return self.q._db
+
+    def __exit__(self, exc_type, *exc) -> None:
+        try:
+            self.q._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.q._lock.release()
+
+class Heartbeat:
+    """
+    Keep `job` leased while the body runs: a daemon thread calls
+    queue.heartbeat() every lease/3 seconds. `lost` turns True if the lease
+    was taken over (the result should then not be reported).
+    """
+
+    def __init__(self, queue: JobQueue, job: Job, lease: float = LEASE_SECONDS):
+        self.queue, self.job, self.lease = queue, job, lease
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{job.id}", daemon=True)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.lease / 3):
+            try:
+                if not self.queue.heartbeat(self.job, self.lease):
+                    self.lost = True
+                    return
+            except (sqlite3.Error, OSError):  # shared FS / coordinator hiccup: try again next beat, the lease has slack
+                pass
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,263 @@
+# src/dataprep/keyframes.py
+from __future__ import annotations
+import os, subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from . import instrument
+from .core import (
+    ClipResult, _cut_clips, _ensure_dir, _ffmpeg_cut, _scene_table, _tc_seconds,
+    _part_tag, _which, scene_csv_path,
+)
+from .probe import ProbeCache
+
+# ------------------------------------------------------------
+# Packet / keyframe index (one ffprobe pass per source, cached as .npz)
+# ------------------------------------------------------------
+
+INDEX_VERSION = 1
+
+@dataclass
+class KeyframeIndex:
+    """
+    Video packets of one source in presentation order: `pts` (seconds),
+    `key` (keyframe flag) and `pos` (byte offset in the file, -1 if unknown),
+    plus the codec/pix_fmt a smart cut has to re-encode the GOP head with.
+    """
+    pts: np.ndarray
+    key: np.ndarray
+    pos: np.ndarray
+    codec: str = ""
+    pix_fmt: str = ""
+    size: int = 0
+    mtime_ns: int = 0
+
+    @property
+    def keyframes(self) -> np.ndarray:
+        return self.pts[self.key]
+
+    def snap(self, t: float, tolerance: float) -> Optional[float]:
+        """Keyframe nearest to `t` if it is within `tolerance` seconds, else None."""
+        kf = self.keyframes
+        if not len(kf):
+            return None
+        i = int(np.searchsorted(kf, t))
+        best = min((kf[j] for j in (i - 1, i) if 0 <= j < len(kf)), key=lambda k: abs(k - t))
+        return float(best) if abs(best - t) <= tolerance else None
+
+    def next_key(self, t: float) -> Optional[float]:
+        """First keyframe at or after `t` (half a millisecond of slack for rounded timecodes)."""
+        kf = self.keyframes
+        i = int(np.searchsorted(kf, t - 5e-4))
+        return float(kf[i]) if i < len(kf) else None
+
+    def first_frame(self, t: float) -> Optional[float]:
+        """pts of the first frame presented at or after `t`."""
+        i = int(np.searchsorted(self.pts, t - 5e-4))
+        return float(self.pts[i]) if i < len(self.pts) else None
+
+    def frames_between(self, a: float, b: float) -> int:
+        """Number of frames presented in [a, b)."""
+        lo, hi = np.searchsorted(self.pts, [a - 5e-4, b - 5e-4])
+        return int(hi - lo)
+
+    def matches(self, path: Path) -> bool:
+        st = path.stat()
+        return (st.st_size, st.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def save(self, path: Path) -> Path:
+        tmp = path.with_name(f"{path.stem}.part.npz")
+        with tmp.open("wb") as f:
+            np.savez(f, version=INDEX_VERSION, pts=self.pts, key=self.key, pos=self.pos,
+                     codec=self.codec, pix_fmt=self.pix_fmt,
+                     sig=np.array([self.size, self.mtime_ns], dtype=np.int64))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "KeyframeIndex":
+        with np.load(path) as z:
+            if int(z["version"]) != INDEX_VERSION:
+                raise ValueError(f"{path}: index version {int(z['version'])} != {INDEX_VERSION}")
+            size, mtime_ns = (int(v) for v in z["sig"])
+            return cls(z["pts"], z["key"], z["pos"], str(z["codec"]), str(z["pix_fmt"]), size, mtime_ns)
+
+def _field(v: str, default: float) -> float:
+    try:
+        return float(v)
+    except ValueError:  # "N/A"
+        return default
+
+def build_keyframe_index(inp: Path) -> KeyframeIndex:
+    """Read every video packet's pts/flags/pos with ffprobe (no decoding)."""
+    res = instrument.run(
+        [_which("ffprobe"), "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags,pos:stream=codec_name,pix_fmt:format=start_time",
+         "-of", "compact=p=0:nk=0", str(inp)],
+        capture_output=True, text=True, errors="replace",
+    )
+    if res.returncode != 0:
+        raise RuntimeError(f"ffprobe packet scan failed for {inp}: {res.stderr.strip()}")
+    pts, key, pos, stream, start = [], [], [], {}, 0.0
+    for line in res.stdout.splitlines():
+        kv = dict(f.split("=", 1) for f in line.split("|") if "=" in f)
+        if "flags" in kv:
+            pts.append(_field(kv.get("pts_time", ""), np.nan))
+            key.append("K" in kv["flags"])
+            pos.append(int(_field(kv.get("pos", ""), -1)))
+        elif "codec_name" in kv:
+            stream = kv
+        elif "start_time" in kv:
+            start = _field(kv["start_time"], 0.0)
+    # Relative to the container start, like scene CSV timecodes and ffmpeg's -ss.
+    pts_a = np.array(pts, dtype=np.float64) - start
+    order = np.argsort(pts_a, kind="stable")  # decode → presentation order; NaN pts sort last
+    keep = order[np.isfinite(pts_a[order])]
+    st = inp.stat()
+    return KeyframeIndex(pts_a[keep], np.array(key, dtype=bool)[keep], np.array(pos, dtype=np.int64)[keep],
+                         stream.get("codec_name", ""), stream.get("pix_fmt", ""), st.st_size, st.st_mtime_ns)
+
+def keyframe_index_path(inp: Path, outdir: Optional[Path] = None) -> Path:
+    """<movie>-keyframes.npz next to the scene CSV."""
+    csv_path = scene_csv_path(inp, outdir)
+    return csv_path.with_name(csv_path.name.replace("-Scenes.csv", "-keyframes.npz"))
+
+def load_keyframe_index(inp: Path, outdir: Optional[Path] = None, rebuild: bool = False) -> KeyframeIndex:
+    """Cached index for `inp`; rebuilt when missing, stale (size/mtime changed) or unreadable."""
+    path = keyframe_index_path(inp, outdir)
+    if path.exists() and not rebuild:
+        try:
+            idx = KeyframeIndex.load(path)
+            if idx.matches(inp):
+                return idx
+        except (OSError, ValueError, KeyError):
+            pass
+    idx = build_keyframe_index(inp)
+    idx.save(path)
+    return idx
+
+# ------------------------------------------------------------
+# Smart cut: copy from keyframes, re-encode only the GOP head
+# ------------------------------------------------------------
+
+# Per source codec: encoder args for the re-encoded head, and the bitstream
+# filter that puts the copied part's parameter sets in-band so the decoder
+# switches from the head's SPS/PPS to the source's at the first copied
+# keyframe. The head is joined to stream-copied packets, so it must be the
+# same codec; anything else gets a full re-encode of the clip.
+SMART_CODECS = {
+    "h264": (["-c:v", "libx264", "-preset", "veryfast", "-crf", "18"], "h264_mp4toannexb"),
+    "hevc": (["-c:v", "libx265", "-preset", "veryfast", "-crf", "20"], "hevc_mp4toannexb"),
+    "mpeg2video": (["-c:v", "mpeg2video", "-q:v", "2"], None),  # sequence headers are in-band already
+}
+
+DEFAULT_SNAP = 0.25  # seconds a boundary may move to land on a keyframe
+
+def _secs(t: float) -> str:
+    return f"{t:.6f}"
+
+def _concat_entry(p: Path) -> str:
+    """Quoted `file` line for ffmpeg's concat demuxer."""
+    return "file '" + str(p.resolve()).replace("'", "'\\''") + "'\n"
+
+def _smart_cut(ff: str, inp: Path, idx: KeyframeIndex, has_audio: bool, a: float, b: float,
+               out: Path, tolerance: float) -> Optional[str]:
+    """
+    One clip [a, b):
+      • start within `tolerance` of a keyframe → stream copy from that keyframe
+      • otherwise → re-encode [a, next keyframe) as a short head, stream copy
+        the rest (through the codec's mp4toannexb filter, so its SPS/PPS
+        travel in-band), write both as Matroska and join them with the concat
+        demuxer and the source audio packets of [a, b)
+    The end snaps to a keyframe within `tolerance` too, so neighbouring clips
+    stay contiguous. No keyframe inside the clip, or a codec without a head
+    encoder → full re-encode.
+    """
+    b_key = idx.snap(b, tolerance)
+    b = b if b_key is None else b_key
+    a_key = idx.snap(a, tolerance)
+    if a_key is not None and a_key < b:
+        return _ffmpeg_cut(ff, inp, _secs(a_key), _secs(b), out, copy=True)
+    k = idx.next_key(a)
+    codec = SMART_CODECS.get(idx.codec)
+    if k is None or k >= b or codec is None:
+        return _ffmpeg_cut(ff, inp, _secs(a), _secs(b), out, copy=False)
+    enc, bsf = codec
+
+    tag = _part_tag()
+    base = out.with_name(f".{out.stem}.{tag}")
+    head, tail, audio, lst = (base.with_name(f"{base.name}.{n}")
+                              for n in ("head.mkv", "tail.mkv", "audio.mka", "concat.txt"))
+    tmp = out.with_name(f"{out.stem}.{tag}.part{out.suffix}")
+    quiet = [ff, "-hide_banner", "-loglevel", "error", "-y"]
+    pix = ["-pix_fmt", idx.pix_fmt] if idx.pix_fmt else []
+    pre = min(a, 10.0)  # coarse input seek, then drop audio packets before `a` on the output side
+    steps = [
+        [*quiet, "-ss", _secs(a), "-i", str(inp), "-map", "0:v:0", "-an", "-sn",
+         "-frames:v", str(max(1, idx.frames_between(a, k))), *enc, *pix, str(head)],
+        [*quiet, "-ss", _secs(k), "-to", _secs(b), "-i", str(inp), "-map", "0:v:0",
+         "-c", "copy", *(["-bsf:v", bsf] if bsf else []), "-an", "-sn", str(tail)],
+    ]
+    mux = [*quiet, "-f", "concat", "-safe", "0", "-i", str(lst)]
+    if has_audio:
+        steps.append([*quiet, "-ss", _secs(a - pre), "-i", str(inp), "-ss", _secs(pre), "-t", _secs(b - a),
+                      "-map", "0:a", "-c", "copy", str(audio)])
+        mux += ["-i", str(audio), "-map", "0:v", "-map", "1:a"]
+    steps.append([*mux, "-c", "copy", str(tmp)])
+    # Explicit head duration: the tail starts exactly one frame after the head's last frame.
+    head_dur = k - (idx.first_frame(a) or a)
+    try:
+        lst.write_text(f"{_concat_entry(head)}duration {head_dur:.6f}\n{_concat_entry(tail)}", encoding="utf-8")
+        for cmd in steps:
+            res = instrument.run(cmd, capture_output=True, text=True, errors="replace")
+            if res.returncode != 0:
+                return res.stderr.strip() or f"ffmpeg exited with {res.returncode}"
+        os.replace(tmp, out)
+        return None
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return str(e)
+    finally:
+        for p in (head, tail, audio, lst, tmp):
+            p.unlink(missing_ok=True)
+
+@instrument.stage
+def split_with_ffmpeg_smart(
+    inp: Path,
+    csv_path: Path,
+    outdir: Path,
+    tolerance: float = DEFAULT_SNAP,
+    jobs: Optional[int] = None,
+    on_clip: Optional[Callable[[ClipResult, int, int], None]] = None,
+    only: Optional[set[int]] = None,
+    index: Optional[KeyframeIndex] = None,
+    cache: Optional[ProbeCache] = None,
+) -> list[ClipResult]:
+    """
+    Frame-accurate split at close to stream-copy cost (engine="ffmpeg-smart"):
+    each clip is copied from a keyframe, and only the frames between the scene
+    start and the next keyframe are re-encoded (see _smart_cut). Uses the
+    keyframe index next to the scene CSV (built on first use).
+    Same naming, ClipResult, `on_clip` and `only` semantics as split_with_ffmpeg.
+    """
+    _ensure_dir(outdir)
+    ranges = _scene_table(csv_path).ranges()
+    idx = index or load_keyframe_index(inp, csv_path.parent)
+    own_cache = cache is None
+    if own_cache:
+        cache = ProbeCache()
+    try:
+        has_audio = any(st.get("codec_type") == "audio" for st in cache.probe(inp).get("streams", []))
+    finally:
+        if own_cache:
+            cache.close()
+
+    ff = _which("ffmpeg")
+    jobs = jobs or max(1, (os.cpu_count() or 1) // 2)
+    return _cut_clips(
+        ranges, outdir, jobs,
+        lambda start, end, out: _smart_cut(ff, inp, idx, has_audio, _tc_seconds(start), _tc_seconds(end), out, tolerance),
+        on_clip, only,
+    )
@@ -0,0 +1,179 @@
+# src/dataprep/metadata.py
+from __future__ import annotations
+import csv, os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import instrument
+from .core import _ensure_dir
+from .probe import ProbeCache, ProbeTable
+
+# clips_metadata.csv columns (same as the old scripts/02_build_metadata.py output)
+META_FIELDS = ["video_path", "parent_set", "filename", "duration_sec", "width", "height", "size_bytes"]
+METADATA_BATCH = 512  # clips per ProbeCache.probe_many() call; rows are flushed after each batch
+PARQUET_HINT = "pip install 'wan21-lora-dataprep[parquet]'"
+
+def _meta_row(table: ProbeTable, i: int) -> dict:
+    path, dur = table.paths[i], float(table.duration[i])
+    return {
+        "video_path": str(path),
+        "parent_set": path.parent.name,
+        "filename":   path.name,
+        "duration_sec": None if dur != dur else dur,
+        "width": int(table.width[i]) or None,
+        "height": int(table.height[i]) or None,
+        "size_bytes": path.stat().st_size,
+    }
+
+def extract_meta(path: Path, cache: ProbeCache) -> dict:
+    """One clips_metadata row from (cached) probe output."""
+    table = cache.probe_many([path])
+    if table.error[0]:
+        raise RuntimeError(table.error[0])
+    return _meta_row(table, 0)
+
+def find_clips(clips_dir: Path) -> list[Path]:
+    return sorted([*clips_dir.rglob("*.mp4"), *clips_dir.rglob("*.mkv")])
+
+def _resume_done(out_csv: Path) -> set[str]:
+    """
+    video_path values already in a partially written CSV. A torn last line
+    (crash mid-write) is truncated so appending continues cleanly.
+    """
+    if not out_csv.exists() or out_csv.stat().st_size == 0:
+        return set()
+    data = out_csv.read_bytes()
+    if not data.endswith(b"\n"):
+        cut = data.rfind(b"\n") + 1
+        with out_csv.open("r+b") as f:
+            f.truncate(cut)
+    with out_csv.open(newline="", encoding="utf-8") as f:
+        r = csv.DictReader(f)
+        if r.fieldnames != META_FIELDS:
+            raise ValueError(f"{out_csv} has columns {r.fieldnames}, expected {META_FIELDS}; "
+                             f"move it aside or run without resume")
+        return {row["video_path"] for row in r}
+
+# ------------------------------------------------------------
+# Parquet copy (optional: pyarrow, the [parquet] extra)
+# ------------------------------------------------------------
+
+def require_parquet():
+    """pyarrow.parquet, or a RuntimeError saying how to install it."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"Parquet output needs pyarrow ({PARQUET_HINT})") from None
+    return pq
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([("video_path", pa.string()), ("parent_set", pa.string()), ("filename", pa.string()),
+                      ("duration_sec", pa.float64()), ("width", pa.int64()), ("height", pa.int64()),
+                      ("size_bytes", pa.int64())])
+
+def _typed(row: dict) -> dict:
+    """A row read back from the CSV, with the types _meta_row() gives."""
+    num = lambda v, t: t(v) if v not in (None, "") else None
+    return {**row, "duration_sec": num(row["duration_sec"], float), "width": num(row["width"], int),
+            "height": num(row["height"], int), "size_bytes": num(row["size_bytes"], int)}
+
+def _write_group(writer, rows: list[dict]) -> None:
+    if rows:
+        import pyarrow as pa
+        writer.write_table(pa.Table.from_pylist(rows, schema=writer.schema))
+
+def _copy_csv_groups(writer, out_csv: Path) -> None:
+    """Rows an earlier (resumed) run wrote, METADATA_BATCH per row group."""
+    with out_csv.open(newline="", encoding="utf-8") as f:
+        rows = []
+        for row in csv.DictReader(f):
+            rows.append(_typed(row))
+            if len(rows) == METADATA_BATCH:
+                _write_group(writer, rows)
+                rows = []
+        _write_group(writer, rows)
+
+@dataclass
+class MetadataReport:
+    out_csv: Path
+    written: int = 0
+    skipped: int = 0
+    failed: list[tuple[Path, str]] = field(default_factory=list)
+    parquet: Optional[Path] = None
+
+@instrument.stage
+def build_metadata(
+    clips_dir: Path,
+    out_csv: Path,
+    jobs: Optional[int] = None,
+    cache: Optional[ProbeCache] = None,
+    parquet: Optional[Path] = None,
+    resume: bool = True,
+    on_row: Optional[Callable[[Path, Optional[str]], None]] = None,
+) -> MetadataReport:
+    """
+    Probe every .mp4/.mkv under `clips_dir` METADATA_BATCH clips at a time
+    (ProbeCache.probe_many: container headers read by `jobs` threads, ffprobe
+    only for files they cannot vouch for) and append the rows to `out_csv`
+    after each batch (flushed, so a crash keeps every finished batch). With
+    resume=True clips already present in `out_csv` are skipped and new rows
+    are appended. Rows follow path order; `parquet` additionally writes the
+    table (every row of `out_csv`) through pyarrow, one row group per flushed
+    batch, so neither file is ever held in memory.
+    """
+    pq = require_parquet() if parquet is not None else None  # before any probing
+    clips = find_clips(clips_dir)
+    done = _resume_done(out_csv) if resume else set()
+    todo = [c for c in clips if str(c) not in done]
+    report = MetadataReport(out_csv, skipped=len(clips) - len(todo))
+
+    _ensure_dir(out_csv.parent)
+    own_cache = cache is None
+    if own_cache:
+        cache = ProbeCache()
+    fresh = not done
+    pq_tmp = writer = None
+    try:
+        if pq is not None:
+            _ensure_dir(parquet.parent)
+            pq_tmp = parquet.with_name(parquet.name + ".tmp")
+            writer = pq.ParquetWriter(pq_tmp, _parquet_schema())
+            if not fresh:
+                _copy_csv_groups(writer, out_csv)
+        with out_csv.open("w" if fresh else "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=META_FIELDS)
+            if fresh:
+                w.writeheader()
+            for k in range(0, len(todo), METADATA_BATCH):
+                table = cache.probe_many(todo[k:k + METADATA_BATCH], jobs)
+                rows = []
+                for i, clip in enumerate(table.paths):
+                    err = table.error[i]
+                    if err is None:
+                        try:
+                            rows.append(_meta_row(table, i))
+                            w.writerow(rows[-1])
+                            report.written += 1
+                        except OSError as e:  # vanished since it was probed
+                            err = str(e)
+                    if err is not None:  # one unreadable clip must not stop the run
+                        report.failed.append((clip, err))
+                    if on_row:
+                        on_row(clip, err)
+                f.flush()
+                if writer is not None:
+                    _write_group(writer, rows)
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(pq_tmp, parquet)
+            report.parquet = parquet
+    finally:
+        if own_cache:
+            cache.close()
+        if writer is not None:  # failed part-way: the CSV resumes, the Parquet copy is rebuilt
+            writer.close()
+            pq_tmp.unlink(missing_ok=True)
+    return report
@@ -0,0 +1,107 @@
+# src/dataprep/normalize.py
+from __future__ import annotations
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Optional
+
+from .profiles import video_filters
+from .scenes import load_scene_table
+
+# ------------------------------------------------------------
+# Settings (configs/scenedetect.yaml → normalize:)
+# ------------------------------------------------------------
+
+@dataclass
+class NormalizeSettings:
+    """
+    What a training clip may look like. `window_frames` (e.g. 81 for WAN 2.1)
+    takes precedence over `window_seconds` and is counted at the target fps,
+    or the source fps when no resampling is asked for. stride < window gives
+    overlapping windows; `fps`/`size` ("WxH", scaled to cover then
+    center-cropped) make the ffmpeg engine re-encode every clip.
+    """
+    min_seconds: float = 1.0
+    window_seconds: float = 5.0
+    window_frames: Optional[int] = None
+    stride_seconds: Optional[float] = None
+    fps: Optional[float] = None
+    size: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, cfg: dict, **overrides) -> "NormalizeSettings":
+        """The `normalize:` section of a config; `overrides` that are not None win."""
+        sec = dict(cfg.get("normalize") or {})
+        sec.update({k: v for k, v in overrides.items() if v is not None})
+        names = {f.name for f in fields(cls)}
+        unknown = set(sec) - names
+        if unknown:
+            raise ValueError(f"Unknown normalize option(s): {', '.join(sorted(unknown))}")
+        return cls(**sec)
+
+    def window(self, source_fps: float) -> float:
+        if not self.window_frames:
+            return float(self.window_seconds)
+        fps = self.fps or source_fps
+        if not fps:
+            raise ValueError("normalize.window_frames needs a frame rate: set normalize.fps "
+                             "or use a scene CSV with frame numbers")
+        return self.window_frames / fps
+
+    def encode_args(self) -> list[str]:
+        """Extra ffmpeg output args for resampling ([] = cut as the engine normally would)."""
+        try:
+            vf = video_filters(self.size, self.fps)
+        except ValueError as e:
+            raise ValueError(f"normalize.{e}") from None
+        if not vf:
+            return []
+        return ["-vf", ",".join(vf), *(["-frames:v", str(self.frames())] if self.frames() else [])]
+
+    def frames(self) -> Optional[int]:
+        """-frames:v cap for a resampled window (rounding in -ss/-to must not add a frame)."""
+        return self.window_frames if self.window_frames and self.fps else None
+
+    def params(self) -> dict:
+        return asdict(self)
+
+# ------------------------------------------------------------
+# Planning: scene CSV → clip CSV the split engines cut in one batch
+# ------------------------------------------------------------
+
+def clip_plan_path(csv_path: Path) -> Path:
+    """<movie>-Clips.csv next to <movie>-Scenes.csv."""
+    name = csv_path.name
+    return csv_path.with_name(name.replace("-Scenes.csv", "-Clips.csv") if name.endswith("-Scenes.csv")
+                              else f"{csv_path.stem}-Clips.csv")
+
+@dataclass
+class PlanReport:
+    csv: Path
+    scenes: int = 0
+    clips: int = 0
+    dropped: int = 0          # scenes shorter than min_seconds
+    scene_seconds: float = 0.0
+    clip_seconds: float = 0.0
+
+def plan_clips(csv_path: Path, ns: Optional[NormalizeSettings], out: Optional[Path] = None,
+               scene_cfg: Optional[dict] = None, mode: str = "content") -> PlanReport:
+    """
+    Turn a scene list into training windows (SceneTable.windows) and write
+    them as a scene CSV, so every split engine, the per-clip resume and review
+    work on the planned clips unchanged. Scenes that would only be cut, probed
+    and rejected later never reach the splitter. `scene_cfg` (the scene
+    config) trims/merges/splits the scenes first (SceneTable.apply_config);
+    with `ns` None that is all the plan does.
+    """
+    table = load_scene_table(csv_path)
+    scenes = table.apply_config(scene_cfg, mode) if scene_cfg else table
+    plan, dropped = scenes, 0
+    if ns is not None:
+        window = ns.window(table.fps)
+        stride = ns.stride_seconds
+        if stride is not None and stride <= 0:
+            raise ValueError(f"normalize.stride_seconds must be > 0, got {stride}")
+        plan = scenes.windows(window, stride, ns.min_seconds)
+        dropped = int((scenes.length < ns.min_seconds).sum())
+    out = plan.to_csv(out or clip_plan_path(csv_path))
+    return PlanReport(out, len(table), len(plan), dropped, float(table.length.sum()), float(plan.length.sum()))
@@ -0,0 +1,316 @@
+# src/dataprep/pack.py
+from __future__ import annotations
+import csv, io, json, os, re, shutil, tarfile, zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from . import instrument
+from .core import _ensure_dir
+from .decisions import kept_rows
+
+# ------------------------------------------------------------
+# Kept clips → samples (clip + JSON metadata + optional caption)
+# ------------------------------------------------------------
+
+DEFAULT_SHARDS = Path("data/shards")
+DEFAULT_SHARD_MB = 1024
+DEFAULT_PACK_JOBS = 3     # shards written at once; each one streams clips from the share
+CAPTION_EXT = ".txt"      # caption sidecar: <clip stem>.txt in keep/ or next to the clip
+BLOCK = 512
+
+@dataclass
+class Sample:
+    """
+    One WebDataset sample, key "<set>/<clip stem>": the clip, a JSON member
+    (manifest row + clips_metadata row) and the caption sidecar if any.
+    """
+    key: str
+    clip: Path
+    meta: bytes
+    caption: Optional[Path] = None
+
+    def sig(self) -> tuple[int, int, int, int]:
+        """clip size/mtime, caption mtime, JSON checksum: any change re-packs the sample."""
+        st = self.clip.stat()
+        cap = self.caption.stat().st_mtime_ns if self.caption else 0
+        return st.st_size, st.st_mtime_ns, cap, zlib.crc32(self.meta)
+
+    def members(self) -> list[tuple[str, int]]:
+        """(tar member name, size) in the order they are written."""
+        out = [(f"{self.key}{self.clip.suffix.lower()}", self.clip.stat().st_size), (f"{self.key}.json", len(self.meta))]
+        if self.caption:
+            out.append((f"{self.key}{CAPTION_EXT}", self.caption.stat().st_size))
+        return out
+
+def _value(v: Optional[str]):
+    """CSV cell → JSON value ("" → null, numbers as numbers)."""
+    if v is None or v == "":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(v)
+        except ValueError:
+            pass
+    return v
+
+def _load_metadata(path: Optional[Path]) -> dict[tuple[str, str], dict]:
+    """clips_metadata.csv rows by (parent_set, filename); {} when there is none."""
+    if path is None or not path.exists():
+        return {}
+    with path.open(newline="", encoding="utf-8") as f:
+        return {(r["parent_set"], r["filename"]): r for r in csv.DictReader(f)}
+
+def kept_samples(review_root: Path, clips_root: Path = Path("data/clips"),
+                 metadata_csv: Optional[Path] = None) -> list[Sample]:
+    """Every kept clip (decisions.kept_rows) as a sample, in set/file order."""
+    meta = _load_metadata(metadata_csv)
+    out = []
+    for base, row in kept_rows(review_root):
+        stem = Path(row["file"]).stem
+        doc = {"key": f"{base.name}/{stem}", "set": base.name,
+               **{k: _value(v) for k, v in row.items() if k != "file"}, "file": row["file"]}
+        extra = meta.get((base.name, row["file"]))
+        if extra:
+            doc.update({k: _value(v) for k, v in extra.items() if k not in ("parent_set", "filename")})
+        caption = next((c for c in (base / "keep" / f"{stem}{CAPTION_EXT}", clips_root / base.name / f"{stem}{CAPTION_EXT}")
+                        if c.exists()), None)
+        out.append(Sample(doc["key"], base / "keep" / row["file"], json.dumps(doc, sort_keys=True).encode(), caption))
+    return out
+
+# ------------------------------------------------------------
+# Offset index (one .npz next to the shards)
+# ------------------------------------------------------------
+
+class ShardIndex:
+    """
+    <shards>/index.npz, one row per packed sample: `keys`, `shard` (position
+    in `shards`), `span` = byte offset/size of all its tar members (one seek,
+    one read), `video` = offset/size of the clip bytes alone, `sig` (see
+    Sample.sig) and `live`. A sample that is no longer kept, or was re-packed
+    after a change, stays in its shard with live=False; readers should go
+    through the index, or repack with --rebuild.
+    """
+
+    def __init__(self, root: Path = DEFAULT_SHARDS):
+        self.root = root
+        self.path = root / "index.npz"
+        self.keys: list[str] = []
+        self.shards: list[str] = []
+        self.shard = np.zeros(0, dtype=np.uint32)
+        self.span = np.zeros((0, 2), dtype=np.uint64)
+        self.video = np.zeros((0, 2), dtype=np.uint64)
+        self.sig = np.zeros((0, 4), dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        if self.path.exists():
+            with np.load(self.path) as z:
+                self.keys, self.shards = z["keys"].tolist(), z["shards"].tolist()
+                self.shard, self.span, self.video = z["shard"], z["span"], z["video"]
+                self.sig, self.live = z["sig"], z["live"]
+        self._pos = {k: i for i, k in enumerate(self.keys) if self.live[i]}
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def save(self) -> Path:
+        _ensure_dir(self.root)
+        tmp = self.path.with_name(f"{self.path.stem}.part.npz")
+        with tmp.open("wb") as f:
+            np.savez(f, keys=np.array(self.keys, dtype=str), shards=np.array(self.shards, dtype=str),
+                     shard=self.shard, span=self.span, video=self.video, sig=self.sig, live=self.live)
+        os.replace(tmp, self.path)
+        return self.path
+
+    def live_keys(self) -> list[str]:
+        return list(self._pos)
+
+    def current(self, key: str, sig: tuple) -> bool:
+        i = self._pos.get(key)
+        return i is not None and tuple(self.sig[i].tolist()) == tuple(sig)
+
+    def retire(self, keys) -> int:
+        """Mark the live rows of `keys` dead; returns how many were."""
+        n = 0
+        for k in keys:
+            i = self._pos.pop(k, None)
+            if i is not None:
+                self.live[i] = False
+                n += 1
+        return n
+
+    def add(self, name: str, samples: list[Sample], sigs: list[tuple], spans: list[tuple[int, int, int, int]]) -> None:
+        """Rows for a finished shard; earlier live rows of the same keys are retired."""
+        self.retire(s.key for s in samples)
+        if name not in self.shards:
+            self.shards.append(name)
+        n0 = len(self.keys)
+        self.keys += [s.key for s in samples]
+        self.shard = np.concatenate([self.shard, np.full(len(samples), self.shards.index(name), dtype=np.uint32)])
+        sp = np.array(spans, dtype=np.uint64).reshape(-1, 4)
+        self.span = np.concatenate([self.span, sp[:, :2]])
+        self.video = np.concatenate([self.video, sp[:, 2:]])
+        self.sig = np.concatenate([self.sig, np.array(sigs, dtype=np.int64).reshape(-1, 4)])
+        self.live = np.concatenate([self.live, np.ones(len(samples), dtype=bool)])
+        self._pos.update({s.key: n0 + i for i, s in enumerate(samples)})
+
+    def read(self, key: str) -> dict[str, bytes]:
+        """Members of one sample by extension ("mkv", "json", "txt"), with a single seek + read."""
+        i = self._pos[key]
+        off, size = (int(v) for v in self.span[i])
+        with (self.root / self.shards[int(self.shard[i])]).open("rb") as f:
+            f.seek(off)
+            buf = f.read(size)
+        with tarfile.open(fileobj=io.BytesIO(buf + b"\0" * (2 * BLOCK))) as tf:
+            return {m.name.rsplit(".", 1)[-1]: tf.extractfile(m).read() for m in tf}
+
+# ------------------------------------------------------------
+# Shards: written member by member so every offset is known
+# ------------------------------------------------------------
+
+SHARD_NAME = re.compile(r"^shard-(\d+)\.tar$")
+
+def _padded(n: int) -> int:
+    return n + (-n % BLOCK)
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    ti = tarfile.TarInfo(name)
+    ti.size, ti.mtime, ti.mode = size, int(mtime), 0o644
+    return ti.tobuf(format=tarfile.PAX_FORMAT)
+
+def plan_shards(samples: list[Sample], shard_bytes: int) -> list[list[Sample]]:
+    """Consecutive samples grouped up to `shard_bytes` (a bigger clip gets a shard of its own)."""
+    out, cur, size = [], [], 0
+    for s in samples:
+        n = sum(BLOCK + _padded(m) for _, m in s.members())
+        if cur and size + n > shard_bytes:
+            out.append(cur)
+            cur, size = [], 0
+        cur.append(s)
+        size += n
+    if cur:
+        out.append(cur)
+    return out
+
+def write_shard(path: Path, samples: list[Sample]) -> list[tuple[int, int, int, int]]:
+    """
+    Write `samples` as a tar (WebDataset layout: members grouped by key)
+    via a .part file; returns (offset, size, video offset, video size) per
+    sample.
+    """
+    tmp = path.with_name(f"{path.name}.part")
+    spans = []
+    try:
+        with tmp.open("wb") as out:
+            pos = 0
+            for s in samples:
+                start, video = pos, (0, 0)
+                for (name, size), src in zip(s.members(), (s.clip, s.meta, s.caption)):
+                    hdr = _header(name, size, s.clip.stat().st_mtime)
+                    out.write(hdr)
+                    pos += len(hdr)
+                    if isinstance(src, bytes):
+                        out.write(src)
+                        got = len(src)
+                    else:
+                        with src.open("rb") as f:
+                            shutil.copyfileobj(f, out, 1 << 20)
+                            got = f.tell()
+                    if got != size:
+                        raise RuntimeError(f"{src} changed while it was packed")
+                    if src is s.clip:
+                        video = (pos, size)
+                    out.write(b"\0" * (-size % BLOCK))
+                    pos += _padded(size)
+                spans.append((start, pos - start, *video))
+            out.write(b"\0" * (2 * BLOCK))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return spans
+
+# ------------------------------------------------------------
+# Stage: pack newly kept clips into new shards
+# ------------------------------------------------------------
+
+@dataclass
+class PackReport:
+    root: Path
+    kept: int = 0
+    packed: int = 0            # samples written by this call
+    current: int = 0           # already in a shard and unchanged
+    retired: int = 0           # no longer kept / changed: dead in their old shard
+    shards: list[str] = field(default_factory=list)
+    bytes: int = 0
+    failed: list[tuple[str, str]] = field(default_factory=list)  # shard name → error
+
+@instrument.stage
+def pack_kept(
+    review_root: Path = Path("data/review"),
+    root: Path = DEFAULT_SHARDS,
+    shard_mb: float = DEFAULT_SHARD_MB,
+    jobs: Optional[int] = None,
+    clips_root: Path = Path("data/clips"),
+    metadata_csv: Optional[Path] = None,
+    rebuild: bool = False,
+    on_shard: Optional[Callable[[str, Optional[str]], None]] = None,
+) -> PackReport:
+    """
+    Stream every kept clip (+ metadata JSON, + caption) into tar shards of
+    about `shard_mb` under `root`, `jobs` shards at a time. Incremental:
+    samples already packed with the same clip/caption/metadata stay where
+    they are and only new or changed ones go into new shards; old shards
+    are never rewritten. The index is saved after every finished shard, so
+    an interrupted run keeps what it wrote. `rebuild` deletes the shards
+    and packs everything again.
+    """
+    _ensure_dir(root)
+    if rebuild:
+        for p in root.iterdir():
+            if SHARD_NAME.match(p.name) or p.name == "index.npz":
+                p.unlink()
+    idx = ShardIndex(root)
+    for p in root.iterdir():  # crashed runs: partial shards, or finished ones the index never got
+        if p.name.endswith(".part") or (SHARD_NAME.match(p.name) and p.name not in idx.shards):
+            p.unlink()
+
+    samples = kept_samples(review_root, clips_root, metadata_csv)
+    rep = PackReport(root, kept=len(samples))
+    sigs = {s.key: s.sig() for s in samples}
+    todo = [s for s in samples if not idx.current(s.key, sigs[s.key])]
+    rep.current = len(samples) - len(todo)
+    rep.retired = idx.retire([k for k in idx.live_keys() if k not in sigs or not idx.current(k, sigs[k])])
+    if rep.retired:
+        idx.save()
+    if not todo:
+        return rep
+
+    first = max((int(SHARD_NAME.match(n)[1]) for n in idx.shards), default=-1) + 1
+    plan = {f"shard-{first + i:06d}.tar": grp for i, grp in enumerate(plan_shards(todo, int(shard_mb * 2**20)))}
+    ex = ThreadPoolExecutor(max_workers=jobs or DEFAULT_PACK_JOBS)
+    try:
+        futs = {instrument.submit(ex, write_shard, root / name, grp): name for name, grp in plan.items()}
+        for fut in as_completed(futs):
+            name, err = futs[fut], None
+            try:
+                spans = fut.result()
+            except (OSError, RuntimeError) as e:
+                err = str(e)
+                rep.failed.append((name, err))
+            else:
+                grp = plan[name]
+                idx.add(name, grp, [sigs[s.key] for s in grp], spans)
+                idx.save()
+                rep.shards.append(name)
+                rep.packed += len(grp)
+                rep.bytes += (root / name).stat().st_size
+            if on_shard:
+                on_shard(name, err)
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+    rep.shards.sort()
+    return rep
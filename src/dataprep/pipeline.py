@@ -0,0 +1,421 @@
+# src/dataprep/pipeline.py
+from __future__ import annotations
+import hashlib, json, os, threading, time
+from dataclasses import dataclass, asdict, field, replace
+from pathlib import Path
+from typing import Callable, Optional
+
+from .core import (
+    _ensure_dir, _scene_table, default_jobs, detect_scenes, movie_name, scene_csv_path,
+    split_with_ffmpeg, split_with_ffmpeg_segment, split_with_mkvmerge, stage_review,
+)
+from .config import load_scenedetect_config
+from .fingerprint import DEFAULT_INDEX, DEFAULT_MAX_DIST, fingerprint_clips
+from .keyframes import DEFAULT_SNAP, split_with_ffmpeg_smart
+from .normalize import NormalizeSettings, clip_plan_path, plan_clips
+from .preview import build_previews, write_review_index
+from .profiles import EncodePlan, EncodeProfile, EncodeSettings, detect_bars, encode_plan, wants_bars
+from .quality import QualityThresholds
+
+# ------------------------------------------------------------
+# Settings + fingerprints
+# ------------------------------------------------------------
+
+DEFAULT_STATE = Path("data/.state/pipeline.json")
+SOURCE_EXTS = (".mkv", ".mp4")
+SINGLE_PASS_ENGINES = ("mkvmerge", "ffmpeg-segment")  # one process cuts every range of a source
+
+@dataclass
+class RunSettings:
+    """Everything that decides what detect → split → review produce."""
+    sources_dir: Path = Path("data/sources")
+    scenes_root: Path = Path("data/scenedetect")
+    clips_root: Path = Path("data/clips")
+    review_root: Path = Path("data/review")
+    archive_root: Path = Path("data/archive")
+    backend: str = "cli"                  # cli|inprocess|numpy
+    mode: str = "adaptive"
+    threshold: Optional[float] = None
+    config: Path = Path("configs/scenedetect.yaml")
+    engine: str = "ffmpeg"                # mkvmerge|ffmpeg|ffmpeg-smart|ffmpeg-segment
+    copy: bool = True
+    snap: float = DEFAULT_SNAP            # ffmpeg-smart keyframe snap tolerance (s)
+    profile: Optional[str] = None         # encode profile for the clips (config `encode:`), overrides encode.profile
+    archive: Optional[str] = None         # encode profile of the archive tier, overrides encode.archive
+    jobs: Optional[int] = None
+    normalize: bool = False               # cut training windows (config `normalize:`) instead of scenes
+    dedupe: bool = False                  # flag near-duplicate clips (whole corpus) in the review manifest
+    dupe_dist: int = DEFAULT_MAX_DIST
+    quality: bool = False                 # score clips and auto-reject (config `quality:`)
+    previews: bool = False                # contact sheets + proxies + index.html in the review folder
+
+def _digest(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(json.dumps(p, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def file_sig(path: Path) -> dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def file_sha(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+def find_sources(sources_dir: Path) -> list[Path]:
+    return sorted(p for p in sources_dir.rglob("*") if p.suffix.lower() in SOURCE_EXTS and p.is_file())
+
+def set_name(src: Path) -> str:
+    """
+    Folder name for a source's scenes/clips/review: <movie>, or <movie>-<stem>
+    when its folder holds several titles (MakeMKV's title_t00.mkv, title_t01.mkv, ...).
+    """
+    name = movie_name(src)
+    if src.parent.name == "sources":
+        return name
+    siblings = [p for p in src.parent.iterdir() if p.suffix.lower() in SOURCE_EXTS and p.is_file()]
+    return name if len(siblings) <= 1 else f"{name}-{src.stem}"
+
+# ------------------------------------------------------------
+# Manifest (JSON, rewritten atomically after every step)
+# ------------------------------------------------------------
+
+class Manifest:
+    """
+    data/.state/pipeline.json:
+      {"sources": {"<source path>": {"scenes": {...}, "split": {..., "clips": {...}}, "review": {...}}}}
+    Each stage entry stores the key (fingerprint of its inputs + params) it
+    last completed with; a stage is skipped while its key is unchanged and its
+    outputs are still on disk. Mutate entries under `lock` when several
+    sources are processed concurrently (see dataprep.batch).
+    """
+
+    def __init__(self, path: Path = DEFAULT_STATE):
+        self.path = path
+        self.data = {"version": 1, "sources": {}}
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                self.data = json.load(f)
+        self._saved = time.monotonic()
+        self.lock = threading.RLock()
+
+    def source(self, src: Path) -> dict:
+        with self.lock:
+            return self.data["sources"].setdefault(str(src), {})
+
+    def save(self) -> None:
+        with self.lock:
+            _ensure_dir(self.path.parent)
+            tmp = self.path.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._saved = time.monotonic()
+
+    def save_soon(self, every: float = 2.0) -> None:
+        """Throttled save for per-clip progress."""
+        if time.monotonic() - self._saved >= every:
+            self.save()
+
+# ------------------------------------------------------------
+# Stages
+# ------------------------------------------------------------
+
+def run_detect(src: Path, s: RunSettings, cfg: Optional[dict] = None) -> Path:
+    outdir = s.scenes_root / set_name(src)
+    if s.backend == "inprocess":
+        from .detect import detect_scenes_inprocess
+        return detect_scenes_inprocess(src, outdir, s.mode, s.threshold, cfg, s.jobs)
+    if s.backend == "numpy":
+        from .framediff import detect_scenes_numpy
+        return detect_scenes_numpy(src, outdir, s.mode, s.threshold, cfg)
+    return detect_scenes(src, outdir, s.mode, None if s.threshold is None else int(s.threshold))
+
+Log = Callable[[str], None]
+
+def stage_scenes(src: Path, s: RunSettings, m: Manifest, cfg: dict, force: bool, log: Log) -> Path:
+    ent = m.source(src)
+    detect_cfg = {k: v for k, v in cfg.items() if k.startswith("detect_") or k == "inprocess"}
+    key = _digest(file_sig(src), s.backend, s.mode, s.threshold,
+                  detect_cfg if s.backend != "cli" else None)
+    prev = ent.get("scenes", {})
+    csv_path = Path(prev["csv"]) if "csv" in prev else scene_csv_path(src, s.scenes_root / set_name(src))
+    if not force and prev.get("key") == key and csv_path.exists() and prev.get("csv_sha") == file_sha(csv_path):
+        log("scenes: up to date")
+        return csv_path
+    csv_path = run_detect(src, s, cfg)
+    sha = file_sha(csv_path)
+    with m.lock:
+        ent["scenes"] = {"key": key, "csv": str(csv_path), "csv_sha": sha}
+        m.save()
+    log(f"scenes: wrote {csv_path}")
+    return csv_path
+
+SCENE_CFG_KEYS = ("trim_seconds", "max_scene_seconds")  # + detect_<mode>.min_scene_len: SceneTable.apply_config
+
+def stage_plan(src: Path, csv_path: Path, s: RunSettings, m: Manifest, cfg: dict, force: bool, log: Log) -> Path:
+    """
+    Scene CSV → the CSV the splitter cuts: scenes trimmed/merged/split by the
+    config (SceneTable.apply_config), tiled into training windows with
+    s.normalize (see dataprep.normalize). The scene CSV itself when neither
+    changes anything.
+    """
+    table = _scene_table(csv_path)
+    if not s.normalize and table.apply_config(cfg, s.mode) is table:
+        return csv_path
+    ent = m.source(src)
+    ns = normalize_settings(s, cfg) if s.normalize else None
+    if ns and ns.stride_seconds and s.engine in SINGLE_PASS_ENGINES and ns.stride_seconds < ns.window(table.fps) - 1e-6:
+        raise ValueError(f"normalize.stride_seconds ({ns.stride_seconds:g}) < window overlaps clips, which the "
+                         f"{s.engine} engine cannot cut: use --engine ffmpeg or ffmpeg-smart")
+    sec = cfg.get(f"detect_{s.mode}") or cfg.get("detect_content") or {}
+    scene_cfg = {**{k: cfg.get(k) for k in SCENE_CFG_KEYS}, "min_scene_len": sec.get("min_scene_len")}
+    key = _digest(file_sha(csv_path), scene_cfg, ns.params() if ns else None)
+    prev = ent.get("plan", {})
+    plan_csv = clip_plan_path(csv_path)
+    if not force and prev.get("key") == key and plan_csv.exists() and prev.get("csv_sha") == file_sha(plan_csv):
+        log("plan: up to date")
+        return plan_csv
+    rep = plan_clips(csv_path, ns, plan_csv, cfg, s.mode)
+    with m.lock:
+        ent["plan"] = {"key": key, "csv": str(plan_csv), "csv_sha": file_sha(plan_csv)}
+        m.save()
+    log(f"plan: {rep.scenes} scenes → {rep.clips} clips ({rep.dropped} too short), "
+        f"{rep.clip_seconds:.0f}s of {rep.scene_seconds:.0f}s")
+    return plan_csv
+
+def split_params(s: RunSettings, encode: Optional[EncodePlan] = None) -> dict:
+    """How clips are cut: part of the split key and of every per-clip range key."""
+    params = {"engine": s.engine, "copy": s.copy}
+    if s.engine == "ffmpeg-smart":
+        params = {"engine": s.engine, "snap": s.snap}
+    if encode:
+        if s.engine != "ffmpeg":
+            raise ValueError(f"Encode profiles and resampling (normalize.fps/size) need the ffmpeg engine, "
+                             f"not {s.engine}")
+        params = {"engine": s.engine, **encode.params()}
+    return params
+
+def clip_keys(src_sig: dict, ranges: list[tuple[str, str]], params: dict) -> dict[str, str]:
+    """Clip file name (00001.mkv, ...) → key of the range and params it was cut with."""
+    return {f"{i:05d}.mkv": _digest(src_sig, a, b, params) for i, (a, b) in enumerate(ranges, start=1)}
+
+def stage_split(src: Path, csv_path: Path, s: RunSettings, m: Manifest, force: bool, log: Log,
+                encode: Optional[EncodePlan] = None) -> Path:
+    ent = m.source(src)
+    outdir = s.clips_root / set_name(src)
+    archive = s.archive_root / set_name(src) if encode and encode.archive else None
+    params = split_params(s, encode)
+    src_sig = file_sig(src)
+    key = _digest(src_sig, file_sha(csv_path), params)
+    prev = ent.get("split", {})
+    with m.lock:
+        old: dict = dict(prev.get("clips", {}))
+
+    def _drop(keep) -> None:
+        """Clips recorded earlier that this split does not write: the scene list shrank, or another
+        engine named them (mkvmerge's scene-0001.mkv vs 00001.mkv)."""
+        for name in [n for n in old if n not in keep]:
+            (outdir / name).unlink(missing_ok=True)
+            (s.archive_root / set_name(src) / name).unlink(missing_ok=True)
+            del old[name]
+
+    if s.engine not in ("ffmpeg", "ffmpeg-smart"):
+        # One mkvmerge / segment-muxer process per source: all-or-nothing, so any recorded
+        # clip deleted or changed since re-splits the whole source.
+        if (not force and prev.get("key") == key and old
+                and all((outdir / n).exists() and file_sig(outdir / n) == rec["sig"] for n, rec in old.items())):
+            log("split: up to date")
+            return outdir
+        if s.engine == "mkvmerge":
+            outs = split_with_mkvmerge(src, csv_path, outdir)
+        else:
+            results = split_with_ffmpeg_segment(src, csv_path, outdir, s.copy)
+            failed = [r for r in results if not r.ok]
+            if failed:
+                raise RuntimeError(f"{len(failed)} clips failed to split from {src}: {failed[0].error}")
+            outs = [r.out for r in results]
+        _drop({p.name for p in outs})
+        with m.lock:
+            ent["split"] = {"key": key, "outdir": str(outdir), "clips": {p.name: {"sig": file_sig(p)} for p in outs}}
+            m.save()
+        log(f"split: wrote {outdir}")
+        return outdir
+
+    # Per-clip resume: a clip is done when its range/params match and the file is untouched.
+    ranges = _scene_table(csv_path).ranges()
+    want = clip_keys(src_sig, ranges, params)
+    _drop(want)
+    clips = old if prev.get("params") == params else {}
+
+    def _done(name: str) -> bool:
+        rec, p = clips.get(name), outdir / name
+        return (not force and rec is not None and rec["range"] == want[name]
+                and p.exists() and file_sig(p) == rec["sig"] and (archive is None or (archive / name).exists()))
+
+    todo = {i for i, name in enumerate(want, start=1) if not _done(name)}
+    with m.lock:
+        ent["split"] = {"key": key, "outdir": str(outdir), "params": params, "clips": clips}
+    if not todo:
+        log("split: up to date")
+        return outdir
+
+    def _record(res, done, total):
+        if res.ok:
+            sig = file_sig(res.out)
+            with m.lock:
+                clips[res.out.name] = {"range": want[res.out.name], "sig": sig}
+                m.save_soon()
+
+    log(f"split: cutting {len(todo)}/{len(want)} clips")
+    try:
+        if s.engine == "ffmpeg-smart":
+            results = split_with_ffmpeg_smart(src, csv_path, outdir, s.snap, s.jobs, _record, only=todo)
+        else:
+            jobs = s.jobs or (default_jobs(False, encode.threads) if encode else None)
+            results = split_with_ffmpeg(src, csv_path, outdir, s.copy, jobs, _record, only=todo,
+                                        encode=encode.args if encode else None,
+                                        archive=(archive, encode.archive) if archive else None)
+    finally:
+        m.save()  # Ctrl-C / crash: keep every clip finished so far
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f"{len(failed)} clips failed to split from {src}: {failed[0].error}")
+    return outdir
+
+def stage_review_inc(src: Path, clips_dir: Path, s: RunSettings, m: Manifest, force: bool, log: Log,
+                     quality: Optional[QualityThresholds] = None) -> Path:
+    ent = m.source(src)
+    clips = sorted([*clips_dir.glob("*.mkv"), *clips_dir.glob("*.mp4")])
+    dupes = None
+    if s.dedupe:
+        # Other sources' clips change what counts as a duplicate here, so this always runs
+        # (only new/changed clips are decoded) and its result is part of the key.
+        idx = fingerprint_clips(clips, DEFAULT_INDEX, s.jobs)
+        mine = {str(c) for c in clips}
+        dupes = {k: v for k, v in idx.duplicates(s.dupe_dist).items() if k in mine}
+    key = _digest([(c.name, file_sig(c)) for c in clips], dupes, asdict(quality) if quality else None,
+                  s.previews)
+    prev = ent.get("review", {})
+    base = s.review_root / clips_dir.name
+    if not force and prev.get("key") == key and (base / "manifest.csv").exists():
+        log("review: up to date")
+        return base
+    base = stage_review(clips_dir, s.review_root, dupes=dupes, quality=quality, jobs=s.jobs)
+    if dupes:
+        log(f"review: {len(dupes)}/{len(clips)} clips repeat earlier footage (dup_of)")
+    if quality:
+        rejected = sum(1 for c in clips if (base / "reject" / c.name).exists())
+        log(f"review: {rejected}/{len(clips)} clips in reject/ after quality scoring")
+    if s.previews:
+        failed = [n for n, err in build_previews(base, clips).items() if err]
+        write_review_index(base)
+        log(f"review: previews in {base / 'index.html'}" + (f" ({len(failed)} failed)" if failed else ""))
+    with m.lock:
+        ent["review"] = {"key": key, "base": str(base)}
+        m.save()
+    log(f"review: wrote {base / 'manifest.csv'}")
+    return base
+
+def normalize_settings(s: RunSettings, cfg: dict) -> NormalizeSettings:
+    """`normalize:` with the clip profile's fps/size filling in what it leaves unset (windows count its frames)."""
+    ns = NormalizeSettings.from_config(cfg)
+    clip = EncodeSettings.from_config(cfg, profile=s.profile, archive=s.archive).clip_profile()
+    if clip:
+        for name in ("fps", "size"):
+            mine, theirs = getattr(ns, name), getattr(clip, name)
+            if mine and theirs and mine != theirs:
+                raise ValueError(f"normalize.{name} ({mine}) and encode profile {s.profile or 'encode.profile'} "
+                                 f"({theirs}) disagree")
+            setattr(ns, name, mine or theirs)
+    return ns
+
+def source_encode(src: Path, s: RunSettings, m: Manifest, cfg: dict) -> Optional[EncodePlan]:
+    """
+    Output args stage_split re-encodes `src`'s clips with: the encode profile
+    (with normalize fps/size and the archive tier), or the plain re-encode
+    when only normalize resamples. None = cut as the engine normally would.
+    """
+    es = EncodeSettings.from_config(cfg, profile=s.profile, archive=s.archive)
+    clip, archive = es.clip_profile(), es.archive_profile()
+    ns = normalize_settings(s, cfg) if s.normalize else None
+    if clip is None and ns and (ns.fps or ns.size):
+        clip = EncodeProfile()
+    if clip is None:
+        return None
+    if ns:
+        clip = replace(clip, fps=ns.fps, size=ns.size)
+    bars = None
+    if wants_bars(clip, archive):
+        ent, sig = m.source(src), file_sig(src)
+        with m.lock:
+            prev = ent.get("bars")
+        if prev and prev.get("sig") == sig:
+            bars = prev["crop"]
+        else:
+            bars = detect_bars(src)
+            with m.lock:
+                ent["bars"] = {"sig": sig, "crop": bars}
+                m.save()
+    return encode_plan(clip, archive, bars, ns.frames() if ns else None)
+
+def quality_thresholds(s: RunSettings, cfg: dict) -> Optional[QualityThresholds]:
+    return QualityThresholds.from_config(cfg) if s.quality else None
+
+@dataclass
+class SourceOutcome:
+    source: Path
+    ok: bool = True
+    error: Optional[str] = None
+    stages: list[str] = field(default_factory=list)
+
+    def logger(self, log: Optional[Log]) -> Log:
+        """Log function that records stage messages here and forwards them prefixed with the movie."""
+        def _log(msg: str) -> None:
+            self.stages.append(msg)
+            if log:
+                log(f"[{set_name(self.source)}] {msg}")
+        return _log
+
+    def fail(self, e: BaseException, log: Log) -> None:
+        self.ok, self.error = False, str(e)
+        log(f"FAILED: {e}")
+
+def process_source(src: Path, s: RunSettings, m: Manifest, cfg: dict,
+                   force: bool = False, log: Optional[Log] = None) -> SourceOutcome:
+    """detect → (plan) → split → review for one source, skipping stages whose inputs are unchanged."""
+    out = SourceOutcome(src)
+    _log = out.logger(log)
+    try:
+        csv_path = stage_plan(src, stage_scenes(src, s, m, cfg, force, _log), s, m, cfg, force, _log)
+        clips_dir = stage_split(src, csv_path, s, m, force, _log, source_encode(src, s, m, cfg))
+        stage_review_inc(src, clips_dir, s, m, force, _log, quality_thresholds(s, cfg))
+    except Exception as e:  # keep going with the next source; the manifest keeps what finished
+        out.fail(e, _log)
+    return out
+
+def prepare_run(s: RunSettings, state: Path = DEFAULT_STATE) -> tuple[list[Path], dict, Manifest]:
+    """Sources to process, detector config and the loaded manifest for a run."""
+    sources = find_sources(s.sources_dir)
+    if not sources:
+        raise FileNotFoundError(f"No {'/'.join(SOURCE_EXTS)} files found under {s.sources_dir}")
+    cfg = load_scenedetect_config(s.config)
+    m = Manifest(state)
+    m.data["settings"] = json.loads(json.dumps(asdict(s), default=str))
+    return sources, cfg, m
+
+def run_pipeline(s: RunSettings, state: Path = DEFAULT_STATE, force: bool = False,
+                 log: Optional[Log] = None) -> list[SourceOutcome]:
+    """
+    Drive detect → split → review for every source under `s.sources_dir`,
+    recording fingerprints in the manifest at `state` so a re-run only does
+    the work whose inputs changed (new disc, edited CSV, different params),
+    and an interrupted run resumes at the clip it stopped on.
+    """
+    sources, cfg, m = prepare_run(s, state)
+    return [process_source(src, s, m, cfg, force, log) for src in sources]
@@ -0,0 +1,194 @@
+# src/dataprep/preview.py
+from __future__ import annotations
+import csv, html, json, os, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import instrument
+from .core import _ensure_dir, _which
+from .probe import ProbeCache, probe_duration
+
+# ------------------------------------------------------------
+# Contact sheet + proxy per clip (one decode, two outputs)
+# ------------------------------------------------------------
+
+SHEET_TILES = 6         # thumbnails per contact sheet, evenly over the clip
+SHEET_WIDTH = 192       # pixels per thumbnail
+PROXY_HEIGHT = 270
+PROXY_ARGS = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "32", "-pix_fmt", "yuv420p",
+              "-c:a", "aac", "-b:a", "64k", "-ac", "2", "-movflags", "+faststart"]
+DEFAULT_PREVIEW_JOBS = 3  # previews are read-heavy: a few at a time keep a network share responsive
+
+def preview_paths(base: Path, clip: Path) -> tuple[Path, Path]:
+    """
+    (contact sheet, proxy) for `clip` under <review base>/preview/, named
+    after the whole file name (00001.mkv → 00001_mkv.jpg), so 00001.mkv and
+    00001.mp4 in one set keep separate previews.
+    """
+    d = base / "preview"
+    key = f"{clip.stem}_{clip.suffix.lstrip('.')}" if clip.suffix else clip.name
+    return d / f"{key}.jpg", d / f"{key}.mp4"
+
+def make_preview(ff: str, clip: Path, sheet: Path, proxy: Path, duration: float) -> Optional[str]:
+    """
+    Decode `clip` once: split the video into a SHEET_TILES x 1 thumbnail strip
+    and a PROXY_HEIGHT-line low-bitrate MP4 (audio kept if present). Both are
+    written under temporary names; returns ffmpeg's error text on failure.
+    """
+    fps = SHEET_TILES / max(duration, 1e-3)
+    graph = (f"[0:v]split=2[s][p];"
+             f"[s]fps={fps:.6f},scale={SHEET_WIDTH}:-2,tile={SHEET_TILES}x1[sheet];"
+             f"[p]scale=-2:{PROXY_HEIGHT}[proxy]")
+    tmp_sheet = sheet.with_name(f"{sheet.stem}.part{sheet.suffix}")
+    tmp_proxy = proxy.with_name(f"{proxy.stem}.part{proxy.suffix}")
+    cmd = [ff, "-hide_banner", "-loglevel", "error", "-y", "-i", str(clip),
+           "-filter_complex", graph,
+           "-map", "[sheet]", "-frames:v", "1", "-q:v", "4", "-update", "1", str(tmp_sheet),
+           "-map", "[proxy]", "-map", "0:a:0?", *PROXY_ARGS, str(tmp_proxy)]
+    try:
+        res = instrument.run(cmd, capture_output=True, text=True, errors="replace")
+        if res.returncode != 0:
+            return res.stderr.strip() or f"ffmpeg exited with {res.returncode}"
+        os.replace(tmp_sheet, sheet)
+        os.replace(tmp_proxy, proxy)
+        return None
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return str(e)
+    finally:
+        tmp_sheet.unlink(missing_ok=True)
+        tmp_proxy.unlink(missing_ok=True)
+
+_state_lock = threading.Lock()
+
+def _clip_sig(clip: Path) -> list:
+    st = clip.stat()
+    return [st.st_size, st.st_mtime_ns, SHEET_TILES, SHEET_WIDTH, PROXY_HEIGHT]
+
+@instrument.stage
+def build_previews(
+    base: Path,
+    clips: list[Path],
+    jobs: Optional[int] = None,
+    cache: Optional[ProbeCache] = None,
+    on_clip: Optional[Callable[[Path, Optional[str]], None]] = None,
+) -> dict[str, Optional[str]]:
+    """
+    Contact sheet + proxy for every clip under <base>/preview/, `jobs`
+    (default DEFAULT_PREVIEW_JOBS) ffmpeg processes at a time. Clips whose
+    size/mtime match preview/state.json and whose outputs exist are skipped;
+    previews of clips that are gone are deleted. Returns clip name → error
+    (None on success) for the clips processed in this call.
+    """
+    d = _ensure_dir(base / "preview")
+    state_path = d / "state.json"
+    try:
+        with state_path.open(encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    names = {c.name for c in clips}
+    for name in [n for n in state if n not in names]:
+        del state[name]
+    keep = {p.name for c in clips for p in preview_paths(base, c)}
+    for p in d.iterdir():  # clips that are gone, and previews named by the old <stem>.jpg scheme
+        if p.suffix in (".jpg", ".mp4") and p.name not in keep and ".part." not in p.name:
+            p.unlink(missing_ok=True)
+
+    def _fresh(c: Path) -> bool:
+        return state.get(c.name) == _clip_sig(c) and all(p.exists() for p in preview_paths(base, c))
+
+    todo = [c for c in clips if not _fresh(c)]
+    results: dict[str, Optional[str]] = {}
+    if todo:
+        ff = _which("ffmpeg")
+        own_cache = cache is None
+        if own_cache:
+            cache = ProbeCache()
+        cache.probe_many(todo)  # durations in one batch; the workers then hit the cache
+
+        def _one(c: Path) -> Optional[str]:
+            dur = probe_duration(cache.probe(c))
+            if not dur:
+                return f"No duration for {c}"
+            return make_preview(ff, c, *preview_paths(base, c), dur)
+
+        ex = ThreadPoolExecutor(max_workers=jobs or DEFAULT_PREVIEW_JOBS)
+        try:
+            futs = {instrument.submit(ex, _one, c): c for c in todo}
+            for fut in as_completed(futs):
+                c = futs[fut]
+                err = results[c.name] = fut.result()
+                with _state_lock:
+                    if err is None:
+                        state[c.name] = _clip_sig(c)
+                    else:
+                        state.pop(c.name, None)
+                if on_clip:
+                    on_clip(c, err)
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+            if own_cache:
+                cache.close()
+    tmp = state_path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, state_path)
+    return results
+
+# ------------------------------------------------------------
+# Static HTML index (rendered from manifest.csv + preview/)
+# ------------------------------------------------------------
+
+_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body{{font:13px system-ui,sans-serif;margin:1em;background:#111;color:#ddd}}
+.clip{{display:inline-block;vertical-align:top;margin:0 .6em .9em 0;width:{width}px}}
+.clip img,.clip video{{width:100%;display:block;cursor:pointer;background:#000}}
+.meta{{padding:.2em 0;font-size:12px;color:#aaa}} .meta b{{color:#eee}}
+.reject{{opacity:.45}} .why,.dup{{color:#e88}}
+</style></head><body>
+<h1>{title}</h1><p>{summary}</p>
+{cards}
+<script>
+document.querySelectorAll('.clip img').forEach(function(img){{
+  img.onclick=function(){{var v=document.createElement('video');v.src=img.dataset.proxy;
+    v.controls=true;v.autoplay=true;v.preload='none';img.replaceWith(v);}};
+}});
+</script></body></html>
+"""
+
+def write_review_index(base: Path) -> Path:
+    """
+    <base>/index.html: one card per manifest row with the contact sheet
+    (click → play the proxy in place), duration and whatever score, dup_of
+    and auto_reject columns the manifest has. Paths are relative, so the
+    page works straight off a network share.
+    """
+    with (base / "manifest.csv").open(newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    skip = {"file", "duration_s", "dup_of", "auto_reject"}
+    cards, rejected = [], 0
+    for r in rows:
+        sheet, proxy = preview_paths(base, Path(r["file"]))
+        why, dup = r.get("auto_reject") or "", r.get("dup_of") or ""
+        rejected += bool(why)
+        extra = " · ".join(f"{k} {html.escape(v)}" for k, v in r.items() if k not in skip and v)
+        img = (f'<img loading="lazy" src="preview/{html.escape(sheet.name)}" '
+               f'data-proxy="preview/{html.escape(proxy.name)}" alt="{html.escape(r["file"])}">'
+               if sheet.exists() else "")
+        cards.append(
+            f'<div class="clip{" reject" if why else ""}">{img}<div class="meta">'
+            f'<b>{html.escape(r["file"])}</b> {html.escape(r.get("duration_s") or "")}s'
+            + (f"<br>{extra}" if extra else "")
+            + (f'<br><span class="dup">dup of {html.escape(dup)}</span>' if dup else "")
+            + (f'<br><span class="why">{html.escape(why)}</span>' if why else "")
+            + "</div></div>")
+    summary = f"{len(rows)} clips" + (f", {rejected} auto-rejected" if rejected else "")
+    out = base / "index.html"
+    tmp = out.with_suffix(".tmp")
+    tmp.write_text(_PAGE.format(title=html.escape(base.name), summary=summary,
+                                width=SHEET_WIDTH * 3, cards="\n".join(cards)), encoding="utf-8")
+    os.replace(tmp, out)
+    return out
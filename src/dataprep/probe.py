@@ -0,0 +1,337 @@
+# src/dataprep/probe.py
+from __future__ import annotations
+import hashlib, json, os, sqlite3, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from . import instrument, procs
+from .core import _which, _ensure_dir
+from .headers import read_header
+
+# ------------------------------------------------------------
+# ffprobe
+# ------------------------------------------------------------
+
+PROBE_TIMEOUT = 120.0  # seconds; a header probe taking longer means a hung share or a broken file
+
+def _ffprobe_cmd(path: Path) -> list[str]:
+    return [_which("ffprobe"), "-v", "error", "-print_format", "json",
+            "-show_streams", "-show_format", str(path)]
+
+def _ffprobe_result(path: Path, res: subprocess.CompletedProcess) -> dict:
+    if res.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {res.stderr.strip()}")
+    return json.loads(res.stdout)
+
+def ffprobe_json(path: Path) -> dict:
+    """Full `ffprobe -show_streams -show_format` output for one file."""
+    try:
+        res = instrument.run(_ffprobe_cmd(path), capture_output=True, text=True, errors="replace",
+                             timeout=PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"ffprobe timed out after {PROBE_TIMEOUT:g}s on {path}") from None
+    return _ffprobe_result(path, res)
+
+def probe_duration(info: dict) -> Optional[float]:
+    """format.duration from ffprobe JSON, or None if absent/unparsable."""
+    try:
+        return float(info["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# ------------------------------------------------------------
+# Many files at once → columnar table
+# ------------------------------------------------------------
+
+DEFAULT_HEADER_JOBS = 8  # header reads are small and latency-bound (network shares)
+
+def _rate(r: Optional[str]) -> float:
+    try:
+        return float(Fraction(r)) if r and not r.startswith("0/") else float("nan")
+    except (ValueError, ZeroDivisionError):
+        return float("nan")
+
+@dataclass
+class ProbeTable:
+    """
+    Probe results column by column, one row per requested path (same order):
+    duration/fps are NaN and width/height 0 when unknown; vcodec/acodec are
+    "" without such a stream; source is "header" (container parsed
+    in-process), "ffprobe" or "cache"; error is None unless the file could
+    not be probed at all.
+    """
+    paths: list[Path]
+    duration: np.ndarray
+    width: np.ndarray
+    height: np.ndarray
+    fps: np.ndarray
+    vcodec: list[str]
+    acodec: list[str]
+    source: list[str]
+    error: list[Optional[str]]
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @classmethod
+    def from_infos(cls, paths: Sequence[Path], infos: Sequence[Optional[dict]],
+                   source: Sequence[str], error: Sequence[Optional[str]]) -> "ProbeTable":
+        n = len(paths)
+        t = cls(list(paths), np.full(n, np.nan), np.zeros(n, np.int32), np.zeros(n, np.int32),
+                np.full(n, np.nan), [""] * n, [""] * n, list(source), list(error))
+        for i, info in enumerate(infos):
+            if not info:
+                continue
+            t.duration[i] = probe_duration(info) or np.nan
+            streams = info.get("streams", [])
+            v = next((st for st in streams if st.get("codec_type") == "video"), None)
+            a = next((st for st in streams if st.get("codec_type") == "audio"), None)
+            if v:
+                t.width[i], t.height[i] = v.get("width") or 0, v.get("height") or 0
+                fps = _rate(v.get("avg_frame_rate"))
+                t.fps[i] = fps if fps == fps else _rate(v.get("r_frame_rate"))
+                t.vcodec[i] = v.get("codec_name") or ""
+            if a:
+                t.acodec[i] = a.get("codec_name") or ""
+        return t
+
+def probe_files(paths: Sequence[Path], jobs: Optional[int] = None,
+                headers: bool = True) -> list[tuple[Optional[dict], str, Optional[str]]]:
+    """
+    (info, source, error) per path, without a cache. Container headers are
+    parsed in-process (dataprep.headers, `jobs` files at a time); only files
+    they cannot vouch for are handed to ffprobe, all at once through the
+    process executor (which bounds how many run concurrently).
+    """
+    found: list[Optional[dict]] = [None] * len(paths)
+    if headers and paths:
+        with ThreadPoolExecutor(max_workers=jobs or DEFAULT_HEADER_JOBS) as ex:
+            found = list(ex.map(read_header, paths))
+    out: list[tuple[Optional[dict], str, Optional[str]]] = [(info, "header", None) for info in found]
+    ex = procs.executor()
+    pending = {}
+    for i, p in enumerate(paths):
+        if found[i] is None:
+            try:
+                pending[i] = ex.submit(_ffprobe_cmd(p), capture_output=True, text=True, errors="replace",
+                                       timeout=PROBE_TIMEOUT)
+            except RuntimeError as e:  # ffprobe not on PATH
+                out[i] = (None, "ffprobe", str(e))
+    try:
+        for i, fut in pending.items():
+            try:
+                out[i] = (_ffprobe_result(paths[i], fut.result()), "ffprobe", None)
+            except subprocess.TimeoutExpired:
+                out[i] = (None, "ffprobe", f"ffprobe timed out after {PROBE_TIMEOUT:g}s on {paths[i]}")
+            except (OSError, RuntimeError, ValueError) as e:
+                out[i] = (None, "ffprobe", str(e))
+    except BaseException:
+        for fut in pending.values():
+            fut.cancel()
+        raise
+    return out
+
+def probe_many(paths: Sequence[Path], cache: Optional["ProbeCache"] = None, jobs: Optional[int] = None,
+               headers: bool = True) -> ProbeTable:
+    """Columnar probe of many files: through `cache` when given (see ProbeCache.probe_many)."""
+    if cache is not None:
+        return cache.probe_many(paths, jobs, headers)
+    res = probe_files(list(paths), jobs, headers)
+    return ProbeTable.from_infos(list(paths), [r[0] for r in res], [r[1] for r in res], [r[2] for r in res])
+
+# ------------------------------------------------------------
+# Persistent cache
+# ------------------------------------------------------------
+
+DEFAULT_CACHE = Path("data/.cache/probe.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    head_hash TEXT,
+    info      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS probes_content ON probes(size, head_hash);
+"""
+
+def _partial_hash(path: Path, size: int, nbytes: int) -> str:
+    """blake2b over size + first/last `nbytes` bytes (cheap content identity)."""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with path.open("rb") as f:
+        h.update(f.read(nbytes))
+        if size > nbytes:
+            f.seek(max(nbytes, size - nbytes))
+            h.update(f.read(nbytes))
+    return h.hexdigest()
+
+class ProbeCache:
+    """
+    SQLite-backed ffprobe cache keyed on (path, size, mtime_ns).
+
+    With `hash_bytes > 0` a partial content hash is stored too, and a file that
+    misses by path (moved/renamed/hardlinked clip) is served from any entry with
+    the same size + hash. Safe to share between threads; WAL mode lets several
+    processes read it at once.
+
+    Entries filled by probe_many() may come from the container headers
+    ("probed_by": "header"): the ffprobe fields this package reads, not the
+    full output. probe(path, full=True) replaces such an entry with ffprobe's.
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_CACHE, hash_bytes: int = 0):
+        _ensure_dir(db_path.parent)
+        self.db_path = db_path
+        self.hash_bytes = hash_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ProbeCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return str(path.resolve())
+
+    def probe(self, path: Path, full: bool = False) -> dict:
+        """ffprobe JSON for `path`, from cache when the file is unchanged."""
+        key = self._key(path)
+        st = path.stat()
+        hh = _partial_hash(path, st.st_size, self.hash_bytes) if self.hash_bytes else None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT info FROM probes WHERE path=? AND size=? AND mtime_ns=?"
+                " AND (? IS NULL OR head_hash=?)",
+                (key, st.st_size, st.st_mtime_ns, hh, hh),
+            ).fetchone()
+            if row is None and hh is not None:
+                row = self._db.execute(
+                    "SELECT info FROM probes WHERE size=? AND head_hash=? LIMIT 1",
+                    (st.st_size, hh),
+                ).fetchone()
+                if row is not None:
+                    self._put(key, st, hh, row[0])  # remember the new path too
+            if row is not None and not (full and '"probed_by"' in row[0]):
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+
+        # Probe outside the lock so worker threads run ffprobe concurrently.
+        info = ffprobe_json(path)
+        with self._lock:
+            self._put(key, st, hh, json.dumps(info, separators=(",", ":")))
+        return info
+
+    def _put(self, key: str, st: os.stat_result, hh: Optional[str], info: str, commit: bool = True) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO probes(path, size, mtime_ns, head_hash, info)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, hh, info),
+        )
+        if commit:
+            self._db.commit()
+
+    def probe_many(self, paths: Sequence[Path], jobs: Optional[int] = None, headers: bool = True) -> ProbeTable:
+        """
+        probe() for many files as one table: a single lookup pass, the misses
+        probed together (probe_files: container headers, ffprobe only as
+        fallback) and stored with one commit. Files that cannot be stat'ed or
+        probed get a row with `error` set instead of raising.
+        """
+        paths = list(paths)
+        n = len(paths)
+        infos: list[Optional[dict]] = [None] * n
+        source, error = ["cache"] * n, [None] * n
+        keys, stats, hhs = [self._key(p) for p in paths], [None] * n, [None] * n
+        for i, p in enumerate(paths):
+            try:
+                stats[i] = p.stat()
+                if self.hash_bytes:
+                    hhs[i] = _partial_hash(p, stats[i].st_size, self.hash_bytes)
+            except OSError as e:
+                error[i] = str(e)
+        with self._lock:
+            known: dict[str, tuple] = {}
+            for k in range(0, n, 500):  # SQLite's bound-parameter limit
+                chunk = keys[k:k + 500]
+                known.update((r[0], r[1:]) for r in self._db.execute(
+                    f"SELECT path, size, mtime_ns, head_hash, info FROM probes"
+                    f" WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+            for i, st in enumerate(stats):
+                if st is None:
+                    continue
+                row = known.get(keys[i])
+                if row and row[:2] == (st.st_size, st.st_mtime_ns) and (hhs[i] is None or row[2] == hhs[i]):
+                    infos[i] = json.loads(row[3])
+                elif hhs[i] is not None:
+                    row = self._db.execute("SELECT info FROM probes WHERE size=? AND head_hash=? LIMIT 1",
+                                           (st.st_size, hhs[i])).fetchone()
+                    if row is not None:
+                        self._put(keys[i], st, hhs[i], row[0], commit=False)
+                        infos[i] = json.loads(row[0])
+            self._db.commit()
+        todo = [i for i in range(n) if infos[i] is None and error[i] is None]
+        self.hits += n - len(todo) - sum(e is not None for e in error)
+        self.misses += len(todo)
+        # Probe outside the lock: other threads keep hitting the cache meanwhile.
+        for i, (info, src, err) in zip(todo, probe_files([paths[i] for i in todo], jobs, headers)):
+            infos[i], source[i], error[i] = info, src, err
+        with self._lock:
+            for i in todo:
+                if infos[i] is not None:
+                    self._put(keys[i], stats[i], hhs[i], json.dumps(infos[i], separators=(",", ":")), commit=False)
+            self._db.commit()
+        return ProbeTable.from_infos(paths, infos, source, error)
+
+    def invalidate(self, paths: Optional[Iterable[Path]] = None) -> int:
+        """Drop entries for `paths` (or everything when None); returns rows removed."""
+        with self._lock:
+            if paths is None:
+                n = self._db.execute("DELETE FROM probes").rowcount
+            else:
+                n = sum(self._db.execute("DELETE FROM probes WHERE path=?", (self._key(p),)).rowcount
+                        for p in paths)
+            self._db.commit()
+        return n
+
+    def prune(self) -> int:
+        """Remove entries whose file is gone or has changed size/mtime."""
+        with self._lock:
+            rows = self._db.execute("SELECT path, size, mtime_ns FROM probes").fetchall()
+            dead = []
+            for key, size, mtime_ns in rows:
+                try:
+                    st = os.stat(key)
+                except OSError:
+                    dead.append((key,))
+                    continue
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    dead.append((key,))
+            self._db.executemany("DELETE FROM probes WHERE path=?", dead)
+            self._db.commit()
+        return len(dead)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+
+    def stats(self) -> str:
+        return f"probe cache: {self.hits} hits, {self.misses} misses ({self.db_path})"
@@ -0,0 +1,425 @@
+# src/dataprep/procs.py
+from __future__ import annotations
+import asyncio, atexit, locale, os, re, shutil, signal, subprocess, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from . import instrument
+
+# ------------------------------------------------------------
+# Tool resolution (once per process)
+# ------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def which(name: str) -> str:
+    """
+    Find an executable on PATH (Windows-friendly), once per process.
+    Raises a helpful error if missing (misses are not cached).
+    """
+    p = shutil.which(name) or shutil.which(f"{name}.exe")
+    if not p:
+        raise RuntimeError(f"{name} not found in PATH.")
+    return p
+
+@lru_cache(maxsize=None)
+def tool_version(name: str) -> Optional[str]:
+    """First line of `<tool> -version` (--version for non-ffmpeg tools), or None if it cannot run."""
+    flag = "-version" if name in ("ffmpeg", "ffprobe") else "--version"
+    try:
+        res = executor().run([which(name), flag], capture_output=True, text=True, errors="replace", timeout=30)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired):
+        return None
+    lines = (res.stdout or res.stderr or "").strip().splitlines()
+    return lines[0] if res.returncode == 0 and lines else None
+
+# ------------------------------------------------------------
+# Limits per tool class (WAN21_DP_PROCS / WAN21_DP_TIMEOUTS or configure())
+# ------------------------------------------------------------
+
+TOOL_CLASSES = ("ffmpeg", "ffprobe", "mkvmerge", "scenedetect", "other")
+KILL_GRACE = 2.0  # seconds between SIGTERM and SIGKILL on Ctrl-C
+
+def tool_class(exe: str) -> str:
+    name = Path(exe).stem.lower()
+    return name if name in TOOL_CLASSES else "other"
+
+def default_limits() -> dict[str, int]:
+    """
+    Processes allowed at once per tool class, across every stage and thread:
+      • ffmpeg/other → one per CPU (the stages' own --jobs default)
+      • ffprobe      → two per CPU (mostly waiting on I/O)
+      • mkvmerge     → 2 (disk-bound; more only thrashes)
+      • scenedetect  → CPU/2 (one decode thread plus detector)
+    """
+    cpus = os.cpu_count() or 1
+    return {"ffmpeg": cpus, "ffprobe": 2 * cpus, "mkvmerge": 2, "scenedetect": max(1, cpus // 2), "other": cpus}
+
+def parse_spec(spec: Optional[str], what: str = "limit") -> dict[str, float]:
+    """"ffmpeg=4,ffprobe=16" → {"ffmpeg": 4.0, "ffprobe": 16.0}; unknown classes raise ValueError."""
+    out: dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, sep, value = part.partition("=")
+        name = name.strip().lower()
+        if not sep or name not in TOOL_CLASSES:
+            raise ValueError(f"Bad {what} {part!r}: expected <{'|'.join(TOOL_CLASSES)}>=<number>")
+        try:
+            out[name] = float(value)
+        except ValueError:
+            raise ValueError(f"Bad {what} {part!r}: {value!r} is not a number") from None
+        if out[name] <= 0:
+            raise ValueError(f"Bad {what} {part!r}: must be > 0")
+    return out
+
+# ------------------------------------------------------------
+# ffmpeg -progress
+# ------------------------------------------------------------
+
+_PROGRESS_LINE = re.compile(rb"^(frame|fps|stream_\d+_\d+_q|bitrate|total_size|out_time(?:_us|_ms)?"
+                            rb"|dup_frames|drop_frames|speed|progress)=(\S*)$")
+
+def progress_seconds(p: dict[str, str]) -> Optional[float]:
+    """Output position of an ffmpeg progress block, in seconds (None while it is N/A)."""
+    try:
+        return int(p["out_time_us"]) / 1e6
+    except (KeyError, ValueError):
+        return None
+
+# ------------------------------------------------------------
+# Executor
+# ------------------------------------------------------------
+
+class _Interrupted(Exception):
+    """Raised on the loop for calls still queued when interrupt() ran (KeyboardInterrupt would stop the loop)."""
+
+def _decode(data: Optional[bytes], encoding: Optional[str], errors: Optional[str]) -> Optional[str]:
+    if data is None:
+        return None
+    text = data.decode(encoding or locale.getpreferredencoding(False), errors or "strict")
+    return text.replace("\r\n", "\n").replace("\r", "\n")  # like subprocess' universal newlines
+
+class ProcessExecutor:
+    """
+    Runs every external tool of the process on one asyncio loop (in a daemon
+    thread), so stages in any thread share the same bounds:
+      • a semaphore per tool class caps concurrent ffmpeg/ffprobe/mkvmerge/
+        scenedetect processes across all stages, sources and workers
+      • per-call timeouts (default per class) kill the child and raise
+        subprocess.TimeoutExpired
+      • ffmpeg's `-progress` blocks are parsed off stderr as they arrive
+      • interrupt() (Ctrl-C, see install_signal_handler) terminates every
+        running child, then SIGKILLs what is left after KILL_GRACE seconds;
+        worker threads that try to start another one within that grace
+        period get KeyboardInterrupt instead
+    Children are waited for and recorded by instrument.reap(), so --profile
+    keeps per-call CPU, peak RSS and I/O.
+    """
+
+    def __init__(self, limits: Optional[dict[str, float]] = None, timeouts: Optional[dict[str, float]] = None):
+        self.limits: dict[str, float] = default_limits()
+        self.timeouts: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sems: dict[str, asyncio.Semaphore] = {}
+        self._live: set[subprocess.Popen] = set()
+        self._interrupted = False
+        self._generation = 0  # bumped by interrupt(); calls queued before that never start
+        self.configure(limits, timeouts)
+
+    def configure(self, limits: Optional[dict[str, float]] = None,
+                  timeouts: Optional[dict[str, float]] = None) -> None:
+        """Change limits/timeouts per tool class; new limits apply once the running processes are done."""
+        with self._lock:
+            self.limits.update({k: max(1, int(v)) for k, v in (limits or {}).items()})
+            self.timeouts.update(timeouts or {})
+            self._sems = {}
+
+    # -- loop ----------------------------------------------------------
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="procs", daemon=True).start()
+            return self._loop
+
+    def _sem(self, tool: str) -> asyncio.Semaphore:  # loop thread only
+        with self._lock:
+            sem = self._sems.get(tool)
+            if sem is None:
+                sem = self._sems[tool] = asyncio.Semaphore(int(self.limits.get(tool, self.limits["other"])))
+            return sem
+
+    async def _acquire(self, tool: str, generation: int) -> asyncio.Semaphore:
+        sem = self._sem(tool)
+        await sem.acquire()
+        if generation != self._generation:  # queued behind the children interrupt() killed
+            sem.release()
+            raise _Interrupted
+        return sem
+
+    def _check_interrupted(self) -> None:
+        if self._interrupted:
+            if threading.current_thread() is not threading.main_thread():
+                raise KeyboardInterrupt  # a worker of a stage being interrupted: don't start anything new
+            self._interrupted = False    # the main thread moved on after the interrupt
+
+    def _spawn(self, cmd: Sequence[Any], **popen_kw: Any) -> subprocess.Popen:
+        proc = subprocess.Popen(cmd, **popen_kw)
+        with self._lock:
+            self._live.add(proc)
+        return proc
+
+    def _forget(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._live.discard(proc)
+
+    # -- async core ----------------------------------------------------
+
+    @staticmethod
+    async def _exited(proc: subprocess.Popen, deadline: Optional[float]) -> tuple[bool, Optional[float]]:
+        """Like instrument._wait_exited without blocking the loop: (exited before deadline, last VmHWM)."""
+        hwm, delay = None, 0.001
+        while not instrument.has_exited(proc):
+            hwm = instrument.peak_rss_mb(proc.pid) or hwm
+            if deadline is not None and time.monotonic() >= deadline:
+                return False, hwm
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return True, hwm
+
+    @staticmethod
+    async def _pipe(pipe):
+        if os.name != "posix":
+            return _ThreadPipe(pipe)
+        reader = asyncio.StreamReader(limit=2**20)
+        await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        return reader  # the transport closes `pipe` at EOF
+
+    async def _read_all(self, pipe) -> bytes:
+        return await (await self._pipe(pipe)).read()
+
+    async def _read_stderr(self, pipe, on_progress: Optional[Callable[[dict], None]], keep: bool) -> Optional[bytes]:
+        """Everything but progress lines (kept, or passed through when the caller didn't capture stderr)."""
+        reader = await self._pipe(pipe)
+        if on_progress is None:
+            return await reader.read()
+        rest, block = bytearray(), {}
+        while line := await reader.readline():
+            m = _PROGRESS_LINE.match(line.rstrip(b"\r\n"))
+            if m is None:
+                rest += line
+                continue
+            block[m[1].decode()] = m[2].decode()
+            if m[1] == b"progress":
+                on_progress(block)
+                block = {}
+        if keep:
+            return bytes(rest)
+        if rest:
+            os.write(2, bytes(rest))
+        return None
+
+    async def arun(self, cmd: Sequence[Any], timeout: Optional[float] = None,
+                   on_progress: Optional[Callable[[dict], None]] = None, capture_output: bool = False,
+                   text: bool = False, encoding: Optional[str] = None, errors: Optional[str] = None,
+                   _stage: Optional[str] = None, _generation: Optional[int] = None,
+                   **popen_kw: Any) -> subprocess.CompletedProcess:
+        """Coroutine behind run(); must run on this executor's loop (see submit())."""
+        instrument._current_stage.set(_stage)  # this task's own context copy
+        cmd = list(cmd)
+        tool = tool_class(str(cmd[0]))
+        timeout = self.timeouts.get(tool) if timeout is None else timeout
+        if capture_output:
+            popen_kw.setdefault("stdout", subprocess.PIPE)
+            popen_kw.setdefault("stderr", subprocess.PIPE)
+        keep_err = popen_kw.get("stderr") == subprocess.PIPE
+        if on_progress is not None and tool == "ffmpeg":
+            cmd[1:1] = ["-progress", "pipe:2", "-nostats"]
+            popen_kw["stderr"] = subprocess.PIPE
+        else:
+            on_progress = None
+        sem = await self._acquire(tool, self._generation if _generation is None else _generation)
+        try:
+            started, t0 = time.time(), time.perf_counter()
+            proc = self._spawn(cmd, **popen_kw)
+            loop = asyncio.get_running_loop()
+            readers = {}
+            if proc.stdout is not None:
+                readers["stdout"] = loop.create_task(self._read_all(proc.stdout))
+            if proc.stderr is not None:
+                readers["stderr"] = loop.create_task(self._read_stderr(proc.stderr, on_progress, keep_err))
+            error = None
+            try:
+                done, hwm = await self._exited(proc, None if timeout is None else time.monotonic() + timeout)
+                if not done:
+                    error = f"timed out after {timeout:g}s"
+                    proc.kill()
+                    _, hwm = await self._exited(proc, None)
+                out = {name: await t for name, t in readers.items()}
+            except BaseException:  # cancelled (Ctrl-C in the caller): don't leave the child running
+                proc.kill()
+                for t in readers.values():
+                    t.cancel()
+                instrument.reap(proc, cmd, started, t0, error="interrupted")
+                self._forget(proc)
+                raise
+            rc = instrument.reap(proc, cmd, started, t0, error=error, rss_mb=hwm)
+            self._forget(proc)
+        finally:
+            sem.release()
+        stdout, stderr = out.get("stdout"), out.get("stderr")
+        if text or encoding or errors:
+            stdout, stderr = _decode(stdout, encoding, errors), _decode(stderr, encoding, errors)
+        if error is not None:
+            raise subprocess.TimeoutExpired(cmd, timeout, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, rc, stdout, stderr)
+
+    # -- thread-facing API ---------------------------------------------
+
+    def submit(self, cmd: Sequence[Any], **kw: Any) -> Future:
+        """Start `cmd` (arguments as run()) without blocking; returns a concurrent.futures.Future."""
+        self._check_interrupted()
+        return asyncio.run_coroutine_threadsafe(
+            self.arun(cmd, _stage=instrument._current_stage.get(), _generation=self._generation, **kw),
+            self._get_loop())
+
+    def run(self, cmd: Sequence[Any], check: bool = False, **kw: Any) -> subprocess.CompletedProcess:
+        """
+        subprocess.run() look-alike (no stdin input) for any thread: waits for
+        a slot of the tool's class, then runs and records the child. Extra
+        keywords: timeout (seconds, default per class), on_progress (ffmpeg
+        only: called on the executor's thread with each -progress block).
+        """
+        fut = self.submit(cmd, **kw)
+        try:
+            res = fut.result()
+        except _Interrupted:
+            raise KeyboardInterrupt from None
+        except BaseException:
+            fut.cancel()
+            raise
+        if check:
+            res.check_returncode()
+        return res
+
+    @contextmanager
+    def popen(self, cmd: Sequence[Any], **popen_kw: Any) -> Iterator[subprocess.Popen]:
+        """
+        Streaming counterpart of run(): holds a slot of the tool's class while
+        the caller reads the child's pipes itself. The caller reaps the child
+        (instrument.reap); one still running on exit is killed and reaped.
+        """
+        self._check_interrupted()
+        loop = self._get_loop()
+        cmd = list(cmd)
+        fut = asyncio.run_coroutine_threadsafe(self._acquire(tool_class(str(cmd[0])), self._generation), loop)
+        try:
+            sem = fut.result()
+        except _Interrupted:
+            raise KeyboardInterrupt from None
+        except BaseException:
+            fut.cancel()
+            raise
+        try:
+            proc = self._spawn(cmd, **popen_kw)
+            try:
+                yield proc
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    instrument.reap(proc, cmd, time.time(), error="interrupted")
+                self._forget(proc)
+        finally:
+            loop.call_soon_threadsafe(sem.release)
+
+    # -- shutdown ------------------------------------------------------
+
+    def interrupt(self) -> None:
+        """Terminate every running child; SIGKILL the ones still alive KILL_GRACE seconds later."""
+        self._interrupted = True
+        self._generation += 1
+        with self._lock:
+            live = list(self._live)
+        for p in live:
+            _signal(p, signal.SIGTERM)
+        t = threading.Timer(KILL_GRACE, self._after_grace)
+        t.daemon = True
+        t.start()
+
+    def _after_grace(self) -> None:
+        self.kill_all()
+        self._interrupted = False  # the interrupted stages have unwound by now
+
+    def kill_all(self) -> None:
+        with self._lock:
+            live = list(self._live)
+        for p in live:
+            _signal(p, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+class _ThreadPipe:
+    """StreamReader stand-in where the loop has no pipe transports (Windows): blocking reads in a thread."""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    async def read(self) -> bytes:
+        try:
+            return await asyncio.to_thread(self.pipe.read)
+        finally:
+            self.pipe.close()
+
+    async def readline(self) -> bytes:
+        line = await asyncio.to_thread(self.pipe.readline)
+        if not line:
+            self.pipe.close()
+        return line
+
+def _signal(proc: subprocess.Popen, sig: int) -> None:
+    if proc.returncode is None:
+        try:
+            proc.send_signal(sig)
+        except OSError:
+            pass
+
+_executor: Optional[ProcessExecutor] = None
+_executor_lock = threading.Lock()
+
+def executor() -> ProcessExecutor:
+    """The process-wide executor, with limits/timeouts from WAN21_DP_PROCS / WAN21_DP_TIMEOUTS."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessExecutor(parse_spec(os.environ.get("WAN21_DP_PROCS"), "WAN21_DP_PROCS"),
+                                        parse_spec(os.environ.get("WAN21_DP_TIMEOUTS"), "WAN21_DP_TIMEOUTS"))
+            atexit.register(_executor.kill_all)
+            install_signal_handler()
+        return _executor
+
+def configure(limits: Optional[dict[str, float]] = None, timeouts: Optional[dict[str, float]] = None) -> None:
+    """Tune the shared executor (e.g. from CLI options) before stages start."""
+    executor().configure(limits, timeouts)
+
+def install_signal_handler() -> None:
+    """
+    Ctrl-C → executor().interrupt(), then the previous SIGINT handler (so
+    KeyboardInterrupt still unwinds the stage). No-op outside the main thread.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    prev = signal.getsignal(signal.SIGINT)
+    if prev in (signal.SIG_IGN, None) or getattr(prev, "_procs", False):
+        return  # Ctrl-C ignored (e.g. a background job), or already installed
+
+    def _on_sigint(signum, frame):
+        if _executor is not None:
+            _executor.interrupt()
+        if callable(prev):
+            prev(signum, frame)
+        else:
+            raise KeyboardInterrupt
+
+    _on_sigint._procs = True
+    signal.signal(signal.SIGINT, _on_sigint)
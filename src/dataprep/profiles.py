@@ -0,0 +1,207 @@
+# src/dataprep/profiles.py
+from __future__ import annotations
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from .framediff import RawFrameReader
+from .probe import ProbeCache
+from .quality import SAMPLE_WIDTH, _bar
+
+# ------------------------------------------------------------
+# Encode profiles (configs/scenedetect.yaml → encode: profiles:)
+# ------------------------------------------------------------
+
+@dataclass
+class EncodeProfile:
+    """
+    How the ffmpeg engine re-encodes a clip; the defaults are the plain
+    re-encode (libx264 veryfast CRF 18, 192k AAC).
+      crop    — "auto": cut the black bars seen on the source's keyframes,
+                "W:H:X:Y": a fixed crop in source pixels; applied before size
+      size    — "WxH": scale to cover, then center-crop
+      fps     — resample to this frame rate
+      audio   — encoder for the audio track, "copy", or false to drop audio
+                (WAN training never reads it)
+      threads — encoder threads per clip; the split then runs CPUs / threads
+                clips at once instead of every encoder sizing itself to the
+                whole machine
+    """
+    codec: str = "libx264"
+    preset: Optional[str] = "veryfast"
+    crf: Optional[float] = 18
+    pix_fmt: Optional[str] = None
+    crop: Optional[str] = None
+    size: Optional[str] = None
+    fps: Optional[float] = None
+    audio: Union[str, bool, None] = "aac"
+    audio_bitrate: Optional[str] = "192k"
+    threads: Optional[int] = None
+    extra: list[str] = field(default_factory=list)  # more encoder args, e.g. [-tune, film]
+
+    @classmethod
+    def from_dict(cls, name: str, sec: dict) -> "EncodeProfile":
+        unknown = set(sec) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown option(s) in encode profile {name!r}: {', '.join(sorted(unknown))}")
+        p = cls(**sec)
+        if p.crop not in (None, "auto"):
+            _crop_box(p.crop)
+        video_filters(p.size, p.fps)
+        return p
+
+    def filters(self, bars: Optional[str] = None) -> list[str]:
+        """Video filter chain; `bars` is the crop detect_bars() found for crop="auto"."""
+        box = bars if self.crop == "auto" else self.crop
+        return ([f"crop={box}"] if box else []) + video_filters(self.size, self.fps)
+
+    def codec_args(self) -> list[str]:
+        args = ["-c:v", self.codec]
+        if self.preset:
+            args += ["-preset", self.preset]
+        if self.crf is not None:
+            args += ["-crf", f"{self.crf:g}"]
+        if self.pix_fmt:
+            args += ["-pix_fmt", self.pix_fmt]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        args += [str(a) for a in self.extra]
+        if not self.audio:
+            return args + ["-an"]
+        args += ["-c:a", str(self.audio)]
+        if self.audio != "copy" and self.audio_bitrate:
+            args += ["-b:a", self.audio_bitrate]
+        return args
+
+def video_filters(size: Optional[str], fps: Optional[float]) -> list[str]:
+    """scale-to-cover + center crop to `size` ("WxH"), then resample to `fps`."""
+    vf = []
+    if size:
+        try:
+            w, h = (int(v) for v in size.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"size must look like 832x480, got {size!r}") from None
+        vf += [f"scale={w}:{h}:force_original_aspect_ratio=increase", f"crop={w}:{h}", "setsar=1"]
+    if fps:
+        vf.append(f"fps={fps:g}")
+    return vf
+
+def _crop_box(box: str) -> tuple[int, int, int, int]:
+    try:
+        w, h, x, y = (int(v) for v in box.split(":"))
+    except ValueError:
+        raise ValueError(f"crop must be auto or W:H:X:Y, got {box!r}") from None
+    return w, h, x, y
+
+@dataclass
+class EncodeSettings:
+    """
+    `profile` re-encodes every clip the ffmpeg engine cuts (None: stream
+    copy / the engine default); `archive` is a second profile written from
+    the same decode into the archive folder.
+    """
+    profile: Optional[str] = None
+    archive: Optional[str] = None
+    profiles: dict[str, EncodeProfile] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, cfg: dict, **overrides) -> "EncodeSettings":
+        """The `encode:` section of a config; `overrides` that are not None win."""
+        sec = dict(cfg.get("encode") or {})
+        sec.update({k: v for k, v in overrides.items() if v is not None})
+        unknown = set(sec) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown encode option(s): {', '.join(sorted(unknown))}")
+        profiles = {name: EncodeProfile.from_dict(name, p or {}) for name, p in (sec.pop("profiles", None) or {}).items()}
+        es = cls(profiles=profiles, **sec)
+        for name in (es.profile, es.archive):
+            if name and name not in profiles:
+                known = ", ".join(sorted(profiles)) or "none"
+                raise ValueError(f"Unknown encode profile {name!r} (config has: {known})")
+        if es.archive and not es.profile:
+            raise ValueError("encode.archive is written alongside a re-encode: set encode.profile too")
+        return es
+
+    def clip_profile(self) -> Optional[EncodeProfile]:
+        return self.profiles[self.profile] if self.profile else None
+
+    def archive_profile(self) -> Optional[EncodeProfile]:
+        return self.profiles[self.archive] if self.archive else None
+
+# ------------------------------------------------------------
+# Output args: one decode → clip tier (+ archive tier)
+# ------------------------------------------------------------
+
+@dataclass
+class EncodePlan:
+    """ffmpeg output args for every clip of one source, after the -ss/-to/-i input."""
+    args: list[str]
+    archive: Optional[list[str]] = None
+    threads: Optional[int] = None
+
+    def params(self) -> dict:
+        """Part of the split key: a changed profile re-cuts the clips."""
+        return {"encode": self.args, **({"archive": self.archive} if self.archive else {})}
+
+def encode_plan(clip: EncodeProfile, archive: Optional[EncodeProfile] = None, bars: Optional[str] = None,
+                frames: Optional[int] = None) -> EncodePlan:
+    """
+    Output args for `clip` and, with `archive`, a second output fed by a
+    split filter graph, so both tiers come from one decode of the range.
+    `frames` caps the clip tier (window_frames: -ss/-to rounding must not
+    add a frame).
+    """
+    cap = ["-frames:v", str(frames)] if frames else []
+    if archive is None:
+        vf = clip.filters(bars)
+        return EncodePlan([*(["-vf", ",".join(vf)] if vf else []), *cap, *clip.codec_args()],
+                          threads=clip.threads)
+    chains = [",".join(p.filters(bars)) or "null" for p in (clip, archive)]
+    graph = f"[0:v]split=2[c][a];[c]{chains[0]}[cv];[a]{chains[1]}[av]"
+    audio = lambda p: ["-map", "0:a:0?"] if p.audio else []
+    return EncodePlan(["-filter_complex", graph, "-map", "[cv]", *audio(clip), *cap, *clip.codec_args()],
+                      ["-map", "[av]", *audio(archive), *archive.codec_args()],
+                      threads=(clip.threads or 0) + (archive.threads or 0) or None)
+
+# ------------------------------------------------------------
+# crop: auto — black bars on every keyframe of the source
+# ------------------------------------------------------------
+
+BAR_MIN = 4  # px; thinner bars (overscan noise) are left alone
+
+def wants_bars(*profiles: Optional[EncodeProfile]) -> bool:
+    return any(p is not None and p.crop == "auto" for p in profiles)
+
+def detect_bars(src: Path, cache: Optional[ProbeCache] = None) -> Optional[str]:
+    """
+    "W:H:X:Y" cutting the letterbox/pillarbox bars that stay dark on every
+    keyframe of `src` (decoded gray, keyframes only, so a whole film costs a
+    few seconds), or None when there are none.
+    """
+    own_cache = cache is None
+    if own_cache:
+        cache = ProbeCache()
+    try:
+        v = next((st for st in cache.probe(src).get("streams", []) if st.get("codec_type") == "video"), None)
+    finally:
+        if own_cache:
+            cache.close()
+    if not v or not v.get("width") or not v.get("height"):
+        raise RuntimeError(f"No video stream in {src}")
+    w, h = int(v["width"]), int(v["height"])
+    row_max = col_max = None
+    for batch in RawFrameReader(src, SAMPLE_WIDTH, h, gray=True, batch=32, keyframes=True):
+        rows, cols = batch.mean(axis=2).max(axis=0), batch.mean(axis=1).max(axis=0)
+        row_max = rows if row_max is None else np.maximum(row_max, rows)
+        col_max = cols if col_max is None else np.maximum(col_max, cols)
+    if row_max is None:
+        raise RuntimeError(f"No keyframes decoded from {src}")
+    top, bottom = _bar(row_max), _bar(row_max[::-1])
+    left, right = (int(_bar(p) * w / SAMPLE_WIDTH) for p in (col_max, col_max[::-1]))
+    top, bottom, left, right = (b if b >= BAR_MIN else 0 for b in (top, bottom, left, right))
+    if top + bottom >= h or left + right >= w or not (top or bottom or left or right):
+        return None  # nothing to cut, or nothing but black (fade, test source)
+    cw, ch = (w - left - right) // 2 * 2, (h - top - bottom) // 2 * 2
+    return f"{cw}:{ch}:{left // 2 * 2}:{top // 2 * 2}"
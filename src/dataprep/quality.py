@@ -0,0 +1,211 @@
+# src/dataprep/quality.py
+from __future__ import annotations
+import json, os, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from . import instrument
+from .framecache import frame_reader
+from .probe import ProbeCache
+
+# ------------------------------------------------------------
+# Per-clip signals from decimated gray frames
+# ------------------------------------------------------------
+
+SAMPLE_WIDTH = 320     # columns decoded; rows stay at source height so interlaced lines survive
+BLACK_LUMA = 24        # frame mean at or below this → black
+BLANK_STD = 4.0        # frame std below this → flat colour (black, white, test card fill)
+BAR_LUMA = 24          # edge rows/columns never brighter than this → letterbox/pillarbox bar
+COMB_RATIO = 1.1       # adjacent-line vs same-field line difference above this → combed
+
+@dataclass
+class QualityScore:
+    """
+    Signals for one clip, over frames sampled at `sample_fps`:
+      black/blank/combing — fraction of sampled frames that are black, flat or combed
+      motion    — mean absolute luma change between consecutive samples (0-255)
+      sharpness — median Laplacian variance of the picture centre
+      letterbox — fraction of the frame covered by black bars
+    """
+    frames: int = 0
+    black: float = 0.0
+    blank: float = 0.0
+    motion: float = 0.0
+    sharpness: float = 0.0
+    letterbox: float = 0.0
+    combing: float = 0.0
+
+    def row(self) -> dict:
+        return {k: (round(v, 3) if isinstance(v, float) else v) for k, v in asdict(self).items()}
+
+QUALITY_FIELDS = [f.name for f in fields(QualityScore)]
+
+def _square(frames: np.ndarray, aspect: float) -> np.ndarray:
+    """Average line pairs (merging fields) and then whole rows, down to roughly square pixels."""
+    n, h, w = frames.shape
+    f = frames[:, : h // 2 * 2].reshape(n, h // 2, 2, w).mean(axis=2)
+    k = max(1, int(round((h / 2) / (w / aspect))))
+    if k > 1:
+        f = f[:, : f.shape[1] // k * k].reshape(n, -1, k, w).mean(axis=2)
+    return f
+
+def _laplacian_var(f: np.ndarray) -> np.ndarray:
+    lap = (f[:, 1:-1, :-2] + f[:, 1:-1, 2:] + f[:, :-2, 1:-1] + f[:, 2:, 1:-1]) - 4 * f[:, 1:-1, 1:-1]
+    return lap.reshape(len(f), -1).var(axis=1)
+
+def _combed(f: np.ndarray) -> np.ndarray:
+    """Per frame: lines of opposite fields differ much more than lines of the same field."""
+    d1 = np.abs(f[:, 1:-1] - f[:, 2:]).mean(axis=(1, 2))
+    d2 = np.abs(f[:, :-2] - f[:, 2:]).mean(axis=(1, 2))
+    return (d1 > 2.0) & (d1 > COMB_RATIO * (d2 + 1e-3))
+
+def _bar(profile: np.ndarray) -> int:
+    """Dark entries at the start of a row/column max profile."""
+    bright = np.flatnonzero(profile > BAR_LUMA)
+    return int(bright[0]) if len(bright) else len(profile)
+
+def score_clip(clip: Path, cache: ProbeCache, sample_fps: float = 2.0) -> QualityScore:
+    """Stream `sample_fps` frames/s of `clip` as gray and compute every signal batch by batch."""
+    info = cache.probe(clip)
+    v = next((st for st in info.get("streams", []) if st.get("codec_type") == "video"), None)
+    if not v or not v.get("width") or not v.get("height"):
+        raise RuntimeError(f"No video stream in {clip}")
+    h = int(v["height"]) // 2 * 2
+    aspect = int(v["width"]) / int(v["height"])
+    black, blank, combed, sharp, motion = [], [], [], [], []
+    row_max = col_max = prev = None
+    for batch in frame_reader(clip, SAMPLE_WIDTH, h, gray=True, fps=sample_fps, batch=16):
+        f = batch.astype(np.float32)
+        mean, std = f.mean(axis=(1, 2)), f.std(axis=(1, 2))
+        black.append(mean <= BLACK_LUMA)
+        blank.append(std < BLANK_STD)
+        rows, cols = f.mean(axis=2).max(axis=0), f.mean(axis=1).max(axis=0)
+        row_max = rows if row_max is None else np.maximum(row_max, rows)
+        col_max = cols if col_max is None else np.maximum(col_max, cols)
+        centre = f[:, h // 4: h - h // 4, SAMPLE_WIDTH // 8: SAMPLE_WIDTH - SAMPLE_WIDTH // 8]
+        combed.append(_combed(centre))
+        sq = _square(centre, aspect)
+        sharp.append(np.where(std < BLANK_STD, np.nan, _laplacian_var(sq)))
+        seq = sq if prev is None else np.concatenate([prev, sq])
+        motion.append(np.abs(np.diff(seq, axis=0)).mean(axis=(1, 2)))
+        prev = sq[-1:]
+    if row_max is None:
+        raise RuntimeError(f"No frames decoded from {clip}")
+    n = sum(len(b) for b in black)
+    top, bottom = _bar(row_max), _bar(row_max[::-1])
+    left, right = _bar(col_max), _bar(col_max[::-1])
+    active = max(0, len(row_max) - top - bottom) * max(0, len(col_max) - left - right)
+    sharp_a, motion_a = np.concatenate(sharp), np.concatenate(motion)
+    return QualityScore(
+        frames=n,
+        black=float(np.concatenate(black).mean()),
+        blank=float(np.concatenate(blank).mean()),
+        motion=float(motion_a.mean()) if len(motion_a) else 0.0,
+        sharpness=float(np.nanmedian(sharp_a)) if np.isfinite(sharp_a).any() else 0.0,
+        letterbox=1.0 - active / (len(row_max) * len(col_max)),
+        combing=float(np.concatenate(combed).mean()),
+    )
+
+# ------------------------------------------------------------
+# Thresholds (configs/scenedetect.yaml → quality:)
+# ------------------------------------------------------------
+
+@dataclass
+class QualityThresholds:
+    """A clip failing any limit is routed to reject/; None disables a limit."""
+    sample_fps: float = 2.0
+    max_black: Optional[float] = 0.5
+    max_blank: Optional[float] = 0.5
+    min_motion: Optional[float] = 0.5
+    min_sharpness: Optional[float] = 15.0
+    max_letterbox: Optional[float] = None
+    max_combing: Optional[float] = 0.3
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "QualityThresholds":
+        sec = dict(cfg.get("quality") or {})
+        unknown = set(sec) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown quality option(s): {', '.join(sorted(unknown))}")
+        return cls(**sec)
+
+    def verdict(self, s: QualityScore) -> Optional[str]:
+        """Why `s` fails (e.g. "static 0.12 < 0.5; combing 0.8 > 0.3"), or None when it passes."""
+        why = []
+        for name, value, limit, over in (
+            ("black", s.black, self.max_black, True),
+            ("blank", s.blank, self.max_blank, True),
+            ("static", s.motion, self.min_motion, False),
+            ("blurry", s.sharpness, self.min_sharpness, False),
+            ("letterbox", s.letterbox, self.max_letterbox, True),
+            ("combing", s.combing, self.max_combing, True),
+        ):
+            if limit is not None and (value > limit if over else value < limit):
+                why.append(f"{name} {value:.3g} {'>' if over else '<'} {limit:g}")
+        return "; ".join(why) or None
+
+# ------------------------------------------------------------
+# Stage: score clips in parallel, cached per review folder
+# ------------------------------------------------------------
+
+_cache_lock = threading.Lock()
+
+def _load_scores(path: Path) -> dict:
+    try:
+        with path.open(encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@instrument.stage
+def score_clips(
+    clips: list[Path],
+    sample_fps: float = 2.0,
+    jobs: Optional[int] = None,
+    cache: Optional[ProbeCache] = None,
+    scores_json: Optional[Path] = None,
+    on_clip: Optional[Callable[[Path, Optional[str]], None]] = None,
+) -> dict[str, QualityScore]:
+    """
+    QualityScore per clip (keyed by str(path)), `jobs` clips at a time. With
+    `scores_json`, results are kept there keyed by path + size/mtime + sample
+    rate, so a re-run only decodes new or changed clips. Clips that cannot be
+    decoded are reported through `on_clip(path, error)` and left out.
+    """
+    with _cache_lock:
+        known = _load_scores(scores_json) if scores_json else {}
+    sig = {str(c): [c.stat().st_size, c.stat().st_mtime_ns, sample_fps] for c in clips}
+    out = {k: QualityScore(**e["score"]) for k, e in known.items() if sig.get(k) == e.get("sig")}
+    todo = [c for c in clips if str(c) not in out]
+    if todo:
+        own_cache = cache is None
+        if own_cache:
+            cache = ProbeCache()
+        cache.probe_many(todo)  # stream info in one batch; the workers then hit the cache
+        ex = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+        try:
+            futs = {instrument.submit(ex, score_clip, c, cache, sample_fps): c for c in todo}
+            for fut in as_completed(futs):
+                c, err = futs[fut], None
+                try:
+                    out[str(c)] = fut.result()
+                except RuntimeError as e:
+                    err = str(e)
+                if on_clip:
+                    on_clip(c, err)
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+            if own_cache:
+                cache.close()
+    if scores_json:
+        with _cache_lock:
+            scores_json.parent.mkdir(parents=True, exist_ok=True)
+            tmp = scores_json.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({k: {"sig": sig[k], "score": asdict(v)} for k, v in out.items() if k in sig}, f)
+            os.replace(tmp, scores_json)
+    return out
@@ -0,0 +1,281 @@
+# src/dataprep/scenes.py
+from __future__ import annotations
+import csv, os
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .core import (
+    END_KEYS, SCENE_CSV_HEADER, START_KEYS, _ensure_dir, _open_csv_read, _pick_col, _tc_seconds,
+)
+
+# ------------------------------------------------------------
+# Timecodes, vectorized
+# ------------------------------------------------------------
+
+def tc_to_seconds(tcs) -> np.ndarray:
+    """
+    Timecodes → float64 seconds. The fixed HH:MM:SS.mmm form PySceneDetect
+    writes is decoded as a uint8 digit matrix in one pass; anything else
+    (H:MM:SS, no millis, plain seconds) falls back to _tc_seconds per value.
+    """
+    a = np.char.strip(np.asarray(tcs, dtype=str))
+    if a.size == 0:
+        return np.zeros(0, dtype=np.float64)
+    try:
+        b = a.astype("S12")
+    except UnicodeEncodeError:
+        return np.array([_tc_seconds(str(v)) for v in a], dtype=np.float64)
+    d = np.frombuffer(b.tobytes(), dtype=np.uint8).reshape(len(b), 12).astype(np.int64) - 48
+    digits = np.r_[0, 1, 3, 4, 6, 7, 9, 10, 11]
+    fixed = ((np.char.str_len(a) == 12)
+             & (d[:, 2] == ord(":") - 48) & (d[:, 5] == ord(":") - 48) & (d[:, 8] == ord(".") - 48)
+             & ((d[:, digits] >= 0) & (d[:, digits] <= 9)).all(axis=1))
+    out = ((d[:, 0] * 10 + d[:, 1]) * 3600 + (d[:, 3] * 10 + d[:, 4]) * 60 + d[:, 6] * 10 + d[:, 7]
+           + (d[:, 9] * 100 + d[:, 10] * 10 + d[:, 11]) / 1000.0)
+    for i in np.flatnonzero(~fixed):
+        out[i] = _tc_seconds(str(a[i]))
+    return out
+
+def seconds_to_tc(seconds: np.ndarray) -> list[str]:
+    """float seconds → HH:MM:SS.mmm strings (same rounding as _fmt_tc)."""
+    ms = np.rint(np.asarray(seconds, dtype=np.float64) * 1000).astype(np.int64)
+    h, ms = np.divmod(ms, 3_600_000)
+    m, ms = np.divmod(ms, 60_000)
+    s, ms = np.divmod(ms, 1000)
+    return [f"{a:02d}:{b:02d}:{c:02d}.{e:03d}" for a, b, c, e in zip(h.tolist(), m.tolist(), s.tolist(), ms.tolist())]
+
+# ------------------------------------------------------------
+# Scene table
+# ------------------------------------------------------------
+
+START_FRAME_KEYS = ("Start Frame",)
+END_FRAME_KEYS = ("End Frame",)
+
+@dataclass
+class SceneTable:
+    """
+    Scene list as columns: `start`/`end` in seconds and `start_frame`
+    (0-based, inclusive) / `end_frame` (exclusive) — i.e. PySceneDetect's
+    1-based "Start Frame" minus one and its "End Frame" as-is. Frames are
+    -1 when the CSV has none and no frame rate is known. `fps` is 0 when
+    unknown. Operations return new tables.
+    """
+    start: np.ndarray
+    end: np.ndarray
+    start_frame: np.ndarray
+    end_frame: np.ndarray
+    fps: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @property
+    def length(self) -> np.ndarray:
+        return self.end - self.start
+
+    def overlaps(self) -> bool:
+        """True when a scene starts before an earlier one ends (overlapping normalize windows)."""
+        if len(self) < 2:
+            return False
+        o = np.argsort(self.start, kind="stable")
+        return bool((self.start[o][1:] < np.maximum.accumulate(self.end[o])[:-1] - 1e-6).any())
+
+    def ranges(self) -> list[tuple[str, str]]:
+        """(start, end) HH:MM:SS.mmm timecodes per scene, for ffmpeg/mkvmerge."""
+        return list(zip(seconds_to_tc(self.start), seconds_to_tc(self.end)))
+
+    def _select(self, mask: np.ndarray) -> "SceneTable":
+        return replace(self, start=self.start[mask], end=self.end[mask],
+                       start_frame=self.start_frame[mask], end_frame=self.end_frame[mask])
+
+    def _frames_for(self, seconds: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+        return np.rint(seconds * self.fps).astype(np.int64) if self.fps > 0 else fallback
+
+    # -- operations ----------------------------------------------------
+
+    def trim(self, head: float = 0.0, tail: float = 0.0) -> "SceneTable":
+        """Cut `head` s off every scene start and `tail` s off every end; scenes left empty are dropped."""
+        if not head and not tail:
+            return self
+        start, end = self.start + head, self.end - tail
+        t = replace(self, start=start, end=end,
+                    start_frame=self._frames_for(start, self.start_frame),
+                    end_frame=self._frames_for(end, self.end_frame))
+        return t._select(t.end > t.start)
+
+    def merge_short(self, min_len: float) -> "SceneTable":
+        """
+        Greedily join each scene with the ones after it until the group is at
+        least `min_len` seconds long; a short remainder at the end joins the
+        last group. Group ends come from a searchsorted over cumulative
+        lengths, so the Python loop runs once per output scene, not per row.
+        """
+        n = len(self)
+        if n < 2 or min_len <= 0 or (self.length >= min_len).all():
+            return self
+        cum = np.r_[0.0, np.cumsum(self.length)]
+        heads, i = [], 0
+        while i < n:
+            heads.append(i)
+            i = max(i + 1, int(np.searchsorted(cum, cum[i] + min_len - 1e-9)))
+        if len(heads) > 1 and cum[n] - cum[heads[-1]] < min_len:
+            heads.pop()
+        h = np.array(heads, dtype=np.int64)
+        tails = np.r_[h[1:] - 1, n - 1]
+        return replace(self, start=self.start[h], end=self.end[tails],
+                       start_frame=self.start_frame[h], end_frame=self.end_frame[tails])
+
+    def split_long(self, max_len: float) -> "SceneTable":
+        """Split scenes longer than `max_len` seconds into equal parts no longer than it."""
+        if max_len <= 0 or not len(self) or (self.length <= max_len).all():
+            return self
+        parts = np.maximum(1, np.ceil(self.length / max_len - 1e-9).astype(np.int64))
+        idx = np.repeat(np.arange(len(self)), parts)
+        k = np.arange(len(idx)) - np.repeat(np.cumsum(parts) - parts, parts)  # part number within its scene
+        step = self.length[idx] / parts[idx]
+        start = self.start[idx] + k * step
+        end = np.where(k == parts[idx] - 1, self.end[idx], start + step)
+        flen = (self.end_frame - self.start_frame)[idx]
+        f0 = self.start_frame[idx]
+        known = f0 >= 0
+        sf = np.where(known, f0 + k * flen // parts[idx], -1)
+        ef = np.where(known, f0 + (k + 1) * flen // parts[idx], -1)
+        return replace(self, start=start, end=end, start_frame=sf, end_frame=ef)
+
+    def windows(self, window: float, stride: Optional[float] = None, min_len: float = 0.0) -> "SceneTable":
+        """
+        Training-clip plan: drop scenes shorter than `min_len`, keep scenes of
+        up to `window` seconds whole, and tile longer ones with `window`-second
+        clips starting every `stride` seconds (default `window`: back to back;
+        smaller: overlapping). A long scene's leftover shorter than a window is
+        dropped. With a known fps, windows start on a frame and span a fixed
+        number of frames.
+        """
+        t = self._select(self.length >= min_len) if min_len > 0 else self
+        if window <= 0 or not len(t):
+            return t
+        stride = stride or window
+        tiled = t.length > window + 1e-9
+        n = np.where(tiled, np.floor((t.length - window) / stride + 1e-9).astype(np.int64) + 1, 1)
+        idx = np.repeat(np.arange(len(t)), n)
+        k = np.arange(len(idx)) - np.repeat(np.cumsum(n) - n, n)  # window number within its scene
+        tiled = tiled[idx]
+        start = t.start[idx] + k * stride
+        if t.fps > 0:
+            sf = np.where(tiled, np.rint(start * t.fps).astype(np.int64), t.start_frame[idx])
+            ef = np.where(tiled, sf + int(round(window * t.fps)), t.end_frame[idx])
+            start = np.where(tiled, sf / t.fps, start)
+            end = np.where(tiled, ef / t.fps, t.end[idx])
+        else:
+            sf = ef = np.full(len(idx), -1, dtype=np.int64)
+            end = np.where(tiled, start + window, t.end[idx])
+        return replace(self, start=start, end=end, start_frame=sf, end_frame=ef)
+
+    def apply_config(self, cfg: dict, mode: str = "content") -> "SceneTable":
+        """
+        configs/scenedetect.yaml post-processing: `trim_seconds.head/tail`,
+        then merge scenes shorter than `detect_<mode>.min_scene_len` frames
+        (needs a known fps), then split scenes longer than `max_scene_seconds`.
+        Detectors already enforce min_scene_len; this re-applies it after
+        trimming and to hand-edited CSVs. Returns `self` when nothing changes.
+        """
+        trim = cfg.get("trim_seconds") or {}
+        t = self.trim(float(trim.get("head") or 0.0), float(trim.get("tail") or 0.0))
+        sec = cfg.get(f"detect_{mode}") or cfg.get("detect_content") or {}
+        min_frames = int(sec.get("min_scene_len") or 0)
+        if min_frames and t.fps > 0:
+            t = t.merge_short(min_frames / t.fps)
+        return t.split_long(float(cfg.get("max_scene_seconds") or 0.0))
+
+    # -- I/O -----------------------------------------------------------
+
+    @classmethod
+    def from_csv(cls, csv_path: Path) -> "SceneTable":
+        """Parse a PySceneDetect (or compatible) scene CSV once into columns."""
+        with _open_csv_read(csv_path) as f:
+            # `list-scenes` prepends a "Timecode List:" row unless run with --skip-cuts.
+            if not f.readline().startswith("Timecode List"):
+                f.seek(0)
+            rows = list(csv.reader(f))
+        if not rows:
+            raise ValueError(f"No header in {csv_path}")
+        header, rows = rows[0], [r for r in rows[1:] if r]
+        cols = list(zip(*rows)) if rows else [()] * len(header)
+
+        def col(keys: tuple[str, ...]) -> Optional[tuple]:
+            try:
+                return cols[header.index(_pick_col(header, keys))]
+            except KeyError:
+                return None
+
+        start = tc_to_seconds(col(START_KEYS) or ())
+        end = tc_to_seconds(col(END_KEYS) or ())
+        sf, ef = col(START_FRAME_KEYS), col(END_FRAME_KEYS)
+        if sf is not None and ef is not None and rows:
+            start_frame = np.asarray(sf, dtype=np.int64) - 1
+            end_frame = np.asarray(ef, dtype=np.int64)
+            dur = end - start
+            ok = dur > 0
+            fps = float(np.median((end_frame - start_frame)[ok] / dur[ok])) if ok.any() else 0.0
+        else:
+            start_frame = end_frame = np.full(len(start), -1, dtype=np.int64)
+            fps = 0.0
+        return cls(start, end, start_frame, end_frame, round(fps, 3))
+
+    def to_csv(self, csv_path: Path) -> Path:
+        """Write as a PySceneDetect-style scene list (frame columns only when they are known)."""
+        _ensure_dir(csv_path.parent)
+        frames = self.fps > 0 and bool((self.start_frame >= 0).all())
+        header = SCENE_CSV_HEADER if frames else [
+            h for h in SCENE_CSV_HEADER if h not in ("Start Frame", "End Frame", "Length (frames)")]
+        a_tc, b_tc, len_tc = seconds_to_tc(self.start), seconds_to_tc(self.end), seconds_to_tc(self.length)
+        with csv_path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(header)
+            for n, (a, b, fa, fb) in enumerate(zip(self.start.tolist(), self.end.tolist(),
+                                                   self.start_frame.tolist(), self.end_frame.tolist())):
+                if frames:
+                    w.writerow([n + 1, fa + 1, a_tc[n], f"{a:.3f}", fb, b_tc[n], f"{b:.3f}",
+                                fb - fa, len_tc[n], f"{b - a:.3f}"])
+                else:
+                    w.writerow([n + 1, a_tc[n], f"{a:.3f}", b_tc[n], f"{b:.3f}", len_tc[n], f"{b - a:.3f}"])
+        return csv_path
+
+    def save(self, path: Path, sig: tuple[int, int] = (0, 0)) -> Path:
+        tmp = path.with_name(f"{path.stem}.part.npz")
+        with tmp.open("wb") as f:
+            np.savez(f, start=self.start, end=self.end, start_frame=self.start_frame,
+                     end_frame=self.end_frame, fps=self.fps, sig=np.array(sig, dtype=np.int64))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["SceneTable", tuple[int, int]]:
+        with np.load(path) as z:
+            t = cls(z["start"], z["end"], z["start_frame"], z["end_frame"], float(z["fps"]))
+            return t, tuple(int(v) for v in z["sig"])
+
+def load_scene_table(csv_path: Path) -> SceneTable:
+    """
+    SceneTable for `csv_path`, cached as <csv stem>.npz next to it and
+    re-parsed whenever the CSV's size or mtime changes.
+    """
+    st = csv_path.stat()
+    sig = (st.st_size, st.st_mtime_ns)
+    cache = csv_path.with_suffix(".npz")
+    if cache.exists():
+        try:
+            t, cached = SceneTable.load(cache)
+            if cached == sig:
+                return t
+        except (OSError, ValueError, KeyError):
+            pass
+    t = SceneTable.from_csv(csv_path)
+    try:
+        t.save(cache, sig)
+    except OSError:  # read-only location: parsing is cheap enough to redo
+        pass
+    return t
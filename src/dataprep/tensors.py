@@ -0,0 +1,191 @@
+# src/dataprep/tensors.py
+from __future__ import annotations
+import csv, os, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from . import instrument
+from .core import _ensure_dir
+from .decisions import kept_rows
+from .framediff import RawFrameReader
+
+# ------------------------------------------------------------
+# Fixed-shape frame tensors for the keep set
+# ------------------------------------------------------------
+
+DEFAULT_TENSORS = Path("data/tensors")
+DEFAULT_SIZE = "832x480"
+DEFAULT_FRAMES = 81       # WAN 2.1 clip length
+DEFAULT_FPS = 16.0
+EXPORT_BATCH = 8          # frames per pipe read: memory stays ~2 batches per clip, whatever its length
+TENSOR_FIELDS = ["key", "file", "frames", "height", "width", "channels", "fps", "status",
+                 "source", "src_size", "src_mtime_ns", "error"]
+
+@dataclass
+class TensorSpec:
+    """What every exported clip looks like: (frames, height, width, 3 or 1) uint8 at `fps`."""
+    size: str = DEFAULT_SIZE
+    frames: int = DEFAULT_FRAMES
+    fps: float = DEFAULT_FPS
+    gray: bool = False
+    pad: bool = False         # repeat the last frame of a short clip instead of skipping it
+
+    def dims(self) -> tuple[int, int]:
+        try:
+            w, h = (int(v) for v in self.size.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"size must look like 832x480, got {self.size!r}") from None
+        return w, h
+
+    def shape(self) -> tuple[int, ...]:
+        w, h = self.dims()
+        return (self.frames, h, w) + (() if self.gray else (3,))
+
+    def folder(self, root: Path) -> Path:
+        """One folder per shape, so exports for different training setups sit side by side."""
+        return root / f"{self.size}-{self.frames}f-{self.fps:g}fps{'-gray' if self.gray else ''}"
+
+def export_clip(clip: Path, out: Path, spec: TensorSpec) -> tuple[str, int]:
+    """
+    Decode `clip` at spec.fps, scaled to cover spec.size and center-cropped,
+    straight into a memory-mapped .npy (via a .part file). Only the first
+    spec.frames frames are decoded. Returns (status, frames decoded):
+    "ok", or "short" when the clip ran out first and `pad` is off.
+    """
+    w, h = spec.dims()
+    tmp = out.with_name(f"{out.stem}.part.npy")
+    arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=spec.shape())
+    n, status = 0, "short"
+    try:
+        try:
+            for batch in RawFrameReader(clip, w, h, gray=spec.gray, fps=spec.fps, batch=EXPORT_BATCH, cover=True):
+                k = min(len(batch), spec.frames - n)
+                arr[n:n + k] = batch[:k].reshape(k, *arr.shape[1:])
+                n += k
+                if n == spec.frames:
+                    break  # the reader stops ffmpeg: the rest of a long clip is never decoded
+            if n == spec.frames or (spec.pad and n):
+                arr[n:] = arr[n - 1]
+                arr.flush()
+                status = "ok"
+        finally:
+            del arr  # unmap first: Windows refuses to rename or unlink a mapped file
+        if status == "ok":
+            os.replace(tmp, out)
+        return status, n
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def _load_manifest(path: Path) -> dict[str, dict]:
+    try:
+        with path.open(newline="", encoding="utf-8") as f:
+            return {r["key"]: r for r in csv.DictReader(f)}
+    except OSError:
+        return {}
+
+def _save_manifest(path: Path, rows: dict[str, dict]) -> None:
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=TENSOR_FIELDS, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows[k] for k in sorted(rows))
+    os.replace(tmp, path)
+
+@dataclass
+class ExportReport:
+    folder: Path
+    kept: int = 0
+    exported: int = 0
+    current: int = 0          # unchanged since an earlier run
+    short: list[str] = field(default_factory=list)
+    removed: int = 0          # no longer kept: array deleted
+    failed: list[tuple[str, str]] = field(default_factory=list)
+
+@instrument.stage
+def export_tensors(
+    review_root: Path = Path("data/review"),
+    root: Path = DEFAULT_TENSORS,
+    spec: Optional[TensorSpec] = None,
+    jobs: Optional[int] = None,
+    on_clip: Optional[Callable[[str, Optional[str]], None]] = None,
+) -> ExportReport:
+    """
+    Decode every kept clip (decisions.kept_rows) once into
+    <root>/<shape>/<set>/<clip stem>.npy, `jobs` clips at a time, and list
+    them in manifest.csv there (key, file, shape, frames actually decoded —
+    fewer than the array holds when padded — source size/mtime, status).
+    Resumable: a clip whose source is unchanged and whose array
+    exists is skipped (a "short" one too unless `pad` is now on; a padded
+    one goes again when it is off), the manifest is saved every few
+    seconds and arrays of clips no longer kept are deleted. Training opens
+    the arrays with np.load(..., mmap_mode="r").
+    """
+    spec = spec or TensorSpec()
+    spec.dims()
+    folder = _ensure_dir(spec.folder(root))
+    path = folder / "manifest.csv"
+    rows = _load_manifest(path)
+    kept = {f"{base.name}/{Path(row['file']).stem}": base / "keep" / row["file"] for base, row in kept_rows(review_root)}
+    rep = ExportReport(folder, kept=len(kept))
+
+    for key in [k for k in rows if k not in kept]:
+        (folder / rows[key]["file"]).unlink(missing_ok=True)
+        del rows[key]
+        rep.removed += 1
+
+    def _sig(clip: Path) -> list[str]:
+        st = clip.stat()
+        return [str(st.st_size), str(st.st_mtime_ns)]
+
+    def _done(key: str) -> bool:
+        """Unchanged source, and the outcome `pad` asks for: a short clip is skipped, or padded."""
+        r = rows.get(key)
+        if r is None or [r["src_size"], r["src_mtime_ns"]] != _sig(kept[key]):
+            return False
+        if r["status"] == "short":
+            return not spec.pad
+        padded = int(r["frames"]) < spec.frames
+        return r["status"] == "ok" and (folder / r["file"]).exists() and (spec.pad or not padded)
+
+    todo = [k for k in kept if not _done(k)]
+    rep.current = len(kept) - len(todo)
+    saved = time.monotonic()
+
+    def _one(key: str) -> tuple[str, int]:
+        out = folder / f"{key}.npy"
+        _ensure_dir(out.parent)
+        out.unlink(missing_ok=True)  # the clip changed: its old array must not outlive a failed export
+        return export_clip(kept[key], out, spec)
+
+    _, h, w, *c = spec.shape()
+    ex = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+    try:
+        futs = {instrument.submit(ex, _one, k): k for k in todo}
+        for fut in as_completed(futs):
+            key, err = futs[fut], None
+            try:
+                status, n = fut.result()
+            except (OSError, RuntimeError) as e:
+                status, n, err = "failed", 0, str(e)
+                rep.failed.append((key, err))
+            else:
+                rep.exported += status == "ok"
+                if status == "short":
+                    rep.short.append(key)
+            rows[key] = {"key": key, "file": f"{key}.npy", "frames": n, "height": h, "width": w,
+                         "channels": c[0] if c else 1, "fps": f"{spec.fps:g}", "status": status,
+                         "source": str(kept[key]), **dict(zip(("src_size", "src_mtime_ns"), _sig(kept[key]))),
+                         "error": err or ""}
+            if time.monotonic() - saved >= 2.0:  # a crash keeps what finished
+                _save_manifest(path, rows)
+                saved = time.monotonic()
+            if on_clip:
+                on_clip(key, err or (f"only {n} of {spec.frames} frames" if status == "short" else None))
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+        _save_manifest(path, rows)
+    return rep
@@ -0,0 +1,61 @@
+# tests/test_framediff.py
+import numpy as np
+import pytest
+
+from dataprep.framediff import FrameDiffDetector, rgb_to_luma
+
+COLOURS = [(200, 30, 30), (40, 220, 40), (20, 20, 90), (230, 230, 230)]  # neighbours differ in hue and luma
+
+def _stack(cuts, total=160, size=16, noise=0, seed=0):
+    """Flat-colour RGB segments changing at `cuts`, optionally with per-pixel noise."""
+    edges = [0, *cuts, total]
+    frames = np.empty((total, size, size, 3), dtype=np.uint8)
+    for k, (a, b) in enumerate(zip(edges, edges[1:])):
+        frames[a:b] = COLOURS[k % len(COLOURS)]
+    if noise:
+        rng = np.random.default_rng(seed)
+        frames = np.clip(frames.astype(np.int16) + rng.integers(-noise, noise + 1, frames.shape), 0, 255)
+    return frames.astype(np.uint8)
+
+def _gray(frames):
+    return rgb_to_luma(frames).round().astype(np.uint8)
+
+@pytest.mark.parametrize("metric", ["hsv", "luma", "hist"])
+def test_content_mode_finds_cuts(metric):
+    frames = _stack([40, 80, 120])
+    assert FrameDiffDetector(min_scene_len=15, metric=metric).detect([frames]) == [40, 80, 120]
+
+@pytest.mark.parametrize("metric", ["luma", "hist"])
+def test_gray_frames(metric):
+    frames = _gray(_stack([40, 80, 120]))
+    assert FrameDiffDetector(min_scene_len=15, metric=metric).detect([frames]) == [40, 80, 120]
+
+def test_hsv_needs_rgb():
+    with pytest.raises(ValueError):
+        FrameDiffDetector(metric="hsv").detect([_gray(_stack([40]))])
+
+def test_adaptive_mode_finds_cuts():
+    frames = _stack([40, 80, 120], noise=4)
+    det = FrameDiffDetector(min_scene_len=15, metric="luma", adaptive=True, min_content_val=10.0)
+    assert det.detect([frames]) == [40, 80, 120]
+
+def test_adaptive_ignores_steady_motion():
+    frames = _stack([], noise=40)  # large but uniform frame-to-frame change: no cut stands out
+    assert FrameDiffDetector(metric="luma", adaptive=True).detect([frames]) == []
+
+def test_min_scene_len_drops_close_cuts():
+    frames = _stack([40, 45, 120])
+    assert FrameDiffDetector(min_scene_len=15, metric="luma").detect([frames]) == [40, 120]
+    assert FrameDiffDetector(min_scene_len=3, metric="luma").detect([frames]) == [40, 45, 120]
+
+@pytest.mark.parametrize("adaptive", [False, True])
+@pytest.mark.parametrize("metric", ["hsv", "luma", "hist"])
+def test_batching_does_not_change_cuts(metric, adaptive):
+    frames = _stack([17, 40, 41, 80, 118, 150], total=200, noise=6, seed=1)
+    kw = dict(min_scene_len=5, metric=metric, adaptive=adaptive, min_content_val=10.0)
+    whole = FrameDiffDetector(**kw).detect([frames])
+    assert whole
+    for sizes in ([1] * 200, [7] * 29, [3, 50, 2, 64, 81]):
+        bounds = np.cumsum([0, *sizes])
+        batches = [frames[a:b] for a, b in zip(bounds, bounds[1:])]
+        assert FrameDiffDetector(**kw).detect(batches) == whole, sizes
@@ -0,0 +1,47 @@
+# tests/test_scenes.py
+from pathlib import Path
+
+import numpy as np
+
+from dataprep.core import write_scene_csv
+from dataprep.pipeline import Manifest, RunSettings, stage_plan
+from dataprep.scenes import load_scene_table
+
+FPS = 25.0
+
+def _scenes(tmp_path: Path) -> Path:
+    # 2 s, 0.4 s, 3 s, 12 s scenes
+    return write_scene_csv(tmp_path / "movie-Scenes.csv", [50, 60, 135], 435, FPS)
+
+def test_apply_config_trims_merges_and_splits(tmp_path):
+    t = load_scene_table(_scenes(tmp_path))
+    out = t.apply_config({"trim_seconds": {"head": 0.1, "tail": 0.1},
+                          "detect_content": {"min_scene_len": 25}, "max_scene_seconds": 5.0})
+    # trim: 1.8, 0.2, 2.8, 11.8 → merge < 1 s: 1.8, 0.2+2.8 (from 2.1 to 5.3, gap kept), 11.8 → split > 5 s: 3 × ~3.93
+    assert np.allclose(out.start, [0.1, 2.1, 5.5, 9.433, 13.367], atol=1e-3)
+    assert np.allclose(out.end, [1.9, 5.3, 9.433, 13.367, 17.3], atol=1e-3)
+    assert (out.length <= 5.0 + 1e-9).all()
+
+def test_apply_config_without_settings_is_identity(tmp_path):
+    t = load_scene_table(_scenes(tmp_path))
+    assert t.apply_config({}) is t
+    assert t.apply_config({"trim_seconds": {"head": 0.0, "tail": 0.0}, "max_scene_seconds": None}) is t
+
+def test_stage_plan_applies_scene_config(tmp_path):
+    csv_path = _scenes(tmp_path)
+    m = Manifest(tmp_path / "state.json")
+    s = RunSettings(mode="content")
+    src, log = tmp_path / "movie.mkv", lambda msg: None
+
+    assert stage_plan(src, csv_path, s, m, {}, False, log) == csv_path  # nothing to apply: cut the scenes as-is
+
+    cfg = {"trim_seconds": {"head": 0.5, "tail": 0.0}, "max_scene_seconds": 6.0}
+    plan = stage_plan(src, csv_path, s, m, cfg, False, log)
+    assert plan != csv_path
+    t = load_scene_table(plan)
+    assert np.allclose(t.start[:3], [0.5, 2.9, 5.9])  # the 0.4 s scene is trimmed away
+    assert len(t) == 4 and (t.length <= 6.0 + 1e-9).all()  # 11.5 s → 2 × 5.75 s
+
+    msgs = []
+    assert stage_plan(src, csv_path, s, m, cfg, False, msgs.append) == plan
+    assert msgs == ["plan: up to date"]
@@ -0,0 +1,53 @@
+# tests/test_split.py
+import shutil
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from dataprep.core import split_with_ffmpeg, split_with_ffmpeg_segment, split_with_mkvmerge, write_scene_csv
+from dataprep.normalize import NormalizeSettings, plan_clips
+from dataprep.pipeline import Manifest, RunSettings, stage_plan
+from dataprep.scenes import load_scene_table
+
+FPS = 25
+
+def _overlapping_plan(tmp_path: Path) -> Path:
+    """One 6 s scene tiled into 2 s windows every 1 s: 0-2, 1-3, 2-4, 3-5, 4-6."""
+    scenes = write_scene_csv(tmp_path / "src-Scenes.csv", [], 6 * FPS, FPS)
+    return plan_clips(scenes, NormalizeSettings(window_seconds=2.0, stride_seconds=1.0)).csv
+
+def test_plan_overlaps(tmp_path):
+    t = load_scene_table(_overlapping_plan(tmp_path))
+    assert np.allclose(t.start, [0, 1, 2, 3, 4]) and np.allclose(t.length, 2.0)
+    assert t.overlaps()
+    assert not load_scene_table(tmp_path / "src-Scenes.csv").overlaps()
+
+@pytest.mark.parametrize("split", [split_with_mkvmerge, lambda src, csv, out: split_with_ffmpeg_segment(src, csv, out)])
+def test_single_pass_engines_refuse_overlaps(tmp_path, split):
+    with pytest.raises(ValueError, match="overlapping"):
+        split(tmp_path / "src.mkv", _overlapping_plan(tmp_path), tmp_path / "clips")
+    assert not (tmp_path / "clips").exists()
+
+@pytest.mark.parametrize("engine", ["mkvmerge", "ffmpeg-segment"])
+def test_stage_plan_refuses_overlaps_for_single_pass_engines(tmp_path, engine):
+    scenes = write_scene_csv(tmp_path / "src-Scenes.csv", [], 6 * FPS, FPS)
+    cfg = {"normalize": {"window_seconds": 2.0, "stride_seconds": 1.0}}
+    s = RunSettings(engine=engine, normalize=True)
+    with pytest.raises(ValueError, match="stride_seconds"):
+        stage_plan(tmp_path / "src.mkv", scenes, s, Manifest(tmp_path / "state.json"), cfg, False, lambda msg: None)
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_ffmpeg_cuts_overlapping_windows(tmp_path):
+    src = tmp_path / "src.mkv"
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i",
+                    f"testsrc2=size=160x90:rate={FPS}", "-t", "6", "-c:v", "libx264", "-preset", "ultrafast",
+                    "-g", "1", str(src)], check=True)
+    results = split_with_ffmpeg(src, _overlapping_plan(tmp_path), tmp_path / "clips", copy=False, jobs=2)
+    assert [r.ok for r in results] == [True] * 5
+    for r in results:
+        n = subprocess.run(["ffmpeg", "-hide_banner", "-i", str(r.out), "-map", "0:v", "-f", "null", "-"],
+                           capture_output=True, text=True).stderr
+        frames = int(n.rsplit("frame=", 1)[1].split()[0])
+        assert abs(frames - 2 * FPS) <= 1, (r.out.name, frames)  # every window keeps its full length